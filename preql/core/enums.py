@@ -5,6 +5,11 @@ class StatementType(Enum):
     QUERY = "query"
 
 
+class GraphBackend(Enum):
+    NETWORKX = "networkx"
+    COMPACT = "compact"
+
+
 class Purpose(Enum):
     KEY = "key"
     PROPERTY = "property"
@@ -97,6 +102,16 @@ class FunctionClass(Enum):
     AGGREGATE_FUNCTIONS = [FunctionType.SUM, FunctionType.AVG, FunctionType.COUNT]
 
 
+# aggregates that can be computed again from partial aggregates at a finer
+# grain, mapped to the function that combines the partials
+DECOMPOSABLE_AGGREGATES = {
+    FunctionType.SUM: FunctionType.SUM,
+    FunctionType.COUNT: FunctionType.SUM,
+    FunctionType.MIN: FunctionType.MIN,
+    FunctionType.MAX: FunctionType.MAX,
+}
+
+
 class Boolean(Enum):
     TRUE = "true"
     FALSE = "false"
@@ -1,5 +1,17 @@
-from preql.core.graph_models import ReferenceGraph, concept_to_node, datasource_to_node
-from preql.core.models import Environment
+from dataclasses import dataclass
+from itertools import count
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+from preql.core.exceptions import UndefinedConceptException
+from preql.core.enums import GraphBackend
+from preql.core.graph_models import (
+    CompactGraph,
+    ReferenceGraph,
+    concept_to_node,
+    datasource_to_node,
+)
+from preql.core.models import Concept, Datasource, Environment
+from preql.core.processing.utility import concept_to_inputs
 
 
 def generate_graph(environment: Environment,) -> ReferenceGraph:
@@ -27,3 +39,308 @@ def generate_graph(environment: Environment,) -> ReferenceGraph:
             g.add_edge(concept, concept.with_default_grain())
 
     return g
+
+
+@dataclass
+class EnvironmentIndex:
+    """Structures derived from a frozen environment, built once up front."""
+
+    graph: ReferenceGraph
+    compact_graph: CompactGraph
+    # concept address -> datasources with a column for it, in environment order
+    concept_datasources: Dict[str, List[Datasource]]
+    # concept address -> root inputs of the concept lineage
+    lineage: Dict[str, List[Concept]]
+
+
+def validate_environment(environment: Environment):
+    """Check that every concept referenced by the model is defined."""
+    addresses = set(c.address for c in environment.concepts.values())
+    for key, concept in environment.concepts.items():
+        references = concept.grain.components + (concept.keys or [])
+        if concept.lineage:
+            references += [
+                x for x in concept.lineage.arguments if isinstance(x, Concept)
+            ]
+        for reference in references:
+            if reference.address not in addresses:
+                raise UndefinedConceptException(
+                    f"Concept {key} references undefined concept {reference.address}"
+                )
+    for key, datasource in environment.datasources.items():
+        columns = set(c.address for c in datasource.concepts)
+        for concept in datasource.concepts:
+            if concept.address not in addresses:
+                raise UndefinedConceptException(
+                    f"Datasource {key} maps undefined concept {concept.address}"
+                )
+        for component in datasource.grain.components:
+            if component.address not in columns:
+                raise UndefinedConceptException(
+                    f"Datasource {key} grain references {component.address}, which is not a column"
+                )
+
+
+def build_index(environment: Environment) -> EnvironmentIndex:
+    validate_environment(environment)
+    concept_datasources: Dict[str, List[Datasource]] = {}
+    for datasource in environment.datasources.values():
+        for column in datasource.columns:
+            exposing = concept_datasources.setdefault(column.concept.address, [])
+            if not exposing or exposing[-1] is not datasource:
+                exposing.append(datasource)
+    lineage: Dict[str, List[Concept]] = {}
+    for concept in environment.concepts.values():
+        lineage[concept.address] = concept_to_inputs(concept)
+    graph = generate_graph(environment)
+    return EnvironmentIndex(
+        graph=graph,
+        compact_graph=CompactGraph(graph),
+        concept_datasources=concept_datasources,
+        lineage=lineage,
+    )
+
+
+# ("node", name, explicit, attributes) or ("edge", source, target)
+Operation = Tuple[Any, ...]
+# (phase, position of the environment entry, position of the operation)
+Rank = Tuple[int, int, int]
+
+CONCEPT_PHASE = 0
+DATASOURCE_PHASE = 1
+
+
+def concept_attributes(concept: Concept) -> Dict[str, Any]:
+    return {"type": "concept", "concept": concept, "grain": concept.grain}
+
+
+def edge_operations(source, target) -> List[Operation]:
+    """The operations of ReferenceGraph.add_edge, which adds concept
+    endpoints that are not yet in the graph."""
+    output: List[Operation] = []
+    names = []
+    for item in (source, target):
+        if isinstance(item, Concept):
+            name = concept_to_node(item)
+            output.append(("node", name, False, concept_attributes(item)))
+        elif isinstance(item, Datasource):
+            name = datasource_to_node(item)
+        else:
+            name = item
+        names.append(name)
+    output.append(("edge", names[0], names[1]))
+    return output
+
+
+def concept_operations(concept: Concept) -> List[Operation]:
+    """What generate_graph does for a single concept."""
+    node = concept_to_node(concept)
+    output: List[Operation] = [("node", node, True, concept_attributes(concept))]
+    for source in concept.sources:
+        output += edge_operations(source.with_default_grain(), node)
+    return output
+
+
+def datasource_operations(datasource: Datasource) -> List[Operation]:
+    """What generate_graph does for a single datasource."""
+    node = datasource_to_node(datasource)
+    output: List[Operation] = [
+        (
+            "node",
+            node,
+            True,
+            {
+                "type": "datasource",
+                "datasource": datasource,
+                "ds": datasource,
+                "grain": datasource.grain,
+            },
+        )
+    ]
+    for concept in datasource.concepts:
+        output += edge_operations(node, concept)
+        output += edge_operations(concept, node)
+        output += edge_operations(concept, concept.with_default_grain())
+    return output
+
+
+class IncrementalGraph:
+    """A reference graph kept equal to generate_graph(environment) as
+    concepts and datasources are added, replaced or removed.
+
+    Every environment entry contributes the operations generate_graph runs
+    for it. Operations are ranked by the order generate_graph runs them in,
+    which follows dict order, so an entry keeps its rank when replaced. A
+    node or edge stays while any operation adds it; node attributes come
+    from the operation that would apply last, and adjacency is kept in the
+    order edges are first added, which shortest path ties depend on."""
+
+    def __init__(self, environment: Environment):
+        self.environment = environment
+        self.graph = ReferenceGraph()
+        self._compact_graph: Optional[CompactGraph] = None
+        self.version = environment.version
+        self.positions = count()
+        # (phase, key) -> position of the entry, operations
+        self.entries: Dict[Tuple[int, str], Tuple[int, List[Operation]]] = {}
+        # node -> rank -> (explicit, attributes), and the rank applied
+        self.node_ranks: Dict[str, Dict[Rank, Tuple[bool, Dict[str, Any]]]] = {}
+        self.node_source: Dict[str, Rank] = {}
+        # (source, target) -> ranks of the operations adding the edge
+        self.edge_ranks: Dict[Tuple[str, str], Set[Rank]] = {}
+        for key, concept in environment.concepts.items():
+            self.set_entry(CONCEPT_PHASE, key, concept_operations(concept))
+        for key, datasource in environment.datasources.items():
+            self.set_entry(DATASOURCE_PHASE, key, datasource_operations(datasource))
+        environment.concepts.add_listener(self.concept_changed)
+        environment.datasources.add_listener(self.datasource_changed)
+
+    def detach(self):
+        self.environment.concepts.remove_listener(self.concept_changed)
+        self.environment.datasources.remove_listener(self.datasource_changed)
+
+    def concept_changed(self, key: str, concept: Optional[Concept]):
+        operations = concept_operations(concept) if concept else None
+        self.set_entry(CONCEPT_PHASE, key, operations)
+        self.version = self.environment.concepts.version
+
+    def datasource_changed(self, key: str, datasource: Optional[Datasource]):
+        operations = datasource_operations(datasource) if datasource else None
+        self.set_entry(DATASOURCE_PHASE, key, operations)
+        self.version = self.environment.datasources.version
+
+    def set_entry(self, phase: int, key: str, operations: Optional[List[Operation]]):
+        """Add, replace (operations) or remove (None) an environment entry."""
+        self._compact_graph = None
+        reorder: Set[Tuple[str, str]] = set()
+        existing = self.entries.pop((phase, key), None)
+        if existing:
+            position = existing[0]
+            self.retract(phase, position, existing[1], reorder)
+        else:
+            position = next(self.positions)
+        if operations is not None:
+            self.entries[(phase, key)] = (position, operations)
+            self.apply(phase, position, operations, reorder)
+        for direction, node in reorder:
+            self.reorder(direction, node)
+
+    @property
+    def compact_graph(self) -> CompactGraph:
+        if self._compact_graph is None:
+            self._compact_graph = CompactGraph(self.graph)
+        return self._compact_graph
+
+    def edge_rank(self, source: str, target: str) -> Rank:
+        return min(self.edge_ranks[(source, target)])
+
+    def apply(self, phase, position, operations, reorder):
+        for idx, operation in enumerate(operations):
+            rank = (phase, position, idx)
+            if operation[0] == "node":
+                self.add_node(operation[1], rank, operation[2], operation[3])
+                continue
+            _, source, target = operation
+            ranks = self.edge_ranks.get((source, target))
+            if ranks:
+                if rank < min(ranks):
+                    reorder.update({("succ", source), ("pred", target)})
+                ranks.add(rank)
+                continue
+            # appending keeps adjacency ordered unless the edge
+            # ranks before the current last one
+            last_target = next(reversed(self.graph._succ[source]), None)
+            last_source = next(reversed(self.graph._pred[target]), None)
+            if last_target and self.edge_rank(source, last_target) > rank:
+                reorder.add(("succ", source))
+            if last_source and self.edge_rank(last_source, target) > rank:
+                reorder.add(("pred", target))
+            self.edge_ranks[(source, target)] = {rank}
+            self.graph.add_edge(source, target)
+
+    def retract(self, phase, position, operations, reorder):
+        # edges first, so nodes are only dropped once unconnected
+        ordered = [x for x in enumerate(operations) if x[1][0] == "edge"] + [
+            x for x in enumerate(operations) if x[1][0] == "node"
+        ]
+        for idx, operation in ordered:
+            rank = (phase, position, idx)
+            if operation[0] == "node":
+                self.remove_node(operation[1], rank)
+                continue
+            _, source, target = operation
+            ranks = self.edge_ranks[(source, target)]
+            first = min(ranks)
+            ranks.discard(rank)
+            if not ranks:
+                del self.edge_ranks[(source, target)]
+                self.graph.remove_edge(source, target)
+            elif rank == first:
+                reorder.update({("succ", source), ("pred", target)})
+
+    def add_node(self, node: str, rank: Rank, explicit: bool, attributes):
+        ranks = self.node_ranks.setdefault(node, {})
+        ranks[rank] = (explicit, attributes)
+        if node not in self.graph:
+            self.graph.add_node(node, **attributes)
+            self.node_source[node] = rank
+            return
+        current = self.node_source[node]
+        # an implicit add only applies to a node not yet in the graph
+        if ranks[current][0]:
+            replace = explicit and rank > current
+        else:
+            replace = explicit or rank < current
+        if replace:
+            self.set_node_source(node, rank)
+
+    def remove_node(self, node: str, rank: Rank):
+        ranks = self.node_ranks[node]
+        del ranks[rank]
+        if not ranks:
+            del self.node_ranks[node]
+            del self.node_source[node]
+            self.graph.remove_node(node)
+        elif self.node_source[node] == rank:
+            explicit = [r for r, (flag, _) in ranks.items() if flag]
+            self.set_node_source(node, max(explicit) if explicit else min(ranks))
+
+    def set_node_source(self, node: str, rank: Rank):
+        self.node_source[node] = rank
+        attributes = self.graph.nodes[node]
+        attributes.clear()
+        attributes.update(self.node_ranks[node][rank][1])
+
+    def reorder(self, direction: str, node: str):
+        if node not in self.graph:
+            return
+        # the adjacency dicts are reordered in place; networkx iterates
+        # them in insertion order
+        if direction == "succ":
+            adjacency = self.graph._succ[node]
+            key = lambda other: self.edge_rank(node, other)
+        else:
+            adjacency = self.graph._pred[node]
+            key = lambda other: self.edge_rank(other, node)
+        items = sorted(adjacency.items(), key=lambda item: key(item[0]))
+        adjacency.clear()
+        adjacency.update(items)
+
+
+def get_graph(environment: Environment) -> Union[ReferenceGraph, CompactGraph]:
+    """The planning graph in the environment's backend: the one built when
+    the environment was frozen, or one kept up to date with its changes."""
+    source: Union[EnvironmentIndex, IncrementalGraph]
+    if environment.index:
+        source = environment.index
+    else:
+        cache = environment.graph_cache
+        if not cache or cache.version != environment.version:
+            if cache:
+                cache.detach()
+            cache = IncrementalGraph(environment)
+            environment.graph_cache = cache
+        source = cache
+    if environment.graph_backend == GraphBackend.NETWORKX:
+        return source.graph
+    return source.compact_graph
@@ -1,6 +1,36 @@
+from typing import List
+
+
 class UndefinedConceptException(Exception):
     pass
 
 
 class InvalidSyntaxException(Exception):
     pass
+
+
+class FrozenEnvironmentException(Exception):
+    pass
+
+
+class PlanningBudgetExceeded(Exception):
+    """Planning a query ran past its time or strategy attempt budget.
+    Carries the strategies attempted, in order, as "strategy: concept"
+    strings, and the concepts already resolved when planning stopped."""
+
+    def __init__(
+        self, reason: str, attempts: List[str], resolved: List[str], elapsed: float
+    ):
+        self.reason = reason
+        self.attempts = attempts
+        self.resolved = resolved
+        self.elapsed = elapsed
+        recent = "; ".join(attempts[-10:])
+        super().__init__(
+            f"Planning stopped after {len(attempts)} strategy attempts in "
+            f"{elapsed:.2f}s: {reason}. Last attempts: {recent}"
+        )
+
+    def __reduce__(self):
+        # raised in planning worker processes and pickled back to the caller
+        return type(self), (self.reason, self.attempts, self.resolved, self.elapsed)
@@ -1,4 +1,5 @@
-from typing import Union
+from array import array
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Union
 
 import networkx as nx
 
@@ -19,6 +20,75 @@ def datasource_to_node(input: Union[Datasource, JoinedDataSource]) -> str:
     return f"ds~{input.namespace}.{input.identifier}"
 
 
+def cheapest_source(
+    sources: List[Hashable],
+    targets: List[Hashable],
+    predecessors: Callable[[Hashable], Iterable[Hashable]],
+) -> Optional[int]:
+    """Position of the source whose shortest paths to all targets have the
+    fewest nodes in total, the earliest on ties; None if no source reaches
+    every target.
+
+    Searches breadth first backwards from every target, one level at a time
+    for all of them, so distances are found for every source at once. Paths
+    still to be found are longer than any found so far, which bounds the
+    cost of every incomplete source; the search stops once none of them can
+    beat the best complete one."""
+    first: Dict[Hashable, int] = {}
+    for idx, source in enumerate(sources):
+        first.setdefault(source, idx)
+    targets = list(dict.fromkeys(targets))
+    if not first or not targets:
+        return 0 if first else None
+    complete = (1 << len(targets)) - 1
+    # source -> bitmask of targets found, total nodes on those paths
+    reached: Dict[Hashable, int] = {}
+    cost: Dict[Hashable, int] = {}
+    best: Optional[Hashable] = None
+    seen = [{target} for target in targets]
+    fringes = [[target] for target in targets]
+    level = 0
+    while any(fringes):
+        level += 1
+        for idx, fringe in enumerate(fringes):
+            next_fringe = []
+            for v in fringe:
+                for w in predecessors(v):
+                    if w in seen[idx]:
+                        continue
+                    seen[idx].add(w)
+                    next_fringe.append(w)
+                    if w not in first:
+                        continue
+                    reached[w] = reached.get(w, 0) | 1 << idx
+                    # a path of `level` edges has level + 1 nodes
+                    cost[w] = cost.get(w, 0) + level + 1
+                    if reached[w] == complete and (
+                        best is None or (cost[w], first[w]) < (cost[best], first[best])
+                    ):
+                        best = w
+            fringes[idx] = next_fringe
+        if best is None:
+            continue
+        searching = 0
+        for idx, fringe in enumerate(fringes):
+            if fringe:
+                searching |= 1 << idx
+        # every remaining path has at least level + 1 edges
+        remaining = level + 2
+        bounds = [
+            cost[w] + bin(complete & ~mask).count("1") * remaining
+            for w, mask in reached.items()
+            # skip sources that are complete, or missing a finished target
+            if mask != complete and not complete & ~mask & ~searching
+        ]
+        if len(reached) < len(first) and searching == complete:
+            bounds.append(len(targets) * remaining)
+        if not bounds or cost[best] < min(bounds):
+            break
+    return None if best is None else first[best]
+
+
 def node_to_datasource(input: str, environment: Environment) -> Datasource:
     stripped = input.lstrip("ds~")
     namespace, title = stripped.split(".")
@@ -75,3 +145,238 @@ class ReferenceGraph(nx.DiGraph):
         elif isinstance(v_of_edge, JoinedDataSource):
             v_of_edge = datasource_to_node(v_of_edge)
         super().add_edge(u_of_edge, v_of_edge, **attr)
+
+    def shortest_path(self, source: str, target: str) -> List[str]:
+        return nx.shortest_path(self, source=source, target=target)
+
+    def count_datasources(self, path: List[str]) -> int:
+        return len([p for p in path if self.nodes[p]["type"] == "datasource"])
+
+    def cheapest_source(self, sources: List[str], targets: List[str]) -> Optional[int]:
+        if any(target not in self for target in targets):
+            return None
+        return cheapest_source(sources, targets, self.predecessors)
+
+    def concept_nodes(self, address: str) -> List[Concept]:
+        """Every concept node for an address, one per grain, in node order."""
+        return [
+            attributes["concept"]
+            for attributes in self._node.values()
+            if attributes.get("type") == "concept"
+            and attributes["concept"].address == address
+        ]
+
+    def covers(self, source: str, targets: List[str]) -> bool:
+        """Whether the shortest path from the source datasource to each
+        target crosses no other datasource. A missing target raises
+        NodeNotFound unless an earlier target is not covered."""
+        for target in targets:
+            try:
+                path = self.shortest_path(source, target)
+            except nx.NetworkXNoPath:
+                return False
+            if self.count_datasources(path) != 1:
+                return False
+        return True
+
+
+NODE_KINDS = {"concept": 0, "datasource": 1, "joineddatasource": 2}
+
+
+class CompactGraph:
+    """A read-only, integer indexed copy of a ReferenceGraph for planning.
+
+    Adjacency is stored CSR-style: the successors of node i are
+    succ_targets[succ_offsets[i]:succ_offsets[i + 1]], kept in the order
+    of the source graph so paths, and their tie-breaks, match networkx.
+    Node kinds are held in a parallel array."""
+
+    def __init__(self, reference: ReferenceGraph):
+        self.names: List[str] = list(reference.nodes)
+        self.ids: Dict[str, int] = {name: idx for idx, name in enumerate(self.names)}
+        # copied, as the reference graph may keep changing
+        self.nodes: Dict[str, Dict] = {
+            name: dict(attributes) for name, attributes in reference.nodes.items()
+        }
+        self.kinds = array(
+            "b", [NODE_KINDS[self.nodes[name]["type"]] for name in self.names]
+        )
+        self.succ_offsets, self.succ_targets = self._compress(reference.succ)
+        self.pred_offsets, self.pred_targets = self._compress(reference.pred)
+        # datasource id -> bitsets of node ids, filled in on first use:
+        # columns, reachable without entering another datasource, and
+        # targets whose shortest path has been checked / found direct
+        self.columns: Dict[int, int] = {}
+        self.reachable: Dict[int, int] = {}
+        self.checked: Dict[int, int] = {}
+        self.direct: Dict[int, int] = {}
+        # concept address -> concept nodes, filled in on first use
+        self.concepts_by_address: Optional[Dict[str, List[Concept]]] = None
+
+    def _compress(self, adjacency):
+        offsets = array("i", [0])
+        targets = array("i")
+        for name in self.names:
+            targets.extend(self.ids[other] for other in adjacency[name])
+            offsets.append(len(targets))
+        return offsets, targets
+
+    def __contains__(self, node: str) -> bool:
+        return node in self.ids
+
+    def predecessors(self, node: str) -> Iterator[str]:
+        idx = self.ids[node]
+        start, end = self.pred_offsets[idx], self.pred_offsets[idx + 1]
+        for other in self.pred_targets[start:end]:
+            yield self.names[other]
+
+    def shortest_path(self, source: str, target: str) -> List[str]:
+        """Same path as nx.shortest_path on the reference graph."""
+        if source not in self.ids:
+            raise nx.NodeNotFound(f"Source {source} is not in G")
+        if target not in self.ids:
+            raise nx.NodeNotFound(f"Target {target} is not in G")
+        path = self.shortest_path_ids(self.ids[source], self.ids[target])
+        if path is None:
+            raise nx.NetworkXNoPath(f"No path between {source} and {target}.")
+        return [self.names[idx] for idx in path]
+
+    def shortest_path_ids(self, source: int, target: int):
+        # networkx's bidirectional breadth first search, on integer ids
+        if source == target:
+            return [source]
+        succ_offsets, succ_targets = self.succ_offsets, self.succ_targets
+        pred_offsets, pred_targets = self.pred_offsets, self.pred_targets
+        # predecessors found searching forward, successors searching back
+        pred = {source: -1}
+        succ = {target: -1}
+        forward_fringe = [source]
+        reverse_fringe = [target]
+        while forward_fringe and reverse_fringe:
+            if len(forward_fringe) <= len(reverse_fringe):
+                this_level = forward_fringe
+                forward_fringe = []
+                for v in this_level:
+                    for w in succ_targets[succ_offsets[v] : succ_offsets[v + 1]]:
+                        if w not in pred:
+                            forward_fringe.append(w)
+                            pred[w] = v
+                        if w in succ:
+                            return self._join(pred, succ, w)
+            else:
+                this_level = reverse_fringe
+                reverse_fringe = []
+                for v in this_level:
+                    for w in pred_targets[pred_offsets[v] : pred_offsets[v + 1]]:
+                        if w not in succ:
+                            succ[w] = v
+                            reverse_fringe.append(w)
+                        if w in pred:
+                            return self._join(pred, succ, w)
+        return None
+
+    @staticmethod
+    def _join(pred: Dict[int, int], succ: Dict[int, int], meeting: int) -> List[int]:
+        path = []
+        node = meeting
+        while node != -1:
+            path.append(node)
+            node = pred[node]
+        path.reverse()
+        node = succ[path[-1]]
+        while node != -1:
+            path.append(node)
+            node = succ[node]
+        return path
+
+    def count_datasources(self, path: List[str]) -> int:
+        datasource = NODE_KINDS["datasource"]
+        return len([p for p in path if self.kinds[self.ids[p]] == datasource])
+
+    def cheapest_source(self, sources: List[str], targets: List[str]) -> Optional[int]:
+        """See cheapest_source; searches on integer ids."""
+        if any(target not in self.ids for target in targets):
+            return None
+        offsets, pred_targets = self.pred_offsets, self.pred_targets
+        return cheapest_source(
+            [self.ids.get(source, -1) for source in sources],
+            [self.ids[target] for target in targets],
+            lambda idx: pred_targets[offsets[idx] : offsets[idx + 1]],
+        )
+
+    def concept_nodes(self, address: str) -> List[Concept]:
+        """Every concept node for an address, one per grain, in node order."""
+        if self.concepts_by_address is None:
+            concepts_by_address: Dict[str, List[Concept]] = {}
+            for name in self.names:
+                concept = self.nodes[name].get("concept")
+                if concept is not None and self.nodes[name]["type"] == "concept":
+                    found = concepts_by_address.setdefault(concept.address, [])
+                    found.append(concept)
+            self.concepts_by_address = concepts_by_address
+        return list(self.concepts_by_address.get(address, []))
+
+    def _coverage(self, source: int):
+        datasource = NODE_KINDS["datasource"]
+        start, end = self.succ_offsets[source], self.succ_offsets[source + 1]
+        columns = 0
+        for idx in self.succ_targets[start:end]:
+            columns |= 1 << idx
+        reachable = 1 << source
+        fringe = [source]
+        while fringe:
+            this_level = fringe
+            fringe = []
+            for v in this_level:
+                start, end = self.succ_offsets[v], self.succ_offsets[v + 1]
+                for w in self.succ_targets[start:end]:
+                    if reachable >> w & 1 or self.kinds[w] == datasource:
+                        continue
+                    reachable |= 1 << w
+                    fringe.append(w)
+        self.columns[source] = columns
+        self.reachable[source] = reachable
+        self.checked[source] = 0
+        self.direct[source] = 0
+
+    def covers(self, source: str, targets: List[str]) -> bool:
+        """Whether the shortest path from the source datasource to each
+        target crosses no other datasource. A missing target raises
+        NodeNotFound unless an earlier target is not covered.
+
+        A column of the datasource is always covered, and a target it cannot
+        reach without entering another datasource never is. Other targets
+        may tie with a path through another datasource, so the path search
+        decides, once per pair."""
+        if source not in self.ids:
+            raise nx.NodeNotFound(f"Source {source} is not in G")
+        source_id = self.ids[source]
+        if source_id not in self.columns:
+            self._coverage(source_id)
+        target_ids = [self.ids.get(target) for target in targets]
+        if None not in target_ids:
+            mask = 0
+            for idx in target_ids:
+                mask |= 1 << idx
+            if not mask & ~(self.columns[source_id] | self.direct[source_id]):
+                return True
+        for target, idx in zip(targets, target_ids):
+            if idx is None:
+                raise nx.NodeNotFound(f"Target {target} is not in G")
+            bit = 1 << idx
+            if self.columns[source_id] & bit:
+                continue
+            if not self.reachable[source_id] & bit:
+                return False
+            if not self.checked[source_id] & bit:
+                path = self.shortest_path_ids(source_id, idx)
+                self.checked[source_id] |= bit
+                if path and self.count_datasource_ids(path) == 1:
+                    self.direct[source_id] |= bit
+            if not self.direct[source_id] & bit:
+                return False
+        return True
+
+    def count_datasource_ids(self, path: List[int]) -> int:
+        datasource = NODE_KINDS["datasource"]
+        return len([idx for idx in path if self.kinds[idx] == datasource])
@@ -1,10 +1,24 @@
 import os
-from copy import deepcopy
+from copy import copy, deepcopy
+from itertools import count
 from dataclasses import dataclass, field
-from typing import Dict, MutableMapping, TypeVar, List, Optional, Union, Set
-from pydantic import BaseModel, validator, Field
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    MutableMapping,
+    TypeVar,
+    List,
+    Optional,
+    Union,
+    Set,
+    Tuple,
+    TYPE_CHECKING,
+)
+from pydantic import BaseModel, PrivateAttr, validator, Field
 
 from preql.core.enums import (
+    GraphBackend,
     DataType,
     Purpose,
     JoinType,
@@ -17,8 +31,14 @@ from preql.core.enums import (
     WindowOrder,
     PurposeLineage,
 )
-from preql.core.exceptions import UndefinedConceptException
-from preql.utility import unique
+from preql.core.exceptions import (
+    UndefinedConceptException,
+    FrozenEnvironmentException,
+)
+from preql.utility import string_to_hash, unique
+
+if TYPE_CHECKING:
+    from preql.core.env_processor import EnvironmentIndex, IncrementalGraph
 
 KT = TypeVar("KT")
 VT = TypeVar("VT")
@@ -28,6 +48,17 @@ class Metadata(BaseModel):
     pass
 
 
+class NamespaceMemo(dict):
+    """A with_namespace memo that moves only the nodes in the source
+    namespace, as when binding a parsed module under another alias; nodes
+    the module imported from other modules keep their own namespace, though
+    what they reference is rebound."""
+
+    def __init__(self, source: str):
+        super().__init__()
+        self.source = source
+
+
 class Concept(BaseModel):
     name: str
     datatype: DataType
@@ -37,6 +68,20 @@ class Concept(BaseModel):
     namespace: str = ""
     keys: Optional[List["Concept"]] = None
     grain: "Grain" = Field(default=None)
+    # set when an environment holding the concept is frozen; copies are not
+    _frozen: bool = PrivateAttr(default=False)
+
+    def __setattr__(self, name, value):
+        if self._frozen:
+            raise FrozenEnvironmentException(
+                f"Concept {self.address} is frozen, cannot set {name}"
+            )
+        super().__setattr__(name, value)
+
+    def copy(self, **kwargs) -> "Concept":
+        output = super().copy(**kwargs)
+        object.__setattr__(output, "_frozen", False)
+        return output
 
     @validator("lineage")
     def lineage_validator(cls, v):
@@ -55,17 +100,44 @@ class Concept(BaseModel):
             return "default"
         return v
 
-    def with_namespace(self, namespace: str) -> "Concept":
-        return self.__class__(
-            name=self.name,
-            datatype=self.datatype,
-            purpose=self.purpose,
-            metadata=self.metadata,
-            lineage=self.lineage.with_namespace(namespace) if self.lineage else None,
-            grain=self.grain.with_namespace(namespace),
-            namespace=namespace,
-            keys=self.keys,
+    def with_namespace(
+        self, namespace: str, memo: Optional[Dict[int, Any]] = None
+    ) -> "Concept":
+        # the rewrite shares every node that is already in the namespace and
+        # skips validation, as the source tree was validated when built;
+        # memo maps ids of rewritten nodes so shared subtrees are visited once
+        memo = {} if memo is None else memo
+        if id(self) in memo:
+            return memo[id(self)]
+        namespace = namespace or "default"
+        own = namespace
+        if isinstance(memo, NamespaceMemo) and self.namespace != memo.source:
+            own = self.namespace
+        lineage = self.lineage.with_namespace(namespace, memo) if self.lineage else None
+        grain = self.grain.with_namespace(namespace, memo)
+        keys = (
+            [key.with_namespace(namespace, memo) for key in self.keys]
+            if self.keys
+            else self.keys
         )
+        if (
+            own == self.namespace
+            and lineage is self.lineage
+            and grain is self.grain
+            and all(new is old for new, old in zip(keys or [], self.keys or []))
+        ):
+            output = self
+        else:
+            output = self.copy(
+                update={
+                    "namespace": own,
+                    "lineage": lineage,
+                    "grain": grain,
+                    "keys": keys,
+                }
+            )
+        memo[id(self)] = output
+        return output
 
     @validator("grain", pre=True, always=True)
     def parse_grain(cls, v, values):
@@ -190,15 +262,15 @@ class ColumnAssignment:
     def is_complete(self):
         return Modifier.PARTIAL not in self.modifiers
 
-    def with_namespace(self, namespace: str) -> "ColumnAssignment":
-        # this breaks assignments
-        # TODO: figure out why
-        return self
-        # return ColumnAssignment(
-        #     alias=self.alias,
-        #     concept=self.concept.with_namespace(namespace),
-        #     modifiers=self.modifiers,
-        # )
+    def with_namespace(
+        self, namespace: str, memo: Optional[Dict[int, Any]] = None
+    ) -> "ColumnAssignment":
+        concept = self.concept.with_namespace(namespace, memo)
+        if concept is self.concept:
+            return self
+        return ColumnAssignment(
+            alias=self.alias, concept=concept, modifiers=self.modifiers
+        )
 
 
 @dataclass(eq=True, frozen=True)
@@ -255,17 +327,20 @@ class Function:
                         f"Invalid {dtype} constant passed into {self.operator.name} {arg}"
                     )
 
-    def with_namespace(self, namespace: str) -> "Function":
-        return Function(
-            operator=self.operator,
-            arguments=[
-                c.with_namespace(namespace) if isinstance(c, Concept) else c
-                for c in self.arguments
-            ],
-            output_datatype=self.output_datatype,
-            output_purpose=self.output_purpose,
-            valid_inputs=self.valid_inputs,
-        )
+    def with_namespace(
+        self, namespace: str, memo: Optional[Dict[int, Any]] = None
+    ) -> "Function":
+        memo = {} if memo is None else memo
+        arguments = [
+            c.with_namespace(namespace, memo) if isinstance(c, Concept) else c
+            for c in self.arguments
+        ]
+        if all(new is old for new, old in zip(arguments, self.arguments)):
+            return self
+        # argument datatypes are unchanged, so skip __post_init__ validation
+        output = copy(self)
+        object.__setattr__(output, "arguments", arguments)
+        return output
 
 
 @dataclass(eq=True)
@@ -291,11 +366,17 @@ class WindowItem(BaseModel):
     content: Concept
     order_by: List["OrderItem"]
 
-    def with_namespace(self, namespace: str) -> "WindowItem":
-        return WindowItem(
-            content=self.content.with_namespace(namespace),
-            order_by=[x.with_namespace(self.namespace) for x in self.order_by],
-        )
+    def with_namespace(
+        self, namespace: str, memo: Optional[Dict[int, Any]] = None
+    ) -> "WindowItem":
+        memo = {} if memo is None else memo
+        content = self.content.with_namespace(namespace, memo)
+        order_by = [x.with_namespace(namespace, memo) for x in self.order_by]
+        if content is self.content and all(
+            new is old for new, old in zip(order_by, self.order_by)
+        ):
+            return self
+        return self.copy(update={"content": content, "order_by": order_by})
 
     @property
     def arguments(self) -> List[Concept]:
@@ -352,8 +433,13 @@ class OrderItem:
     expr: Concept
     order: Ordering
 
-    def with_namespace(self, namespace: str) -> "OrderItem":
-        return OrderItem(expr=self.expr.with_namespace(namespace), order=self.order)
+    def with_namespace(
+        self, namespace: str, memo: Optional[Dict[int, Any]] = None
+    ) -> "OrderItem":
+        expr = self.expr.with_namespace(namespace, memo)
+        if expr is self.expr:
+            return self
+        return OrderItem(expr=expr, order=self.order)
 
     @property
     def input(self):
@@ -452,6 +538,23 @@ class Query:
     text: str
 
 
+@dataclass(eq=True, frozen=True)
+class Partition:
+    """One address of a partitioned datasource, holding the rows whose
+    partition concept falls between start and end, inclusive."""
+
+    address: Address
+    start: Any
+    end: Any
+
+
+def union_location(addresses: List[Address]) -> str:
+    if len(addresses) == 1:
+        return addresses[0].location
+    selects = " UNION ALL ".join(f"SELECT * FROM {a.location}" for a in addresses)
+    return f"({selects})"
+
+
 class Grain(BaseModel):
     components: List[Concept] = Field(default_factory=list)
     nested: bool = False
@@ -468,12 +571,15 @@ class Grain(BaseModel):
             return "Grain<Abstract>"
         return "Grain<" + ",".join([c.address for c in self.components]) + ">"
 
-    def with_namespace(self, namespace: str) -> "Grain":
-
-        return Grain(
-            components=[c.with_namespace(namespace) for c in self.components],
-            nested=self.nested,
-        )
+    def with_namespace(
+        self, namespace: str, memo: Optional[Dict[int, Any]] = None
+    ) -> "Grain":
+        memo = {} if memo is None else memo
+        components = [c.with_namespace(namespace, memo) for c in self.components]
+        if all(new is old for new, old in zip(components, self.components)):
+            return self
+        # components already carry their default grain
+        return Grain.construct(components=components, nested=self.nested)
 
     @property
     def abstract(self):
@@ -528,6 +634,23 @@ class GrainWindow:
         )
 
 
+@dataclass
+class DatasourceStatistics:
+    """Optional sizing information for a datasource, used to estimate costs.
+    Distinct counts, unique columns and [min, max] ranges (ISO strings for
+    dates) are keyed by column alias."""
+
+    row_count: int
+    distinct_counts: Dict[str, int] = field(default_factory=dict)
+    unique_columns: List[str] = field(default_factory=list)
+    ranges: Dict[str, List[Any]] = field(default_factory=dict)
+
+    def distinct(self, alias: str) -> Optional[int]:
+        if alias in self.unique_columns:
+            return self.row_count
+        return self.distinct_counts.get(alias)
+
+
 @dataclass
 class Datasource:
     identifier: str
@@ -535,6 +658,19 @@ class Datasource:
     address: Union[Address, str]
     grain: Grain = field(default_factory=lambda: Grain(components=[]))
     namespace: Optional[str] = ""
+    statistics: Optional[DatasourceStatistics] = field(default=None, compare=False)
+    # the rows are split across partition addresses by this concept
+    partition_by: Optional[Concept] = None
+    partitions: List[Partition] = field(default_factory=list)
+    # set when an environment holding the datasource is frozen
+    _frozen = False
+
+    def __setattr__(self, name, value):
+        if self._frozen:
+            raise FrozenEnvironmentException(
+                f"Datasource {self.identifier} is frozen, cannot set {name}"
+            )
+        object.__setattr__(self, name, value)
 
     def __add__(self, other):
         if not other == self:
@@ -562,13 +698,22 @@ class Datasource:
         if not self.namespace:
             self.namespace = ""
 
-    def with_namespace(self, namespace: str):
+    def with_namespace(self, namespace: str, memo: Optional[Dict[int, Any]] = None):
+        memo = {} if memo is None else memo
+        own = namespace
+        if isinstance(memo, NamespaceMemo) and self.namespace != memo.source:
+            own = self.namespace or ""
         return Datasource(
             identifier=self.identifier,
-            namespace=namespace,
-            grain=self.grain.with_namespace(namespace),
+            namespace=own,
+            grain=self.grain.with_namespace(namespace, memo),
             address=self.address,
-            columns=[c.with_namespace(namespace) for c in self.columns],
+            columns=[c.with_namespace(namespace, memo) for c in self.columns],
+            statistics=self.statistics,
+            partition_by=self.partition_by.with_namespace(namespace, memo)
+            if self.partition_by
+            else None,
+            partitions=self.partitions,
         )
 
     @property
@@ -879,6 +1024,106 @@ def merge_ctes(ctes: List[CTE]) -> List[CTE]:
     return final_ctes
 
 
+def cte_structure(
+    cte: CTE, ctes: Dict[str, CTE], memo: Dict[str, int], seen: Set[str]
+) -> int:
+    """A fingerprint of what a CTE computes rows from: its datasources or
+    parent CTEs, how those are joined, its grain and grouping, and the columns
+    it filters on. Output columns that do not change the grouping are left
+    out, so CTEs that differ only in those share a fingerprint."""
+    if cte.name in memo:
+        return memo[cte.name]
+    if cte.name in seen:
+        # not expected; a cycle is never equivalent to anything else
+        return string_to_hash(cte.name)
+    seen.add(cte.name)
+
+    def parent(item: CTE) -> int:
+        return cte_structure(ctes.get(item.name, item), ctes, memo, seen)
+
+    if cte.joins:
+        base = [parent(cte.joins[0].left_cte)]
+    elif cte.parent_ctes:
+        base = [parent(cte.parent_ctes[0])]
+    else:
+        base = sorted(
+            d.safe_location for d in cte.source.datasources if isinstance(d, Datasource)
+        )
+    grouping = (
+        sorted(
+            c.address
+            for c in cte.output_columns
+            if c.purpose == Purpose.PROPERTY and c not in cte.grain.components
+        )
+        if cte.group_to_grain
+        else []
+    )
+    structure = (
+        base,
+        sorted(parent(p) for p in cte.parent_ctes),
+        sorted(
+            (
+                parent(j.left_cte),
+                parent(j.right_cte),
+                j.jointype.value,
+                sorted(k.concept.address for k in j.joinkeys),
+            )
+            for j in cte.joins
+        ),
+        sorted(c.address for c in cte.grain.components),
+        cte.group_to_grain,
+        grouping,
+        sorted(c.address for c in cte.filter_columns),
+    )
+    memo[cte.name] = string_to_hash(repr(structure))
+    return memo[cte.name]
+
+
+def unify_ctes(ctes: List[CTE]) -> List[CTE]:
+    """Merge CTEs that compute the same rows under different names, keeping
+    the first and pointing every reference to the others at it. Two CTEs only
+    merge when each column they share is read from the same source."""
+    by_name = {cte.name: cte for cte in ctes}
+    memo: Dict[str, int] = {}
+    kept: Dict[int, CTE] = {}
+    renames: Dict[str, str] = {}
+    output: List[CTE] = []
+
+    def sources(cte: CTE) -> Dict[str, str]:
+        return {k: renames.get(v, v) for k, v in cte.source_map.items()}
+
+    # parents come before the CTEs reading from them
+    for cte in ctes:
+        structure = cte_structure(cte, by_name, memo, set())
+        existing = kept.get(structure)
+        if existing is not None:
+            left, right = sources(existing), sources(cte)
+            if all(left[k] == right[k] for k in left.keys() & right.keys()):
+                renames[cte.name] = existing.name
+                existing += cte
+                continue
+        kept.setdefault(structure, cte)
+        output.append(cte)
+    if not renames:
+        return output
+    final = {cte.name: cte for cte in output}
+    for cte in output:
+        cte.source_map = sources(cte)
+        cte.parent_ctes = unique(
+            [final.get(renames.get(p.name, p.name), p) for p in cte.parent_ctes],
+            "name",
+        )
+        for join in cte.joins:
+            join.left_cte = final.get(
+                renames.get(join.left_cte.name, join.left_cte.name), join.left_cte
+            )
+            join.right_cte = final.get(
+                renames.get(join.right_cte.name, join.right_cte.name), join.right_cte
+            )
+        cte.joins = unique(cte.joins, "unique_id")
+    return output
+
+
 @dataclass
 class CompiledCTE:
     name: str
@@ -908,7 +1153,109 @@ class Join:
         return f'{self.jointype.value} JOIN {self.left_cte.name} and {self.right_cte.name} on {",".join([str(k) for k in self.joinkeys])}'
 
 
-class EnvironmentConceptDict(dict, MutableMapping[KT, VT]):
+# shared by all environment dicts, so a new or changed dict always
+# carries a higher version than anything stamped before it
+_versions = count(1)
+
+
+class EnvironmentDict(dict):
+    """A dict that stamps a new version on every change, tells listeners
+    about it, and rejects changes once its environment is frozen.
+    Every change goes through __setitem__ or __delitem__."""
+
+    frozen = False
+    version = 0
+    # called with (key, new value or None) after each change
+    listeners: Tuple[Callable[[str, Optional[Any]], None], ...] = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = next(_versions)
+
+    def add_listener(self, listener: Callable[[str, Optional[Any]], None]):
+        self.listeners = self.listeners + (listener,)
+
+    def remove_listener(self, listener: Callable[[str, Optional[Any]], None]):
+        self.listeners = tuple(x for x in self.listeners if x != listener)
+
+    def check_mutable(self):
+        if self.frozen:
+            raise FrozenEnvironmentException(
+                "Environment is frozen and cannot be modified"
+            )
+
+    def __setitem__(self, key, value):
+        self.check_mutable()
+        super().__setitem__(key, value)
+        self.version = next(_versions)
+        for listener in self.listeners:
+            listener(key, value)
+
+    def __delitem__(self, key):
+        self.check_mutable()
+        super().__delitem__(key)
+        self.version = next(_versions)
+        for listener in self.listeners:
+            listener(key, None)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def pop(self, key, *default):
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = dict.__getitem__(self, key)
+        del self[key]
+        return value
+
+    def popitem(self):
+        if not self:
+            raise KeyError("popitem(): dictionary is empty")
+        key = next(reversed(self.keys()))
+        return key, self.pop(key)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def clear(self):
+        for key in list(self.keys()):
+            del self[key]
+
+    def __getstate__(self):
+        # copies are rebuilt item by item; the owning environment
+        # re-freezes them once restored
+        state = self.__dict__.copy()
+        state.pop("frozen", None)
+        state.pop("listeners", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # versions are only comparable within a process
+        self.version = next(_versions)
+
+
+class EnvironmentConceptDict(EnvironmentDict, MutableMapping[KT, VT]):
+    def __setitem__(self, key, value):
+        existing = self.get(key)
+        # selects re-register their outputs; writing back an identical
+        # definition keeps the version, and anything cached against it
+        if (
+            isinstance(existing, Concept)
+            and existing == value
+            and existing.lineage == value.lineage
+            and existing.keys == value.keys
+        ):
+            self.check_mutable()
+            dict.__setitem__(self, key, value)
+            return
+        super().__setitem__(key, value)
+
     def __getitem__(self, key, line_no=None):
         try:
             return super(EnvironmentConceptDict, self).__getitem__(key)
@@ -920,14 +1267,144 @@ class EnvironmentConceptDict(dict, MutableMapping[KT, VT]):
             raise UndefinedConceptException(str(e))
 
 
+class EnvironmentDatasourceDict(EnvironmentDict, MutableMapping[KT, VT]):
+    # datasource key -> loaded StatisticsEntry, attached to matching
+    # datasources as they are added
+    statistics: Dict[str, Any]
+
+    def __new__(cls, *args, **kwargs):
+        output = super().__new__(cls, *args, **kwargs)
+        # set here rather than in __init__, as unpickling adds items before
+        # it restores attributes
+        output.statistics = {}
+        return output
+
+    def __setitem__(self, key, value):
+        entry = self.statistics.get(key)
+        if entry is not None and getattr(value, "statistics", False) is None:
+            from preql.core.statistics import datasource_fingerprint
+
+            if entry.fingerprint == datasource_fingerprint(value):
+                value.statistics = entry.statistics
+        super().__setitem__(key, value)
+
+
 @dataclass
 class Environment:
     concepts: EnvironmentConceptDict[str, Concept] = field(
         default_factory=EnvironmentConceptDict
     )
-    datasources: Dict[str, Datasource] = field(default_factory=dict)
+    datasources: EnvironmentDatasourceDict[str, Datasource] = field(
+        default_factory=EnvironmentDatasourceDict
+    )
     namespace: Optional[str] = None
     working_path: str = field(default_factory=lambda: os.getcwd())
+    # graph implementation used for planning; networkx is kept for debugging
+    graph_backend: GraphBackend = GraphBackend.COMPACT
+    # populated by freeze()
+    index: Optional["EnvironmentIndex"] = field(default=None, repr=False, compare=False)
+    # reference graph kept up to date with changes, see env_processor.get_graph
+    graph_cache: Optional["IncrementalGraph"] = field(
+        default=None, repr=False, compare=False
+    )
+    # statistics file read on creation, see load_statistics
+    statistics_path: Optional[str] = field(default=None, compare=False)
+
+    def __post_init__(self):
+        if self.statistics_path and os.path.exists(self.statistics_path):
+            self.load_statistics(self.statistics_path)
+
+    def __setattr__(self, name, value):
+        if self.__dict__.get("index") is not None:
+            raise FrozenEnvironmentException(
+                f"Environment is frozen, cannot set {name}"
+            )
+        if name == "concepts" and not isinstance(value, EnvironmentConceptDict):
+            value = EnvironmentConceptDict(value)
+        elif name == "datasources" and not isinstance(value, EnvironmentDatasourceDict):
+            value = EnvironmentDatasourceDict(value)
+        if name in ("concepts", "datasources") and self.__dict__.get("graph_cache"):
+            # a dict swapped in may carry an older version
+            self.__dict__["graph_cache"].detach()
+            self.__dict__["graph_cache"] = None
+        super().__setattr__(name, value)
+
+    def __getstate__(self):
+        # the index and graph are cheaper to rebuild than to ship
+        state = self.__dict__.copy()
+        state["index"] = None
+        state["graph_cache"] = None
+        state["_frozen"] = self.frozen
+        return state
+
+    def __setstate__(self, state):
+        frozen = state.pop("_frozen", False)
+        self.__dict__.update(state)
+        if frozen:
+            self.freeze()
+
+    @property
+    def frozen(self) -> bool:
+        return self.index is not None
+
+    @property
+    def version(self) -> int:
+        """Increases whenever a concept or datasource is added, replaced or
+        removed. Objects changed in place are not tracked; a frozen
+        environment's concepts and datasources reject such changes."""
+        return max(self.concepts.version, self.datasources.version)
+
+    def load_statistics(self, path: str):
+        """Read a statistics file and attach its entries to the datasources
+        they were collected for, now and as datasources are added later."""
+        from preql.core.statistics import read_statistics
+
+        self.datasources.check_mutable()
+        self.datasources.statistics = read_statistics(path)
+        for key, datasource in list(self.datasources.items()):
+            if key in self.datasources.statistics:
+                # re-adding attaches the entry and marks the change
+                datasource.statistics = None
+                self.datasources[key] = datasource
+
+    def freeze(self) -> "Environment":
+        """Validate the model, build every derived planning structure once
+        and make the environment read-only, so those structures stay valid.
+        The concepts and datasources it holds, and the concepts they refer
+        to, reject changes too; the lists inside them are not copied, so
+        changing one of those in place is not caught. Returns the
+        environment for chaining."""
+        from preql.core.env_processor import build_index
+
+        if self.frozen:
+            return self
+        index = build_index(self)
+        self.concepts.frozen = True
+        self.datasources.frozen = True
+        freeze_objects(self)
+        self.index = index
+        return self
+
+
+def freeze_objects(environment: Environment):
+    """Mark every concept and datasource of the environment frozen, along
+    with the concepts they refer to."""
+    pending: List[Concept] = list(environment.concepts.values())
+    for datasource in environment.datasources.values():
+        object.__setattr__(datasource, "_frozen", True)
+        pending += datasource.concepts + datasource.grain.components
+        if datasource.partition_by:
+            pending.append(datasource.partition_by)
+    seen: Set[int] = set()
+    while pending:
+        concept = pending.pop()
+        if id(concept) in seen:
+            continue
+        seen.add(id(concept))
+        object.__setattr__(concept, "_frozen", True)
+        pending += concept.grain.components + (concept.keys or [])
+        if concept.lineage:
+            pending += [x for x in concept.lineage.arguments if isinstance(x, Concept)]
 
 
 @dataclass
@@ -1011,7 +1488,7 @@ class WhereClause:
 # TODO: combine with CTEs
 # CTE contains procesed query?
 # or CTE references CTE?
-@dataclass
+@dataclass(frozen=True)
 class ProcessedQuery:
     output_columns: List[Concept]
     ctes: List[CTE]
@@ -0,0 +1,106 @@
+"""Planning independent selects in a pool of worker processes.
+
+The environment is serialized once and loaded by each worker when it starts;
+workers only read it. Statements and plans cross the process boundary in the
+compact serialization format, and plans come back in the order of the
+statements, so output is the same as planning them one after another."""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+from preql.core.hooks import BaseProcessingHook
+from preql.core.models import Environment, ProcessedQuery, Select
+from preql.core.processing.cache import PlanCache, copy_plan
+from preql.core.processing.context import PlanningBudget, PlanningContext
+from preql.core.processing.profile import StrategyProfile
+from preql.core.query_processor import process_query
+from preql.core.serialization import dumps, loads
+
+# loaded by each worker process when it starts
+_environment: Optional[Environment] = None
+_profile: Optional[StrategyProfile] = None
+
+
+def _start_worker(environment: bytes, winners: Optional[Dict[str, str]]):
+    global _environment, _profile
+    _environment = loads(environment)
+    _profile = StrategyProfile(winners) if winners is not None else None
+
+
+def _plan(task: bytes) -> Tuple[bytes, Dict[str, str]]:
+    """Plan one statement; returns the plan and the strategies it taught the
+    worker profile."""
+    statement, hooks, budget = loads(task)
+    context = None
+    known: Dict[str, str] = {}
+    if budget or _profile is not None:
+        context = PlanningContext(budget=budget, profile=_profile)
+    if _profile is not None:
+        known = dict(_profile.winners)
+    processed = process_query(_environment, statement, hooks, context=context)
+    learned = {}
+    if _profile is not None:
+        learned = {
+            key: strategy
+            for key, strategy in _profile.winners.items()
+            if known.get(key) != strategy
+        }
+    return dumps(processed), learned
+
+
+def plan_in_parallel(
+    environment: Environment,
+    statements: List[Select],
+    hooks: Optional[List[BaseProcessingHook]] = None,
+    cache: Optional[PlanCache] = None,
+    budget: Optional[PlanningBudget] = None,
+    profile: Optional[StrategyProfile] = None,
+    workers: Optional[int] = None,
+) -> List[ProcessedQuery]:
+    """Plan the selects in a pool of worker processes, defaulting to one per
+    CPU, and return the plans in the order of the selects.
+
+    Plans already in the cache are not planned again, and equal selects are
+    planned once, each getting its own copy. Hooks run in the workers. Strategies the workers learn are
+    recorded to the profile in the order of the selects. The first select to
+    fail raises its error, as when planning serially."""
+    keys: List[Hashable] = [
+        cache.key(environment, statement) if cache is not None else idx
+        for idx, statement in enumerate(statements)
+    ]
+    plans: Dict[Hashable, ProcessedQuery] = {}
+    # the first of equal selects is planned, the rest reuse its plan
+    pending: Dict[Hashable, Select] = {}
+    for key, statement in zip(keys, statements):
+        if key in plans or key in pending:
+            continue
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None:
+            plans[key] = cached
+        else:
+            pending[key] = statement
+    if pending:
+        workers = workers or os.cpu_count() or 1
+        tasks = [dumps((statement, hooks, budget)) for statement in pending.values()]
+        winners = dict(profile.winners) if profile is not None else None
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_start_worker,
+            initargs=(dumps(environment), winners),
+        ) as pool:
+            results = pool.map(
+                _plan, tasks, chunksize=max(1, len(tasks) // (workers * 4))
+            )
+            for key, (payload, learned) in zip(pending, results):
+                plans[key] = loads(payload)
+                if cache is not None:
+                    cache.store(key, plans[key])
+                for name, strategy in learned.items():
+                    profile.record(name, strategy)  # type: ignore
+    # equal selects each get their own copy of the plan
+    output: List[ProcessedQuery] = []
+    handed: Set[Hashable] = set()
+    for key in keys:
+        output.append(copy_plan(plans[key]) if key in handed else plans[key])
+        handed.add(key)
+    return output
@@ -0,0 +1,144 @@
+from collections import OrderedDict
+from copy import copy
+from dataclasses import fields, is_dataclass
+from enum import Enum
+from threading import Lock
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from pydantic import BaseModel
+
+from preql.core.models import (
+    Concept,
+    Datasource,
+    Environment,
+    Grain,
+    ProcessedQuery,
+    Select,
+)
+
+PlanKey = Tuple[Hashable, int]
+
+
+def fingerprint(item) -> Hashable:
+    """Canonical, hashable form of a select or any part of one.
+
+    Concepts are identified by address, grain and lineage; everything else
+    by type and content. Order is kept throughout, as it shapes the plan."""
+    if isinstance(item, Concept):
+        return (
+            "concept",
+            item.address,
+            item.purpose.value,
+            fingerprint(item.grain) if item.grain else None,
+            fingerprint(item.lineage) if item.lineage else None,
+        )
+    if isinstance(item, Grain):
+        return tuple(c.address for c in item.components)
+    if isinstance(item, Enum):
+        return (type(item).__name__, item.value)
+    if isinstance(item, (list, tuple)):
+        return tuple(fingerprint(x) for x in item)
+    if isinstance(item, (set, frozenset)):
+        return frozenset(fingerprint(x) for x in item)
+    if isinstance(item, BaseModel):
+        return (type(item).__name__,) + tuple(
+            fingerprint(getattr(item, name)) for name in item.__fields__
+        )
+    if is_dataclass(item):
+        return (type(item).__name__,) + tuple(
+            fingerprint(getattr(item, f.name)) for f in fields(item)
+        )
+    return (type(item).__name__, item)
+
+
+def statement_fingerprint(statement: Select) -> Hashable:
+    return (
+        fingerprint(statement.output_components),
+        fingerprint(statement.grain),
+        fingerprint(statement.where_clause),
+        fingerprint(statement.order_by),
+        statement.limit,
+    )
+
+
+def copy_plan(item, memo: Optional[Dict[int, Any]] = None):
+    """A copy of a plan that shares nothing mutable with it.
+
+    The CTEs, joins and query datasources of the plan are copied, along with
+    the lists and dicts that hold them, keeping shared nodes shared. Concepts,
+    grains and datasources belong to the environment and are not copied."""
+    memo = {} if memo is None else memo
+    if id(item) in memo:
+        return memo[id(item)]
+    if isinstance(item, list):
+        output: Any = [copy_plan(x, memo) for x in item]
+    elif isinstance(item, dict):
+        output = {key: copy_plan(value, memo) for key, value in item.items()}
+    elif is_dataclass(item) and not isinstance(item, (type, Datasource)):
+        output = copy(item)
+        # registered first, as CTEs and their joins refer to each other
+        memo[id(item)] = output
+        for f in fields(item):
+            # frozen dataclasses are copied the same way
+            object.__setattr__(output, f.name, copy_plan(getattr(item, f.name), memo))
+        return output
+    else:
+        return item
+    memo[id(item)] = output
+    return output
+
+
+class PlanCache:
+    """Bounded LRU cache of planned queries shared across calls to
+    `process_query`.
+
+    Entries are keyed by the statement fingerprint and the environment
+    version, so any change to the environment misses. Each hit hands out its
+    own copy of the plan, so changes to one never reach the cache."""
+
+    def __init__(self, size: int = 256):
+        if size < 1:
+            raise ValueError(f"Plan cache size must be positive, got {size}")
+        self.size = size
+        self.plans: "OrderedDict[PlanKey, ProcessedQuery]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = Lock()
+
+    @staticmethod
+    def key(environment: Environment, statement: Select) -> PlanKey:
+        return statement_fingerprint(statement), environment.version
+
+    def get(self, key: PlanKey) -> Optional[ProcessedQuery]:
+        with self._lock:
+            found = self.plans.get(key)
+            if found is None:
+                self.misses += 1
+                return None
+            self.plans.move_to_end(key)
+            self.hits += 1
+        return copy_plan(found)
+
+    def store(self, key: PlanKey, query: ProcessedQuery):
+        query = copy_plan(query)
+        with self._lock:
+            self.plans[key] = query
+            self.plans.move_to_end(key)
+            while len(self.plans) > self.size:
+                self.plans.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self.plans.clear()
+
+    def __len__(self):
+        return len(self.plans)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0.0
+        return self.hits / lookups
@@ -1,11 +1,12 @@
 from collections import defaultdict
-from typing import List, Optional, Union, Set, Dict
+from itertools import combinations
+from typing import Callable, List, Optional, Union, Set, Dict, Tuple
 
 import networkx as nx
 
 from preql.constants import logger
-from preql.core.enums import Purpose, PurposeLineage
-from preql.core.env_processor import generate_graph
+from preql.core.enums import DECOMPOSABLE_AGGREGATES, Purpose, PurposeLineage
+from preql.core.env_processor import get_graph
 from preql.core.graph_models import ReferenceGraph, concept_to_node, datasource_to_node
 from preql.core.models import (
     Concept,
@@ -18,7 +19,15 @@ from preql.core.models import (
     Function,
     WindowItem,
 )
-from preql.core.processing.utility import concept_to_inputs, PathInfo, path_to_joins
+from preql.core.processing.cache import fingerprint
+from preql.core.processing.context import PlanningContext
+from preql.core.processing.cost import choose_join_root, row_count
+from preql.core.processing.utility import (
+    PathInfo,
+    path_to_joins,
+    get_concept_inputs,
+    candidate_datasources,
+)
 from preql.utility import unique
 
 
@@ -27,27 +36,15 @@ def get_datasource_from_direct_select(
 ) -> QueryDatasource:
     """Return a datasource a concept can be directly selected from at
     appropriate grain. Think select * from table."""
-    all_concepts = concept_to_inputs(concept)
-    for datasource in environment.datasources.values():
+    all_concepts = get_concept_inputs(concept, environment)
+    targets = [concept_to_node(req_concept) for req_concept in all_concepts]
+    for datasource in candidate_datasources(environment, all_concepts):
         if not datasource.grain.issubset(grain):
             continue
-        all_found = True
-        for req_concept in all_concepts:
-            try:
-                path = nx.shortest_path(
-                    g,
-                    source=datasource_to_node(datasource),
-                    target=concept_to_node(req_concept),
-                )
-            except nx.exception.NodeNotFound as e:
-                all_found = False
-                break
-            except nx.exception.NetworkXNoPath as e:
-                all_found = False
-                break
-            if len([p for p in path if g.nodes[p]["type"] == "datasource"]) != 1:
-                all_found = False
-                break
+        try:
+            all_found = g.covers(datasource_to_node(datasource), targets)
+        except nx.exception.NodeNotFound as e:
+            all_found = False
         if all_found:
             if datasource.grain.issubset(grain):
                 final_grain = datasource.grain
@@ -81,13 +78,14 @@ def get_datasource_from_property_lookup(
     """Return a datasource that has a direct property/key relation
     If the datasource is a component of the grain, assume we can
     join it in the final query to the grain level"""
-    all_concepts = concept_to_inputs(concept)
+    all_concepts = get_concept_inputs(concept, environment)
     if whole_grain:
         valid_matches = ["all"]
     else:
         valid_matches = ["all", "partial"]
+    targets = [concept_to_node(req_concept) for req_concept in all_concepts]
     for strategy in valid_matches:
-        for datasource in environment.datasources.values():
+        for datasource in candidate_datasources(environment, all_concepts):
             # whole grain determines
             # if we can get a partial grain match
             # such as joining through a table with a PK to get properties
@@ -102,20 +100,7 @@ def get_datasource_from_property_lookup(
                 # or it's a key on the table
                 if not datasource.grain == grain:
                     continue
-            all_found = True
-            for req_concept in all_concepts:
-                try:
-                    path = nx.shortest_path(
-                        g,
-                        source=datasource_to_node(datasource),
-                        target=concept_to_node(req_concept),
-                    )
-                except nx.exception.NetworkXNoPath as e:
-                    all_found = False
-                    break
-                if len([p for p in path if g.nodes[p]["type"] == "datasource"]) != 1:
-                    all_found = False
-                    break
+            all_found = g.covers(datasource_to_node(datasource), targets)
             if all_found:
                 logger.debug(
                     f"Can satisfy query from property lookup for {concept} using {datasource.identifier}"
@@ -153,22 +138,15 @@ def get_datasource_from_group_select(
 ) -> QueryDatasource:
     """Return a datasource that can be grouped to a value and grain.
     Unique values in a column, for example"""
-    all_concepts = concept_to_inputs(concept.with_default_grain()) + grain.components
-    for datasource in environment.datasources.values():
-        all_found = True
-        for req_concept in all_concepts:
-            try:
-                path = nx.shortest_path(
-                    g,
-                    source=datasource_to_node(datasource),
-                    target=concept_to_node(req_concept),
-                )
-            except (nx.exception.NetworkXNoPath, nx.exception.NodeNotFound) as e:
-                all_found = False
-                break
-            if len([p for p in path if g.nodes[p]["type"] == "datasource"]) != 1:
-                all_found = False
-                break
+    all_concepts = (
+        get_concept_inputs(concept.with_default_grain(), environment) + grain.components
+    )
+    targets = [concept_to_node(req_concept) for req_concept in all_concepts]
+    for datasource in candidate_datasources(environment, all_concepts):
+        try:
+            all_found = g.covers(datasource_to_node(datasource), targets)
+        except nx.exception.NodeNotFound as e:
+            all_found = False
         if all_found:
             # if the dataset that can reach every concept
             # is in fact a subset of the concept
@@ -196,6 +174,77 @@ def get_datasource_from_group_select(
     raise ValueError(f"No grouped select for {concept}")
 
 
+def rolls_up_to(datasource: Datasource, component: Concept) -> bool:
+    """Whether rows of the datasource each fall in a single value of the
+    component: it is part of the grain, or a property of keys that are."""
+    if component.address in datasource.grain.set:
+        return True
+    return bool(
+        component.purpose == Purpose.PROPERTY
+        and component.keys
+        and component.address in [c.address for c in datasource.concepts]
+        and all(key.address in datasource.grain.set for key in component.keys)
+    )
+
+
+def get_datasource_from_rollup(
+    concept: Concept, grain: Grain, environment: Environment
+) -> QueryDatasource:
+    """Return a pre-aggregated datasource that stores a decomposable aggregate
+    at a grain at least as fine as the one requested, so the stored values can
+    be combined again. Of several, the smallest by statistics wins, then the
+    one with the coarsest grain; a rollup that statistics show is no smaller
+    than a raw source of the aggregate inputs is not used."""
+    if (
+        not isinstance(concept.lineage, Function)
+        or concept.lineage.operator not in DECOMPOSABLE_AGGREGATES
+    ):
+        raise ValueError(f"{concept} is not a decomposable aggregate")
+    if environment.index:
+        exposing = environment.index.concept_datasources.get(concept.address, [])
+    else:
+        exposing = list(environment.datasources.values())
+    rollups = [
+        datasource
+        for datasource in exposing
+        if concept.address in [c.address for c in datasource.concepts]
+        and concept.address not in [c.address for c in datasource.partial_concepts]
+        and all(rolls_up_to(datasource, c) for c in grain.components)
+    ]
+    if not rollups:
+        raise ValueError(f"No rollup for {concept} at grain {grain}")
+    # known row counts first, then the coarsest grain, then the earliest
+    rollup = min(
+        rollups,
+        key=lambda d: (
+            row_count(d) is None,
+            row_count(d) or 0,
+            len(d.grain.components),
+            rollups.index(d),
+        ),
+    )
+    rows = row_count(rollup)
+    if rows is not None:
+        inputs = get_concept_inputs(concept, environment)
+        for datasource in candidate_datasources(environment, inputs):
+            raw_rows = row_count(datasource)
+            if datasource is rollup or raw_rows is None or raw_rows > rows:
+                continue
+            addresses = [c.address for c in datasource.concepts]
+            if all(c.address in addresses for c in inputs + grain.components):
+                raise ValueError(f"{datasource.identifier} is no larger than rollup")
+    logger.debug(f"got {rollup.identifier} for {concept} from rollup")
+    outputs = [concept] + grain.components
+    return QueryDatasource(
+        input_concepts=outputs,
+        output_concepts=outputs,
+        source_map={c.address: {rollup} for c in outputs},
+        datasources=[rollup],
+        grain=grain,
+        joins=[],
+    )
+
+
 def get_datasource_by_joins(
     concept: Concept,
     grain: Grain,
@@ -203,33 +252,23 @@ def get_datasource_by_joins(
     g: ReferenceGraph,
     whole_grain: bool = False,
 ) -> QueryDatasource:
-    join_candidates: List[PathInfo] = []
-
-    all_requirements = unique(concept_to_inputs(concept) + grain.components, "address")
+    all_requirements = unique(
+        get_concept_inputs(concept, environment) + grain.components, "address"
+    )
 
-    for datasource in environment.datasources.values():
-        all_found = True
-        paths = {}
-        for item in all_requirements:
-            try:
-                path = nx.shortest_path(
-                    g,
-                    source=datasource_to_node(datasource),
-                    target=concept_to_node(item),
-                )
-                paths[concept_to_node(item)] = path
-            except nx.exception.NodeNotFound as e:
-                all_found = False
-                continue
-            except nx.exception.NetworkXNoPath as e:
-                all_found = False
-                continue
-        if all_found:
-            join_candidates.append({"paths": paths, "datasource": datasource})
-    join_candidates.sort(key=lambda x: sum([len(v) for v in x["paths"].values()]))
-    if not join_candidates:
+    # the datasource with the shortest total path to every requirement
+    # roots the joins; the earliest defined wins ties
+    datasources = list(environment.datasources.values())
+    targets = [concept_to_node(item) for item in all_requirements]
+    winner = g.cheapest_source([datasource_to_node(d) for d in datasources], targets)
+    if winner is None:
         raise ValueError(f"No joins to get to {concept} and grain {grain}")
-    shortest: PathInfo = join_candidates[0]
+    winner = choose_join_root(g, datasources, targets, winner)
+    source = datasource_to_node(datasources[winner])
+    shortest: PathInfo = {
+        "paths": {target: g.shortest_path(source, target) for target in targets},
+        "datasource": datasources[winner],
+    }
     source_map = defaultdict(set)
     join_paths: List[BaseJoin] = []
     parents = []
@@ -278,7 +317,12 @@ def get_datasource_by_joins(
 
 
 def get_datasource_from_complex_lineage(
-    concept: Concept, grain: Grain, environment, g, whole_grain: bool = False
+    concept: Concept,
+    grain: Grain,
+    environment,
+    g,
+    whole_grain: bool = False,
+    context: Optional[PlanningContext] = None,
 ):
     # always true if window item
     complex_lineage_flag = isinstance(concept.lineage, WindowItem)
@@ -297,7 +341,11 @@ def get_datasource_from_complex_lineage(
         if sub_concept.derivation in (PurposeLineage.AGGREGATE, PurposeLineage.WINDOW):
             complex_lineage_flag = True
         sub_datasource = get_datasource_by_concept_and_grain(
-            sub_concept, sub_concept.grain + grain, environment=environment, g=g
+            sub_concept,
+            sub_concept.grain + grain,
+            environment=environment,
+            g=g,
+            context=context,
         )
         all_datasets.append(sub_datasource)
         all_requirements.append(sub_concept)
@@ -310,7 +358,11 @@ def get_datasource_from_complex_lineage(
         if sub_concept.derivation in (PurposeLineage.AGGREGATE, PurposeLineage.WINDOW):
             complex_lineage_flag = True
         sub_datasource = get_datasource_by_concept_and_grain(
-            sub_concept, sub_concept.grain, environment=environment, g=g
+            sub_concept,
+            sub_concept.grain,
+            environment=environment,
+            g=g,
+            context=context,
         )
         all_datasets.append(sub_datasource)
         all_requirements.append(sub_concept)
@@ -334,7 +386,12 @@ def get_datasource_from_complex_lineage(
 
 
 def get_property_group_by_without_key(
-    concept: Concept, grain: Grain, environment, g, whole_grain: bool = False
+    concept: Concept,
+    grain: Grain,
+    environment,
+    g,
+    whole_grain: bool = False,
+    context: Optional[PlanningContext] = None,
 ):
     """If a query requires things at a property grain, but does not include the property
     key - first search for a query at target grain with all keys, then group up to the property level"""
@@ -360,6 +417,7 @@ def get_property_group_by_without_key(
         environment=environment,
         g=g,
         whole_grain=True,
+        context=context,
     )
     all_datasets.append(sub_datasource)
     all_requirements.append(concept)
@@ -383,6 +441,7 @@ def get_property_group_by_without_key(
             environment=environment,
             g=g,
             whole_grain=whole_grain,
+            context=context,
         )
         output_concepts = unique(
             output_concepts + remapped_datasource.output_concepts, "address"
@@ -421,7 +480,12 @@ def get_property_group_by_without_key(
 
 
 def get_datasource_from_window_function(
-    concept: Concept, grain: Grain, environment, g, whole_grain: bool = False
+    concept: Concept,
+    grain: Grain,
+    environment,
+    g,
+    whole_grain: bool = False,
+    context: Optional[PlanningContext] = None,
 ):
     if not isinstance(concept.lineage, WindowItem):
         raise ValueError(
@@ -438,7 +502,7 @@ def get_datasource_from_window_function(
     for sub_concept in sub_concepts:
         sub_concept = sub_concept.with_grain(cte_grain)
         sub_datasource = get_datasource_by_concept_and_grain(
-            sub_concept, cte_grain, environment=environment, g=g
+            sub_concept, cte_grain, environment=environment, g=g, context=context
         )
         if sub_datasource.identifier in all_datasets:
             all_datasets[sub_datasource.identifier] = (
@@ -475,97 +539,209 @@ def get_datasource_from_window_function(
     return qds
 
 
+def get_sub_grains(
+    concept: Concept, grain: Grain, environment: Environment, g: ReferenceGraph
+) -> List[Grain]:
+    """Portions of the grain a join search for the concept could succeed at,
+    in the order every combination of grain components would try them.
+
+    Derived concepts are searched through their inputs whatever their grain,
+    and other concepts are only reachable at a grain the graph has a node
+    for. Every portion also needs one source for the rest of the grain."""
+    addresses = [c.address for c in grain.components]
+    if len(set(addresses)) != len(addresses):
+        return [
+            Grain(components=list(combo))
+            for x in range(1, len(grain.components))
+            for combo in combinations(grain.components, x)
+        ]
+    if concept.lineage:
+        return []
+    positions = {address: idx for idx, address in enumerate(addresses)}
+    combos = set()
+    for node in g.concept_nodes(concept.address):
+        node_addresses = [c.address for c in node.grain.components]
+        if not 0 < len(node_addresses) < len(addresses):
+            continue
+        if any(address not in positions for address in node_addresses):
+            continue
+        combo = tuple(positions[address] for address in node_addresses)
+        if list(combo) == sorted(set(combo)):
+            combos.add(combo)
+    if not combos:
+        return []
+    targets = [
+        concept_to_node(c) for c in grain.components if c.address != concept.address
+    ]
+    sources = [datasource_to_node(d) for d in environment.datasources.values()]
+    if targets and g.cheapest_source(sources, targets) is None:
+        return []
+    return [
+        Grain(components=[grain.components[idx] for idx in combo])
+        for combo in sorted(combos, key=lambda combo: (len(combo), combo))
+    ]
+
+
 def get_datasource_by_concept_and_grain(
     concept,
     grain: Grain,
     environment: Environment,
     g: Optional[ReferenceGraph] = None,
     whole_grain: bool = False,
+    context: Optional[PlanningContext] = None,
 ) -> Union[Datasource, QueryDatasource]:
     """Determine if it's possible to get a certain concept at a certain grain.
+    Resolutions are reused from the planning context when one is passed.
     """
-    g = g or generate_graph(environment)
-    if concept.lineage:
-        if concept.derivation == PurposeLineage.WINDOW:
-            logger.debug("Checking for complex window function")
-            complex = get_datasource_from_window_function(
-                concept, grain, environment, g, whole_grain=whole_grain
+    g = g or get_graph(environment)
+    if context is None:
+        return resolve_concept_and_grain(concept, grain, environment, g, whole_grain)
+    key = context.key(concept, grain, whole_grain)
+    found = context.get(key)
+    if found is None:
+        found = resolve_concept_and_grain(
+            concept, grain, environment, g, whole_grain, context
+        )
+        context.store(key, found)
+    return found
+
+
+def resolve_concept_and_grain(
+    concept,
+    grain: Grain,
+    environment: Environment,
+    g: ReferenceGraph,
+    whole_grain: bool = False,
+    context: Optional[PlanningContext] = None,
+) -> Union[Datasource, QueryDatasource]:
+    """Try each strategy in turn; the first to return a datasource wins.
+    With a strategy profile in the context, the strategy that won before for
+    this concept, lineage, grain and environment goes first; the strategies
+    before it are known to fail, and all follow in order if it fails too."""
+    strategies: List[
+        Tuple[str, Callable[[], Optional[Union[Datasource, QueryDatasource]]]]
+    ] = []
+    if concept.lineage and concept.derivation == PurposeLineage.WINDOW:
+        strategies.append(
+            (
+                "window function",
+                lambda: get_datasource_from_window_function(
+                    concept,
+                    grain,
+                    environment,
+                    g,
+                    whole_grain=whole_grain,
+                    context=context,
+                ),
             )
-        elif concept.derivation == PurposeLineage.AGGREGATE:
-            logger.debug("Checking for complex function derivation")
-            complex = get_datasource_from_complex_lineage(
-                concept, grain, environment, g, whole_grain=whole_grain
+        )
+    elif concept.lineage and concept.derivation == PurposeLineage.AGGREGATE:
+        strategies.append(
+            (
+                "complex lineage",
+                lambda: get_datasource_from_complex_lineage(
+                    concept,
+                    grain,
+                    environment,
+                    g,
+                    whole_grain=whole_grain,
+                    context=context,
+                ),
             )
-        else:
-            complex = None
-        if complex:
-            logger.debug(f"Returning complex lineage for {concept}")
-            return complex
-        logger.debug(f"Can satisfy query with basic lineage for {concept}")
+        )
+        strategies.append(
+            ("rollup", lambda: get_datasource_from_rollup(concept, grain, environment))
+        )
     # the concept is available directly on a datasource at appropriate grain
     if concept.purpose in (Purpose.KEY, Purpose.PROPERTY):
-        try:
-
-            out = get_datasource_from_property_lookup(
-                concept.with_default_grain(),
-                grain,
-                environment,
-                g,
-                whole_grain=whole_grain,
+        strategies.append(
+            (
+                "property lookup",
+                lambda: get_datasource_from_property_lookup(
+                    concept.with_default_grain(),
+                    grain,
+                    environment,
+                    g,
+                    whole_grain=whole_grain,
+                ),
             )
-            logger.debug(f"Got {concept} from property lookup")
-            return out
-        except ValueError as e:
-            logger.debug(e)
+        )
     # the concept is available on a datasource, but at a higher granularity
-    try:
-        out = get_datasource_from_group_select(
-            concept, grain, environment, g, whole_grain=whole_grain
+    strategies.append(
+        (
+            "grouped select",
+            lambda: get_datasource_from_group_select(
+                concept, grain, environment, g, whole_grain=whole_grain
+            ),
         )
-        logger.debug(f"Got {concept} from grouped select")
-        return out
-    except ValueError as e:
-        logger.error(e)
+    )
     # the concept and grain together can be gotten via
     # a join from a root dataset to enrichment datasets
-    try:
-        out = get_datasource_by_joins(
-            concept, grain, environment, g, whole_grain=whole_grain
+    strategies.append(
+        (
+            "joins",
+            lambda: get_datasource_by_joins(
+                concept, grain, environment, g, whole_grain=whole_grain
+            ),
         )
-        logger.debug(f"Got {concept} from joins")
-        return out
-    except ValueError as e:
-        logger.debug(e)
-    from itertools import combinations
+    )
 
-    for x in range(1, len(grain.components)):
-        for combo in combinations(grain.components, x):
-            ngrain = Grain(components=list(combo))
+    def sub_grain_joins() -> QueryDatasource:
+        for ngrain in get_sub_grains(concept, grain, environment, g):
             try:
-                out = get_datasource_by_joins(
+                return get_datasource_by_joins(
                     concept.with_grain(ngrain),
                     grain,
                     environment,
                     g,
                     whole_grain=whole_grain,
                 )
-                logger.debug(f"Got {concept} from join to a sub portion of grain")
-                return out
             except ValueError as e:
                 logger.debug(e)
+        raise ValueError(f"No join to a sub portion of grain for {concept}")
 
+    strategies.append(("joins at sub grains", sub_grain_joins))
     # if there is a property in the grain, see if we can find a datasource
     # with all the keys of the property, which we can then join to
-    try:
-        out = get_property_group_by_without_key(
-            concept, grain, environment, g, whole_grain=whole_grain
+    strategies.append(
+        (
+            "property group by without key",
+            lambda: get_property_group_by_without_key(
+                concept, grain, environment, g, whole_grain=whole_grain, context=context
+            ),
         )
-        logger.debug(
-            f"Got {concept} from property lookup via transversing key based grain"
+    )
+
+    key = None
+    if context is not None and context.profile is not None and context.scope:
+        # keyed on the lineage too, as concepts a select defines can share an
+        # address with different derivations
+        resolution = (
+            context.key(concept, grain, whole_grain),
+            fingerprint(concept),
+            fingerprint(concept.keys),
         )
+        key = context.profile.key(context.scope, resolution)
+        preferred = context.profile.preferred(key)
+        strategies.sort(key=lambda strategy: strategy[0] != preferred)
+    for name, strategy in strategies:
+        if context is not None:
+            context.attempt(name, concept, grain)
+        # derivations that fail are errors, not a reason to look elsewhere
+        if name in ("window function", "complex lineage"):
+            out = strategy()
+        else:
+            try:
+                out = strategy()
+            except ValueError as e:
+                logger.debug(e)
+                continue
+        if out is None:
+            continue
+        logger.debug(f"Got {concept} from {name}")
+        if key is not None:
+            context.profile.record(key, name)
         return out
-    except ValueError as e:
-        logger.debug(e)
 
     neighbors = list(g.predecessors(concept_to_node(concept)))
     raise ValueError(f"No source for {concept} found, neighbors {neighbors}")
@@ -0,0 +1,106 @@
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, List, Optional, Tuple, Union
+
+from preql.core.exceptions import PlanningBudgetExceeded
+from preql.core.models import Concept, Datasource, Grain, QueryDatasource
+from preql.core.processing.profile import StrategyProfile
+
+ResolutionKey = Tuple[str, Tuple[str, ...], Tuple[str, ...], bool]
+
+
+@dataclass(frozen=True)
+class PlanningBudget:
+    """Limits on planning one query: seconds from the first strategy
+    attempt, and the number of strategy attempts."""
+
+    timeout: Optional[float] = None
+    max_attempts: Optional[int] = None
+
+
+@dataclass
+class PlanningContext:
+    """State shared by every resolution made while planning one query.
+
+    Resolving a concept at a grain is deterministic for a given environment,
+    so each result is kept and handed back when the same concept, grain and
+    whole grain requirement come up again."""
+
+    resolutions: Dict[Hashable, Union[Datasource, QueryDatasource]] = field(
+        default_factory=dict
+    )
+    hits: int = 0
+    misses: int = 0
+    budget: Optional[PlanningBudget] = None
+    attempts: int = 0
+    # the strategy, concept and grain of each attempt, kept under a budget
+    trail: List[Tuple[str, Concept, Grain]] = field(default_factory=list)
+    started: Optional[float] = None
+    # strategies that resolved earlier queries, and the environment
+    # fingerprint they are recorded under for this one
+    profile: Optional[StrategyProfile] = None
+    scope: Optional[str] = None
+
+    @staticmethod
+    def key(concept: Concept, grain: Grain, whole_grain: bool) -> ResolutionKey:
+        # grain components are kept in order, as they also order the outputs;
+        # the concept's own grain is part of the key as sub-grain searches
+        # resolve the same address at a narrower grain
+        concept_grain = concept.grain.components if concept.grain else []
+        return (
+            concept.address,
+            tuple(c.address for c in concept_grain),
+            tuple(c.address for c in grain.components),
+            whole_grain,
+        )
+
+    def get(self, key: Hashable) -> Optional[Union[Datasource, QueryDatasource]]:
+        found = self.resolutions.get(key)
+        if found is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return found
+
+    def store(self, key: Hashable, value: Union[Datasource, QueryDatasource]):
+        self.resolutions[key] = value
+
+    def attempt(self, strategy: str, concept: Concept, grain: Grain):
+        """Count a strategy about to be tried; under a budget, also record it
+        and fail once the budget is spent."""
+        self.attempts += 1
+        if self.budget is None:
+            return
+        self.trail.append((strategy, concept, grain))
+        now = time.monotonic()
+        if self.started is None:
+            self.started = now
+        elapsed = now - self.started
+        reason = None
+        if self.budget.timeout is not None and elapsed > self.budget.timeout:
+            reason = f"exceeded the {self.budget.timeout}s planning timeout"
+        elif (
+            self.budget.max_attempts is not None
+            and self.attempts > self.budget.max_attempts
+        ):
+            reason = f"exceeded {self.budget.max_attempts} strategy attempts"
+        if reason:
+            attempts = [f"{name}: {c} at {g}" for name, c, g in self.trail]
+            resolved = sorted(set(key[0] for key in self.resolutions))
+            raise PlanningBudgetExceeded(reason, attempts, resolved, elapsed)
+
+    @property
+    def lookups(self) -> int:
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        if not self.lookups:
+            return 0.0
+        return self.hits / self.lookups
+
+    def __str__(self):
+        return (
+            f"{self.hits}/{self.lookups} resolutions reused "
+            f"({self.hit_rate:.0%} hit rate)"
+        )
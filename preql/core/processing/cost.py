@@ -0,0 +1,259 @@
+"""Cardinality and cost estimates from optional datasource statistics.
+
+Every estimate is None when a datasource involved has no statistics, and
+callers then keep their statistics-free choice."""
+from typing import Any, Dict, List, Optional, Union
+
+import networkx as nx
+
+from preql.core.enums import ComparisonOperator
+from preql.core.graph_models import ReferenceGraph, datasource_to_node
+from preql.core.models import (
+    CTE,
+    BaseJoin,
+    Concept,
+    Datasource,
+    DatasourceStatistics,
+    QueryDatasource,
+)
+from preql.core.processing.partitions import literal_comparison
+from preql.core.processing.predicates import Predicate, conjuncts
+from preql.core.processing.utility import path_to_joins
+
+# share of rows a range comparison is assumed to keep without a known range
+RANGE_SELECTIVITY = 1 / 3
+
+
+def row_count(datasource: Datasource) -> Optional[int]:
+    if datasource.statistics is None:
+        return None
+    return datasource.statistics.row_count
+
+
+def distinct_count(datasource: Datasource, concepts: List[Concept]) -> Optional[int]:
+    """Estimated distinct values of the concepts together on the datasource.
+
+    A key that makes up the grain of the datasource is unique; unknown
+    distinct counts are assumed unique as well."""
+    rows = row_count(datasource)
+    if rows is None:
+        return None
+    addresses = set(c.address for c in concepts)
+    if addresses and addresses == datasource.grain.set:
+        return rows
+    best = 1
+    for column in datasource.columns:
+        if column.concept.address not in addresses:
+            continue
+        distinct = datasource.statistics.distinct(column.alias)  # type: ignore
+        best = max(best, rows if distinct is None else distinct)
+    return min(best, rows) if addresses else rows
+
+
+def comparison_selectivity(
+    statistics: DatasourceStatistics,
+    alias: str,
+    operator: ComparisonOperator,
+    value: Any,
+) -> Optional[float]:
+    """Estimated share of rows where the column compares to the literal as
+    given, assuming evenly spread values."""
+    if operator in (
+        ComparisonOperator.EQ,
+        ComparisonOperator.NE,
+        ComparisonOperator.IN,
+    ):
+        distinct = statistics.distinct(alias)
+        if not distinct:
+            return None
+        if operator == ComparisonOperator.EQ:
+            return 1 / distinct
+        elif operator == ComparisonOperator.NE:
+            return 1 - 1 / distinct
+        return min(1.0, len(value) / distinct)
+    bounds = statistics.ranges.get(alias)
+    if not bounds:
+        return RANGE_SELECTIVITY
+    low, high = bounds
+    try:
+        if high <= low:
+            return RANGE_SELECTIVITY
+        if operator in (ComparisonOperator.GT, ComparisonOperator.GTE):
+            share = (high - value) / (high - low)
+        else:
+            share = (value - low) / (high - low)
+    except TypeError:
+        # dates and strings have no width to take a share of
+        return RANGE_SELECTIVITY
+    return min(1.0, max(0.0, share))
+
+
+def filter_selectivity(
+    datasource: Datasource, predicates: List[Predicate]
+) -> Optional[float]:
+    """Estimated share of the rows of the datasource that pass all of the
+    predicates, taking comparisons of its columns to literals as independent.
+    Other parts of the predicates are assumed to keep every row."""
+    if datasource.statistics is None:
+        return None
+    share = 1.0
+    for predicate in predicates:
+        for part in conjuncts(predicate):
+            for column in datasource.columns:
+                comparison = literal_comparison(part, column.concept)
+                if comparison is None:
+                    continue
+                found = comparison_selectivity(
+                    datasource.statistics, column.alias, *comparison
+                )
+                if found is None:
+                    return None
+                share *= found
+                break
+    return share
+
+
+def join_rows(
+    left_rows: float, right_rows: float, left_distinct: int, right_distinct: int
+) -> float:
+    """Estimated output of an equi-join, assuming the smaller set of keys is
+    contained in the larger one."""
+    return left_rows * right_rows / max(left_distinct, right_distinct, 1)
+
+
+def join_cost(root: Datasource, joins: List[BaseJoin]) -> Optional[float]:
+    """Rows read plus rows produced by each join, starting from the root and
+    applying joins in order."""
+    rows = row_count(root)
+    if rows is None:
+        return None
+    current = float(rows)
+    cost = current
+    joined = {root.identifier}
+    for join in joins:
+        right = join.right_datasource
+        if right.identifier in joined or not isinstance(right, Datasource):
+            continue
+        left = join.left_datasource
+        right_rows = row_count(right)
+        left_distinct = (
+            distinct_count(left, join.concepts)
+            if isinstance(left, Datasource)
+            else None
+        )
+        right_distinct = distinct_count(right, join.concepts)
+        if right_rows is None or left_distinct is None or right_distinct is None:
+            return None
+        current = join_rows(current, right_rows, left_distinct, right_distinct)
+        cost += right_rows + current
+        joined.add(right.identifier)
+    return cost
+
+
+def root_joins(
+    g: ReferenceGraph, datasource: Datasource, targets: List[str]
+) -> Optional[List[BaseJoin]]:
+    """The joins the shortest paths from the datasource to every target take,
+    or None if a target cannot be reached."""
+    source = datasource_to_node(datasource)
+    joins: List[BaseJoin] = []
+    try:
+        for target in targets:
+            # path_to_joins consumes the path it is given
+            joins += path_to_joins(list(g.shortest_path(source, target)), g=g)
+    except (nx.NetworkXNoPath, nx.NodeNotFound):
+        return None
+    return joins
+
+
+def choose_join_root(
+    g: ReferenceGraph, datasources: List[Datasource], targets: List[str], default: int
+) -> int:
+    """The datasource to root the joins reaching every target at.
+
+    Starts from the shortest total path choice. Roots whose paths join on
+    other keys relate the targets differently and can return other rows, so
+    only those joining on the same key concepts are weighed; when they and
+    the default have statistics, the one with the lowest estimated join cost
+    wins, with ties going to the default and then to the earliest defined."""
+    if not any(d.statistics for d in datasources):
+        return default
+    default_joins = root_joins(g, datasources[default], targets)
+    if default_joins is None:
+        return default
+    keys = set(c.address for join in default_joins for c in join.concepts)
+    costs: Dict[int, float] = {}
+    for idx, datasource in enumerate(datasources):
+        if datasource.statistics is None:
+            continue
+        joins = default_joins if idx == default else root_joins(g, datasource, targets)
+        if joins is None:
+            continue
+        if set(c.address for join in joins for c in join.concepts) != keys:
+            continue
+        cost = join_cost(datasource, joins)
+        if cost is not None:
+            costs[idx] = cost
+    if default not in costs:
+        return default
+    return min(costs, key=lambda idx: (costs[idx], idx != default, idx))
+
+
+def leaf_datasources(source: Union[Datasource, QueryDatasource]) -> List[Datasource]:
+    if isinstance(source, Datasource):
+        return [source]
+    output: List[Datasource] = []
+    for datasource in source.datasources:
+        output += leaf_datasources(datasource)
+    return output
+
+
+def estimate_cte_rows(cte: CTE) -> Optional[float]:
+    """Rough row count of a CTE: its largest input, capped by the distinct
+    combinations of its grain when it groups."""
+    leaves = leaf_datasources(cte.source)
+    counts = [row_count(leaf) for leaf in leaves]
+    if not counts or None in counts:
+        return None
+    rows = float(max(counts))  # type: ignore
+    if cte.group_to_grain and cte.grain.components:
+        combinations = 1.0
+        for component in cte.grain.components:
+            known = [
+                distinct_count(leaf, [component])
+                for leaf in leaves
+                if component.address in [c.address for c in leaf.concepts]
+            ]
+            if not known:
+                return rows
+            combinations *= min(known)  # type: ignore
+        rows = min(rows, combinations)
+    return rows
+
+
+def row_population(cte: CTE) -> Optional[str]:
+    """The datasource whose distinct grain values are the rows of the CTE,
+    when it reads that one datasource and joins nothing to it."""
+    leaves = leaf_datasources(cte.source)
+    if len(leaves) != 1 or cte.joins:
+        return None
+    return leaves[0].identifier
+
+
+def choose_base_cte(candidates: List[CTE]) -> CTE:
+    """Of the CTEs at the query grain, the one the others are left joined to.
+
+    The base decides which rows the query returns, so the first is kept
+    unless every candidate has the same rows, the distinct grain values of
+    one datasource. Only then, with statistics for all of them, is the one
+    estimated to be smallest preferred."""
+    if len(candidates) < 2:
+        return candidates[0]
+    populations = set(row_population(cte) for cte in candidates)
+    if len(populations) != 1 or None in populations:
+        return candidates[0]
+    estimates = [estimate_cte_rows(cte) for cte in candidates]
+    if None in estimates:
+        return candidates[0]
+    best = min(range(len(candidates)), key=lambda idx: (estimates[idx], idx))
+    return candidates[best]
@@ -0,0 +1,141 @@
+"""Aggregating a fact CTE to its join keys before it is joined and grouped.
+
+A CTE that joins raw fact rows to dimensions and then groups carries every
+fact row through each join. Grouping the fact rows first, by the columns the
+joins and the grouping read from them, gives the same result for sums,
+counts, minimums and maximums: a dimension row matching a group matches each
+of its rows, so each partial is repeated as often as the rows it stands for,
+and the partials are then combined with their decomposed function."""
+from typing import Dict, List, Optional, Set
+
+from preql.core.enums import DECOMPOSABLE_AGGREGATES, JoinType
+from preql.core.models import CTE, Concept, Function, Grain, Join, QueryDatasource
+from preql.utility import string_to_hash, unique
+
+
+def decomposable(concept: Concept, fact: CTE, cte: CTE) -> bool:
+    """An aggregate computed in the CTE from columns of the fact side only."""
+    if not isinstance(concept.lineage, Function):
+        return False
+    if concept.lineage.operator not in DECOMPOSABLE_AGGREGATES:
+        return False
+    arguments = concept.lineage.arguments
+    return bool(arguments) and all(
+        isinstance(arg, Concept)
+        and not arg.lineage
+        and cte.source_map.get(arg.address) == fact.name
+        for arg in arguments
+    )
+
+
+def partial_aggregate(cte: CTE, grain: Grain) -> Optional[CTE]:
+    """The fact CTE grouped to the columns the CTE reads from it other than
+    aggregate inputs, when grouping there first cannot change the result."""
+    if not cte.group_to_grain or not cte.joins:
+        return None
+    fact = cte.joins[0].left_cte
+    if any(join.right_cte.name == fact.name for join in cte.joins):
+        return None
+    # outer joins that keep unmatched dimension rows would turn a count of
+    # zero into a null
+    if any(
+        join.jointype not in (JoinType.LEFT_OUTER, JoinType.INNER) for join in cte.joins
+    ):
+        return None
+    aggregates: List[Concept] = []
+    keys: Set[str] = set()
+    for concept in cte.output_columns:
+        if concept.address in cte.source_map:
+            if cte.source_map[concept.address] == fact.name:
+                keys.add(concept.address)
+        elif decomposable(concept, fact, cte):
+            aggregates.append(concept)
+        else:
+            return None
+    if not aggregates:
+        return None
+    for join in cte.joins:
+        if join.left_cte.name == fact.name:
+            keys |= set(k.concept.address for k in join.joinkeys)
+    inputs = set(
+        arg.address for concept in aggregates for arg in concept.lineage.arguments
+    )
+    read = set(a for a, source in cte.source_map.items() if source == fact.name)
+    if read - keys - inputs:
+        return None
+    outputs = {c.address: c for c in fact.output_columns}
+    if not all(address in outputs for address in keys | inputs):
+        return None
+    key_concepts = [outputs[address] for address in sorted(keys)]
+    partial_grain = Grain(components=key_concepts)
+    # nothing to gain when the fact side is already at the key grain, and a
+    # partial the final select could read from at the query grain would be
+    # taken for the full aggregate
+    if fact.grain.issubset(partial_grain) or partial_grain.issubset(grain):
+        return None
+    source = QueryDatasource(
+        input_concepts=key_concepts + [outputs[address] for address in sorted(inputs)],
+        output_concepts=key_concepts + aggregates,
+        source_map={address: {fact.source} for address in keys | inputs},
+        datasources=[fact.source],
+        grain=partial_grain,
+        joins=[],
+    )
+    human_id = source.identifier.replace("<", "").replace(">", "").replace(",", "_")
+    return CTE(
+        name=f"cte_{human_id}_{string_to_hash(source.identifier)}",
+        source=source,
+        output_columns=[c.with_grain(partial_grain) for c in source.output_concepts],
+        source_map={address: fact.name for address in keys | inputs},
+        related_columns=source.input_concepts,
+        filter_columns=[],
+        grain=partial_grain,
+        group_to_grain=True,
+        parent_ctes=[fact],
+    )
+
+
+def eager_aggregate(ctes: List[CTE], grain: Grain) -> List[CTE]:
+    """Read the aggregates of each grouping CTE that joins raw fact rows from
+    a partial aggregate of the fact side instead, given the query grain.
+    Returns the CTEs with the partials added before their readers."""
+    partials: Dict[str, CTE] = {}
+    output: List[CTE] = []
+    for cte in ctes:
+        partial = partial_aggregate(cte, grain)
+        if partial is None:
+            output.append(cte)
+            continue
+        fact = cte.joins[0].left_cte
+        if partial.name in partials:
+            partial = partials[partial.name] + partial
+        else:
+            partials[partial.name] = partial
+            output.append(partial)
+        read = [c.address for c in partial.output_columns]
+        cte.source_map = {
+            address: partial.name if address in read else source
+            for address, source in cte.source_map.items()
+            if source != fact.name or address in read
+        }
+        for concept in cte.output_columns:
+            if concept.address in read:
+                cte.source_map[concept.address] = partial.name
+        cte.parent_ctes = unique(
+            [partial if p.name == fact.name else p for p in cte.parent_ctes], "name"
+        )
+        cte.joins = [
+            (
+                Join(
+                    left_cte=partial,
+                    right_cte=join.right_cte,
+                    joinkeys=join.joinkeys,
+                    jointype=join.jointype,
+                )
+                if join.left_cte.name == fact.name
+                else join
+            )
+            for join in cte.joins
+        ]
+        output.append(cte)
+    return output
@@ -0,0 +1,107 @@
+"""Removing joins, and the CTEs behind them, that cannot change a result.
+
+A left outer join keeps every row of its left side, and adds at most one
+match per row when the right side is unique on the join keys, which holds
+when its grain is made up of join keys. If nothing is then read from the
+right side, the join does nothing."""
+from typing import List, Set
+
+from preql.core.enums import JoinType
+from preql.core.models import CTE, Grain, Join, Select
+
+
+def unique_on(cte: CTE, join: Join) -> bool:
+    # an abstract grain says nothing of uniqueness, unless the CTE is
+    # aggregated down to it, and so to a single row
+    if not cte.grain.components:
+        return cte.group_to_grain
+    keys = set(k.concept.address for k in join.joinkeys)
+    return all(c.address in keys for c in cte.grain.components)
+
+
+def first_providers(addresses: List[str], ctes: List[CTE], grain: Grain) -> Set[str]:
+    """Names of the CTEs the final select reads each address from; the first
+    CTE at or below the query grain that outputs it."""
+    output: Set[str] = set()
+    candidates = [cte for cte in ctes if cte.grain.issubset(grain)]
+    for address in addresses:
+        for cte in candidates:
+            if address in [c.address for c in cte.output_columns]:
+                output.add(cte.name)
+                break
+    return output
+
+
+def reachable(base: CTE, joins: List[Join], ctes: List[CTE]) -> Set[str]:
+    """Names of the CTEs the final select reads from, directly or through
+    other CTEs."""
+    by_name = {cte.name: cte for cte in ctes}
+    pending = [base.name] + [join.right_cte.name for join in joins]
+    found: Set[str] = set()
+    while pending:
+        name = pending.pop()
+        if name in found or name not in by_name:
+            continue
+        found.add(name)
+        cte = by_name[name]
+        pending += [p.name for p in cte.parent_ctes]
+        for join in cte.joins:
+            pending += [join.left_cte.name, join.right_cte.name]
+    return found
+
+
+def eliminate_cte_joins(cte: CTE):
+    """Drop joins inside a CTE to parents nothing is read from."""
+    used = set(cte.source_map.values())
+    base = cte.base_name
+    for join in list(cte.joins):
+        right = join.right_cte
+        if (
+            join.jointype != JoinType.LEFT_OUTER
+            or right.name in used
+            or not unique_on(right, join)
+            or any(j.left_cte.name == right.name for j in cte.joins)
+        ):
+            continue
+        joins = [j for j in cte.joins if j is not join]
+        parents = [p for p in cte.parent_ctes if p.name != right.name]
+        # the table read from must stay the same
+        if joins and joins[0].left_cte.name != base:
+            continue
+        if not joins and (not parents or parents[0].name != base):
+            continue
+        cte.joins = joins
+        cte.parent_ctes = parents
+
+
+def eliminate_joins(
+    statement: Select, base: CTE, joins: List[Join], ctes: List[CTE]
+) -> List[Join]:
+    """Remove final joins that add no column to the query, and then the CTEs
+    nothing reads from any longer, in place. Returns the joins kept."""
+    before = reachable(base, joins, ctes)
+    for cte in ctes:
+        eliminate_cte_joins(cte)
+    selected = [c.address for c in statement.output_components]
+    if statement.order_by:
+        selected += [item.expr.address for item in statement.order_by.items]
+    needed = first_providers(selected, ctes, statement.grain)
+    if statement.where_clause:
+        filtered = set(c.address for c in statement.where_clause.input)
+        needed |= set(
+            cte.name
+            for cte in ctes
+            if any(c.address in filtered for c in cte.output_columns)
+        )
+    kept = [
+        join
+        for join in joins
+        if join.right_cte.name in needed
+        or join.jointype != JoinType.LEFT_OUTER
+        # joins from a base below the query grain are rendered as full joins
+        or base.grain != statement.grain
+        or not unique_on(join.right_cte, join)
+    ]
+    after = reachable(base, kept, ctes)
+    ctes[:] = [cte for cte in ctes if cte.name in after or cte.name not in before]
+    return kept
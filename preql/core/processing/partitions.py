@@ -0,0 +1,124 @@
+"""Choosing the partitions of a partitioned datasource a query must read."""
+from datetime import date, datetime, time
+from typing import Any, List, Optional, Tuple
+
+from preql.core.enums import ComparisonOperator, DataType
+from preql.core.models import Comparison, Concept, Datasource, Expr, Partition
+from preql.core.processing.predicates import Predicate, conjuncts
+
+FLIPPED = {
+    ComparisonOperator.LT: ComparisonOperator.GT,
+    ComparisonOperator.GT: ComparisonOperator.LT,
+    ComparisonOperator.LTE: ComparisonOperator.GTE,
+    ComparisonOperator.GTE: ComparisonOperator.LTE,
+}
+
+
+def literal_comparison(
+    predicate: Predicate, concept: Concept
+) -> Optional[Tuple[ComparisonOperator, Any]]:
+    """The operator and value of a comparison of the concept to a literal,
+    with the concept on the left."""
+    if not isinstance(predicate, Comparison):
+        return None
+    operator = ComparisonOperator(getattr(predicate.operator, "value", None))
+    sides = [predicate.left, predicate.right]
+    if isinstance(sides[1], Concept) and sides[1].address == concept.address:
+        sides.reverse()
+        operator = FLIPPED.get(operator, operator)
+    left, right = sides
+    if not isinstance(left, Concept) or left.address != concept.address:
+        return None
+    if isinstance(right, (Concept, Expr, Comparison)):
+        return None
+    return operator, right
+
+
+def value_range(value: Any, datatype: DataType) -> Optional[Tuple[Any, Any]]:
+    """The least and greatest values of the datatype a literal or partition
+    bound stands for, or None if it is not a value of the datatype. A date
+    stands for every instant of its day, as a datetime column holds any time
+    on the last day of a partition that ends on that date."""
+    if datatype in (DataType.INTEGER, DataType.FLOAT, DataType.NUMBER):
+        if isinstance(value, str):
+            for parse in (int, float):
+                try:
+                    return parse(value), parse(value)
+                except ValueError:
+                    continue
+            return None
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return value, value
+        return None
+    if datatype in (DataType.DATE, DataType.DATETIME, DataType.TIMESTAMP):
+        if isinstance(value, str):
+            try:
+                value = date.fromisoformat(value)
+            except ValueError:
+                try:
+                    value = datetime.fromisoformat(value)
+                except ValueError:
+                    return None
+        if isinstance(value, datetime):
+            return value, value
+        if isinstance(value, date):
+            return datetime.combine(value, time.min), datetime.combine(value, time.max)
+        return None
+    if datatype == DataType.STRING and isinstance(value, str):
+        return value, value
+    return None
+
+
+def may_match(
+    partition: Partition, operator: ComparisonOperator, value: Any, datatype: DataType
+) -> bool:
+    """Whether rows of the partition can pass the comparison, compared as the
+    datatype of the partition concept; a value that cannot be compared with
+    the bounds as that datatype rules nothing out."""
+    values = value if operator == ComparisonOperator.IN else [value]
+    ranges = [
+        value_range(v, datatype) for v in [partition.start, partition.end, *values]
+    ]
+    known = [r for r in ranges if r is not None]
+    if len(known) < len(ranges) or len(known) < 3:
+        return True
+    (low, _), (_, high), (least, greatest) = known[:3]
+    try:
+        if operator == ComparisonOperator.EQ:
+            return low <= greatest and least <= high
+        elif operator == ComparisonOperator.NE:
+            return not low == high == least == greatest
+        elif operator == ComparisonOperator.GT:
+            return high > least
+        elif operator == ComparisonOperator.GTE:
+            return high >= least
+        elif operator == ComparisonOperator.LT:
+            return low < greatest
+        elif operator == ComparisonOperator.LTE:
+            return low <= greatest
+        elif operator == ComparisonOperator.IN:
+            return any(low <= each[1] and each[0] <= high for each in known[2:])
+    except TypeError:
+        # such as a timezone aware value against naive bounds
+        pass
+    return True
+
+
+def prune_partitions(
+    datasource: Datasource, predicates: List[Predicate]
+) -> List[Partition]:
+    """The partitions holding rows that can pass all of the predicates."""
+    comparisons = []
+    for predicate in predicates:
+        for part in conjuncts(predicate):
+            comparison = literal_comparison(part, datasource.partition_by)
+            if comparison:
+                comparisons.append(comparison)
+    return [
+        partition
+        for partition in datasource.partitions
+        if all(
+            may_match(partition, operator, value, datasource.partition_by.datatype)
+            for operator, value in comparisons
+        )
+    ]
@@ -0,0 +1,88 @@
+"""Splitting WHERE clauses and pushing their parts toward the source CTEs."""
+from collections import defaultdict
+from typing import Dict, List, Union
+
+from preql.core.enums import BooleanOperator, LogicalOperator, PurposeLineage
+from preql.core.models import CTE, Comparison, Concept, Conditional, Expr
+
+Predicate = Union[Comparison, Conditional, Concept, Expr]
+
+
+def conjuncts(predicate: Predicate) -> List[Predicate]:
+    """The parts of a predicate that must all hold, in order."""
+    if isinstance(predicate, Conditional) and predicate.operator in (
+        BooleanOperator.AND,
+        LogicalOperator.AND,
+    ):
+        return conjuncts(predicate.left) + conjuncts(predicate.right)
+    return [predicate]
+
+
+def predicate_input(predicate: Predicate) -> List[Concept]:
+    if isinstance(predicate, Concept):
+        return [predicate]
+    return predicate.input
+
+
+def is_pushable(predicate: Predicate) -> bool:
+    """Comparisons of row level values. Every comparison operator is false
+    for a null, so rows a pushed filter turns into nulls through an outer
+    join are still removed where the full filter applies."""
+    if not isinstance(predicate, Comparison):
+        return False
+    inputs = predicate.input
+    return bool(inputs) and all(
+        c.derivation not in (PurposeLineage.AGGREGATE, PurposeLineage.WINDOW)
+        for c in inputs
+    )
+
+
+def pushdown_targets(
+    predicate: Predicate, applied: List[str], ctes: List[CTE]
+) -> List[CTE]:
+    """The CTEs a predicate can also be applied in, in query order, given the
+    names of the CTEs it already applies in.
+
+    A CTE qualifies once every CTE reading from it applies the predicate and
+    takes all of the predicate inputs from it, so rows it removes would be
+    removed downstream anyway. When it groups, the inputs must be part of its
+    grain, so removing rows there removes whole groups."""
+    if not is_pushable(predicate):
+        return []
+    addresses = [c.address for c in predicate_input(predicate)]
+    return restriction_targets(addresses, applied, ctes)
+
+
+def restriction_targets(
+    addresses: List[str], applied: List[str], ctes: List[CTE]
+) -> List[CTE]:
+    """The CTEs a restriction on the values of the concepts at the addresses
+    can also be applied in, in query order, given the names of the CTEs it
+    already holds in; see pushdown_targets."""
+    applying = set(applied)
+    targets: List[CTE] = []
+    readers: Dict[str, List[CTE]] = defaultdict(list)
+    for cte in ctes:
+        for parent in cte.parent_ctes:
+            readers[parent.name].append(cte)
+    changed = True
+    while changed:
+        changed = False
+        for cte in ctes:
+            if cte.name in applying or not readers[cte.name]:
+                continue
+            if not all(
+                reader.name in applying
+                and all(reader.source_map.get(a) == cte.name for a in addresses)
+                for reader in readers[cte.name]
+            ):
+                continue
+            outputs = [c.address for c in cte.output_columns]
+            if not all(a in outputs for a in addresses):
+                continue
+            if cte.group_to_grain and not all(a in cte.grain.set for a in addresses):
+                continue
+            applying.add(cte.name)
+            targets.append(cte)
+            changed = True
+    return targets
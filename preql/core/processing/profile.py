@@ -0,0 +1,107 @@
+"""A persistable record of which strategy resolved each concept at a grain.
+
+Resolution is deterministic for a given environment, so when a concept at a
+grain was resolved by a later strategy, every strategy before it failed. The
+planner tries the recorded strategy first and, only if it fails, goes through
+the full order, so plans are the same as without a profile. Entries are keyed
+by the concept's lineage, so concepts a select defines under a shared address
+do not share entries, and by a fingerprint of the environment, so a changed
+model or changed statistics start a fresh record."""
+import json
+import os
+from threading import Lock
+from typing import Dict, Hashable, Optional, Tuple
+
+from preql.core.models import Environment
+from preql.core.processing.cache import fingerprint
+from preql.core.statistics import datasource_fingerprint
+from preql.utility import string_to_hash
+
+PROFILE_VERSION = 1
+
+
+def environment_fingerprint(environment: Environment) -> str:
+    """Identifies the concepts, datasources and statistics planning reads."""
+    concepts = sorted(
+        (key, fingerprint(concept)) for key, concept in environment.concepts.items()
+    )
+    datasources = sorted(
+        (
+            key,
+            datasource_fingerprint(datasource),
+            fingerprint(datasource.grain),
+            repr(datasource.statistics),
+        )
+        for key, datasource in environment.datasources.items()
+    )
+    return str(string_to_hash(repr((concepts, datasources))))
+
+
+class StrategyProfile:
+    """Which strategy resolved each concept, grain and environment; shared
+    across queries, and saved to and loaded from a JSON file."""
+
+    def __init__(self, winners: Optional[Dict[str, str]] = None):
+        self.winners: Dict[str, str] = dict(winners or {})
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        # environment fingerprints by environment version
+        self._environments: Dict[int, Tuple[str, str]] = {}
+
+    def scope(self, environment: Environment) -> str:
+        """The fingerprint entries for this environment are recorded under.
+        Concepts and datasources are fingerprinted once per environment
+        version; statistics can change in place, so are checked each time."""
+        statistics = repr(
+            sorted(
+                (key, repr(datasource.statistics))
+                for key, datasource in environment.datasources.items()
+            )
+        )
+        with self._lock:
+            known = self._environments.get(environment.version)
+            if known is None or known[1] != statistics:
+                known = (environment_fingerprint(environment), statistics)
+                self._environments[environment.version] = known
+        return known[0]
+
+    @staticmethod
+    def key(scope: str, resolution: Hashable) -> str:
+        return str(string_to_hash(repr((scope, resolution))))
+
+    def preferred(self, key: str) -> Optional[str]:
+        with self._lock:
+            found = self.winners.get(key)
+            if found is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return found
+
+    def record(self, key: str, strategy: str):
+        with self._lock:
+            self.winners[key] = strategy
+
+    def save(self, path: str):
+        with self._lock:
+            payload = {"version": PROFILE_VERSION, "winners": dict(self.winners)}
+        # written aside and moved into place, so readers never see a partial file
+        temp = f"{path}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2, sort_keys=True)
+        os.replace(temp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "StrategyProfile":
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        version = payload.get("version")
+        if version != PROFILE_VERSION:
+            raise ValueError(
+                f"Unsupported strategy profile version {version}, expected {PROFILE_VERSION}"
+            )
+        return cls(payload["winners"])
+
+    def __len__(self):
+        return len(self.winners)
@@ -0,0 +1,157 @@
+"""Restricting the CTEs that feed a join to the keys of a filtered dimension."""
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Set
+
+from preql.core.models import CTE, Comparison, Concept, ProcessedQuery
+from preql.core.processing.cost import (
+    estimate_cte_rows,
+    filter_selectivity,
+    leaf_datasources,
+)
+from preql.core.processing.predicates import (
+    Predicate,
+    conjuncts,
+    is_pushable,
+    predicate_input,
+    restriction_targets,
+)
+
+# a dimension filter estimated to keep at most this share of rows is worth
+# reading the dimension for before the facts are joined and aggregated
+SEMI_JOIN_SELECTIVITY = 0.5
+
+
+@dataclass
+class SemiJoin:
+    """Keep only the rows with a key value the filtered dimension has."""
+
+    key: Concept
+    dimension: CTE
+
+
+def is_selective(target: CTE, dimension: CTE, predicates: List[Predicate]) -> bool:
+    """Whether the dimension filters remove enough keys to restrict the target
+    by. With statistics, by the estimated share of dimension rows kept and,
+    when the target has statistics too, only if fewer keys are kept than the
+    target has rows; without, equality filters are taken to be selective."""
+    leaves = leaf_datasources(dimension.source)
+    share = filter_selectivity(leaves[0], predicates) if len(leaves) == 1 else None
+    if share is None:
+        return all(
+            isinstance(part, Comparison)
+            and getattr(part.operator, "value", None) in ("=", "in")
+            for predicate in predicates
+            for part in conjuncts(predicate)
+        )
+    if share > SEMI_JOIN_SELECTIVITY:
+        return False
+    kept = estimate_cte_rows(dimension)
+    rows = estimate_cte_rows(target)
+    if kept is None or rows is None:
+        return True
+    return kept * share < rows
+
+
+def upstream(cte: CTE) -> Set[str]:
+    """Names of the CTEs the CTE reads from, directly or not."""
+    found: Set[str] = set()
+    pending = list(cte.parent_ctes)
+    while pending:
+        parent = pending.pop()
+        if parent.name not in found:
+            found.add(parent.name)
+            pending += parent.parent_ctes
+    return found
+
+
+def feeds(cte: CTE, reader: CTE, address: str, ctes: List[CTE]) -> bool:
+    """Whether the CTE is read only by the reader and can be restricted on
+    the concept at the address, the whole of each group when it groups."""
+    readers = [c for c in ctes if cte.name in [p.name for p in c.parent_ctes]]
+    if [c.name for c in readers] != [reader.name]:
+        return False
+    if address not in [c.address for c in cte.output_columns]:
+        return False
+    return not cte.group_to_grain or address in cte.grain.set
+
+
+def semi_join_reductions(
+    query: ProcessedQuery, where_assignment: Dict[str, List[Predicate]]
+) -> Dict[str, List[SemiJoin]]:
+    """The semi-joins each CTE can apply, by CTE name.
+
+    A CTE that filters on columns of a dimension it joins on a key keeps only
+    rows with a matching dimension row, as every comparison is false for the
+    nulls an outer join leaves. The dimension applies the same filters, so
+    the CTEs that feed the key to the join can keep only the keys of the
+    filtered dimension, before their rows are joined and aggregated. Of a
+    chain of such CTEs, the earliest is restricted."""
+    reductions: Dict[str, List[SemiJoin]] = defaultdict(list)
+    for cte in query.ctes:
+        applied = [
+            part
+            for predicate in where_assignment.get(cte.name, [])
+            for part in conjuncts(predicate)
+        ]
+        for join in cte.joins or []:
+            dimension = join.right_cte
+            filters = where_assignment.get(dimension.name, [])
+            if not filters or not all(
+                is_pushable(f)
+                and any(f is part for part in applied)
+                and all(
+                    cte.source_map.get(c.address) == dimension.name
+                    for c in predicate_input(f)
+                )
+                for f in filters
+            ):
+                continue
+            left = join.left_cte
+            # the final select needs every row of the CTEs it reads
+            skipped = upstream(dimension) | {query.base.name}
+            skipped |= {j.left_cte.name for j in query.joins}
+            skipped |= {j.right_cte.name for j in query.joins}
+            for joinkey in join.joinkeys:
+                address = joinkey.concept.address
+                if not feeds(left, cte, address, query.ctes):
+                    continue
+                targets = [left] + restriction_targets(
+                    [address], [cte.name, left.name], query.ctes
+                )
+                names = [target.name for target in targets]
+                for target in targets:
+                    if target.name in skipped or any(
+                        parent.name in names for parent in target.parent_ctes
+                    ):
+                        continue
+                    if not is_selective(target, dimension, filters):
+                        continue
+                    key = [c for c in target.output_columns if c.address == address]
+                    reductions[target.name].append(SemiJoin(key[0], dimension))
+    return dict(reductions)
+
+
+def order_ctes(ctes: List[CTE], reductions: Dict[str, List[SemiJoin]]) -> List[CTE]:
+    """The CTEs in query order, with the dimensions a CTE is restricted by
+    moved ahead of it along with what they read."""
+    if not reductions:
+        return ctes
+    by_name = {cte.name: cte for cte in ctes}
+    seen: Set[str] = set()
+    output: List[CTE] = []
+
+    def visit(name: str):
+        if name in seen or name not in by_name:
+            return
+        seen.add(name)
+        cte = by_name[name]
+        for parent in cte.parent_ctes:
+            visit(parent.name)
+        for semi_join in reductions.get(name, []):
+            visit(semi_join.dimension.name)
+        output.append(cte)
+
+    for cte in ctes:
+        visit(cte.name)
+    return output
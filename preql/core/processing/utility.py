@@ -5,7 +5,6 @@ import networkx as nx
 
 from preql.constants import logger
 from preql.core.enums import Purpose, PurposeLineage
-from preql.core.env_processor import generate_graph
 from preql.core.graph_models import ReferenceGraph, concept_to_node, datasource_to_node
 from preql.core.models import (
     Concept,
@@ -87,3 +86,32 @@ def concept_to_inputs(concept: Concept) -> List[Concept]:
         # ex: avg() of sum() @ grain
         output += concept_to_inputs(source.with_default_grain())
     return output
+
+
+def get_concept_inputs(concept: Concept, environment: Environment) -> List[Concept]:
+    """concept_to_inputs, served from the index of a frozen environment
+    when the concept is derived from a known lineage"""
+    if concept.lineage and environment.index:
+        inputs = environment.index.lineage.get(concept.address)
+        if inputs is not None:
+            return list(inputs)
+    return concept_to_inputs(concept)
+
+
+def candidate_datasources(
+    environment: Environment, concepts: List[Concept]
+) -> List[Datasource]:
+    """Datasources that may expose all of the given concepts directly.
+    Any path from a datasource to a concept without lineage ends with a column
+    for that concept, so a frozen environment can skip datasources without
+    one before searching the graph."""
+    datasources = list(environment.datasources.values())
+    if not environment.index:
+        return datasources
+    for concept in concepts:
+        if concept.lineage:
+            continue
+        exposing = environment.index.concept_datasources.get(concept.address, [])
+        exposing_ids = set(id(datasource) for datasource in exposing)
+        datasources = [d for d in datasources if id(d) in exposing_ids]
+    return datasources
@@ -1,7 +1,8 @@
 from collections import defaultdict
 from typing import List, Optional, Dict, Tuple, Union
 
-from preql.core.env_processor import generate_graph
+from preql.constants import logger
+from preql.core.env_processor import get_graph
 from preql.core.graph_models import ReferenceGraph
 from preql.core.hooks import BaseProcessingHook
 from preql.core.models import (
@@ -17,9 +18,15 @@ from preql.core.models import (
     JoinType,
     BaseJoin,
     merge_ctes,
+    unify_ctes,
 )
 from preql.core.processing.concept_strategies import get_datasource_by_concept_and_grain
-from preql.utility import string_to_hash, unique
+from preql.core.processing.cache import PlanCache
+from preql.core.processing.context import PlanningContext
+from preql.core.processing.cost import choose_base_cte
+from preql.core.processing.eager import eager_aggregate
+from preql.core.processing.elimination import eliminate_joins
+from preql.utility import DisjointSet, string_to_hash, unique
 
 
 def base_join_to_join(base_join: BaseJoin, ctes: List[CTE]) -> Join:
@@ -132,37 +139,48 @@ def datasource_to_ctes(query_datasource: QueryDatasource) -> List[CTE]:
 
 def get_disconnected_components(concept_map: Dict[str, List[Concept]]):
     """Find if any of the datasources are not linked"""
-    import networkx as nx
-
-    graph = nx.Graph()
+    sources = DisjointSet()
     for datasource, concepts in concept_map.items():
-        graph.add_node(datasource)
+        sources.add(datasource)
         for concept in concepts:
-            graph.add_edge(datasource, concept.address)
-    sub_graphs = list(nx.connected_components(graph))
-    return len(sub_graphs)
+            sources.union(datasource, concept.address)
+    return sources.components
 
 
 def get_query_datasources(
-    environment: Environment, statement: Select, graph: Optional[ReferenceGraph] = None
+    environment: Environment,
+    statement: Select,
+    graph: Optional[ReferenceGraph] = None,
+    context: Optional[PlanningContext] = None,
 ) -> Tuple[Dict[str, List[Concept]], Dict[str, Union[Datasource, QueryDatasource]]]:
     concept_map: Dict[str, List[Concept]] = defaultdict(list)
-    graph = graph or generate_graph(environment)
+    graph = graph or get_graph(environment)
+    context = context or PlanningContext()
     datasource_map: Dict[str, Union[Datasource, QueryDatasource]] = {}
     if statement.where_clause:
-        # TODO: figure out right place to group to do predicate pushdown
+        # filtered columns join the grain; the dialect pushes the filters
+        # down to the source CTEs when compiling
         statement.grain.components += statement.where_clause.input
 
+    # datasources linked through shared concepts, kept in step with the map
+    sources = DisjointSet()
     components = {False: statement.output_components + statement.grain.components}
 
     for key, concept_list in components.items():
         for concept in concept_list:
             datasource = get_datasource_by_concept_and_grain(
-                concept, statement.grain, environment, graph, whole_grain=key
+                concept,
+                statement.grain,
+                environment,
+                graph,
+                whole_grain=key,
+                context=context,
             )
 
+            sources.add(datasource.identifier)
             if concept not in concept_map[datasource.identifier]:
                 concept_map[datasource.identifier].append(concept)
+                sources.union(datasource.identifier, concept.address)
             if datasource.identifier in datasource_map:
                 # concatenate to add new fields
                 datasource_map[datasource.identifier] = (
@@ -170,18 +188,24 @@ def get_query_datasources(
                 )
             else:
                 datasource_map[datasource.identifier] = datasource
-    disconnected = get_disconnected_components(concept_map)
     # if not all datasources can ultimately be merged
-    if disconnected > 1:
+    if sources.components > 1:
         components = {True: statement.output_components + statement.grain.components}
         for key, concept_list in components.items():
             for concept in concept_list:
                 datasource = get_datasource_by_concept_and_grain(
-                    concept, statement.grain, environment, graph, whole_grain=key
+                    concept,
+                    statement.grain,
+                    environment,
+                    graph,
+                    whole_grain=key,
+                    context=context,
                 )
 
+                sources.add(datasource.identifier)
                 if concept not in concept_map[datasource.identifier]:
                     concept_map[datasource.identifier].append(concept)
+                    sources.union(datasource.identifier, concept.address)
                 if datasource.identifier in datasource_map:
                     # concatenate to add new fields
                     datasource_map[datasource.identifier] = (
@@ -190,7 +214,7 @@ def get_query_datasources(
                 else:
                     datasource_map[datasource.identifier] = datasource
             # when we have a unified graph, break the execution
-            if get_disconnected_components(concept_map) == 1:
+            if sources.components == 1:
                 break
     return concept_map, datasource_map
 
@@ -199,12 +223,28 @@ def process_query(
     environment: Environment,
     statement: Select,
     hooks: Optional[List[BaseProcessingHook]] = None,
+    context: Optional[PlanningContext] = None,
+    cache: Optional[PlanCache] = None,
 ) -> ProcessedQuery:
-    """Turn the raw query input into an instantiated execution tree."""
-    graph = generate_graph(environment)
+    """Turn the raw query input into an instantiated execution tree.
+    When a plan cache is passed, a copy of an equivalent query planned
+    against the same environment version is returned from it instead."""
+    if cache is not None:
+        key = cache.key(environment, statement)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        processed = process_query(environment, statement, hooks, context)
+        cache.store(key, processed)
+        return processed
+    graph = get_graph(environment)
+    context = context or PlanningContext()
+    if context.profile is not None and context.scope is None:
+        context.scope = context.profile.scope(environment)
     concepts, datasources = get_query_datasources(
-        environment=environment, graph=graph, statement=statement
+        environment=environment, graph=graph, statement=statement, context=context
     )
+    logger.debug(f"Planning context: {context}")
     ctes = []
     joins = []
     for datasource in datasources.values():
@@ -212,11 +252,11 @@ def process_query(
             raise ValueError("Unexpected base datasource")
         ctes += datasource_to_ctes(datasource)
 
-    final_ctes = merge_ctes(ctes)
+    final_ctes = unify_ctes(eager_aggregate(merge_ctes(ctes), statement.grain))
 
     base_list: List[CTE] = [cte for cte in final_ctes if cte.grain == statement.grain]
     if base_list:
-        base = base_list[0]
+        base = choose_base_cte(base_list)
     else:
         base_list = sorted(
             [cte for cte in ctes if cte.grain.issubset(statement.grain)],
@@ -252,6 +292,12 @@ def process_query(
                     jointype=JoinType.LEFT_OUTER,
                 )
             )
+        elif not statement.grain.components and not cte.grain.components:
+            # both are a single row at the abstract grain
+            joins.append(
+                Join(left_cte=base, right_cte=cte, joinkeys=[], jointype=JoinType.CROSS)
+            )
+    joins = eliminate_joins(statement, base, joins, final_ctes)
     return ProcessedQuery(
         order_by=statement.order_by,
         grain=statement.grain,
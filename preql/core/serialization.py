@@ -0,0 +1,165 @@
+"""Compact, versioned serialization for environments and planned queries.
+
+Models hold many equal-but-distinct concept copies (with_grain, Grain
+construction), which plain pickle writes out in full each time. Concepts
+are interned by structure into a table written once; everything else
+references them by index, and they load back as shared objects."""
+import copyreg
+import io
+import pickle
+import struct
+import threading
+from typing import Any, Dict, List
+
+from preql.core.enums import DataType, Purpose
+from preql.core.models import Concept, QueryDatasource
+
+FORMAT_MAGIC = b"PQL"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct(">3sH")
+_PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+# concepts restored so far by the `loads` call running on this thread
+_loading = threading.local()
+
+
+def _restore_concept(idx: int) -> Concept:
+    return _loading.concepts[idx]
+
+
+def _restore_query_datasource(state: Dict[str, Any]) -> QueryDatasource:
+    datasource = QueryDatasource.__new__(QueryDatasource)
+    datasource.__dict__.update(state)
+    return datasource
+
+
+def _reduce_query_datasource(datasource: QueryDatasource):
+    # a source map can hold a set containing its own datasource, and set
+    # members are hashed by identifier as soon as they are loaded; restore
+    # every other field first so the hash is computable by then
+    state = datasource.__dict__.copy()
+    source_map = state.pop("source_map")
+    return _restore_query_datasource, (state,), {"source_map": source_map}
+
+
+class _ConceptTable:
+    def __init__(self):
+        self.records: List[bytes] = []
+        self.index: Dict[bytes, int] = {}
+        # keyed by id(); the concepts are held so ids cannot be reused
+        self.memo: Dict[int, int] = {}
+        self.held: List[Concept] = []
+        # one reusable pickler per nesting depth of concept records
+        self.picklers: List["_Pickler"] = []
+        self.depth = 0
+
+    def intern(self, concept: Concept) -> int:
+        existing = self.memo.get(id(concept))
+        if existing is not None:
+            return existing
+        # child concepts (lineage, keys, grain) are interned while encoding
+        # the record, so they always precede their parent in the table
+        record = self.encode(
+            (
+                concept.name,
+                concept.datatype.value,
+                concept.purpose.value,
+                concept.namespace,
+                concept.metadata,
+                concept.lineage,
+                concept.keys,
+                concept.grain,
+            )
+        )
+        idx = self.index.get(record)
+        if idx is None:
+            idx = len(self.records)
+            self.records.append(record)
+            self.index[record] = idx
+        self.memo[id(concept)] = idx
+        self.held.append(concept)
+        return idx
+
+    def encode(self, obj: Any) -> bytes:
+        if self.depth == len(self.picklers):
+            self.picklers.append(_Pickler(io.BytesIO(), self))
+        pickler = self.picklers[self.depth]
+        self.depth += 1
+        try:
+            pickler.clear_memo()
+            pickler.buffer.seek(0)
+            pickler.buffer.truncate()
+            pickler.dump(obj)
+            return pickler.buffer.getvalue()
+        finally:
+            self.depth -= 1
+
+
+class _Pickler(pickle.Pickler):
+    def __init__(self, file, table: _ConceptTable):
+        super().__init__(file, protocol=_PROTOCOL)
+        self.buffer = file
+        self.table = table
+        # a per-type reducer is only invoked for concepts, unlike
+        # persistent_id which is called for every object written
+        self.dispatch_table = copyreg.dispatch_table.copy()
+        self.dispatch_table[Concept] = self.reduce_concept
+        self.dispatch_table[QueryDatasource] = _reduce_query_datasource
+
+    def reduce_concept(self, concept: Concept):
+        return _restore_concept, (self.table.intern(concept),)
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize an object graph (Environment, Select, ProcessedQuery, CTE,
+    QueryDatasource...) to the compact format."""
+    table = _ConceptTable()
+    payload = table.encode(obj)
+    body = pickle.dumps((table.records, payload), protocol=_PROTOCOL)
+    return _HEADER.pack(FORMAT_MAGIC, FORMAT_VERSION) + body
+
+
+def loads(data: bytes) -> Any:
+    """Restore an object graph written by `dumps`."""
+    if len(data) < _HEADER.size:
+        raise ValueError("Truncated preql serialization payload")
+    magic, version = _HEADER.unpack_from(data)
+    if magic != FORMAT_MAGIC:
+        raise ValueError("Not a preql serialization payload")
+    if version != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported preql serialization version {version}, expected {FORMAT_VERSION}"
+        )
+    records, payload = pickle.loads(data[_HEADER.size :])
+    concepts: List[Concept] = []
+    previous = getattr(_loading, "concepts", None)
+    _loading.concepts = concepts
+    try:
+        for record in records:
+            (
+                name,
+                datatype,
+                purpose,
+                namespace,
+                metadata,
+                lineage,
+                keys,
+                grain,
+            ) = pickle.loads(record)
+            # every concept was validated when first built; skip re-validation
+            concepts.append(
+                Concept.construct(
+                    name=name,
+                    datatype=DataType(datatype),
+                    purpose=Purpose(purpose),
+                    namespace=namespace,
+                    metadata=metadata,
+                    lineage=lineage,
+                    keys=keys,
+                    grain=grain,
+                )
+            )
+        return pickle.loads(payload)
+    finally:
+        _loading.concepts = previous
@@ -0,0 +1,86 @@
+"""Versioned local storage for collected datasource statistics.
+
+Entries are keyed by the datasource key in the environment, and carry a
+fingerprint of the datasource address and columns so statistics gathered
+for an earlier definition are not applied to a changed one."""
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from preql.core.models import Datasource, DatasourceStatistics
+from preql.utility import string_to_hash
+
+STATISTICS_VERSION = 1
+
+
+@dataclass
+class StatisticsEntry:
+    fingerprint: str
+    collected_at: float
+    statistics: DatasourceStatistics
+
+
+def datasource_fingerprint(datasource: Datasource) -> str:
+    columns = ",".join(
+        f"{c.alias}:{c.concept.address}:{c.concept.datatype.value}"
+        for c in datasource.columns
+    )
+    return str(string_to_hash(f"{datasource.safe_location}|{columns}"))
+
+
+def read_statistics(path: str) -> Dict[str, StatisticsEntry]:
+    with open(path, "r", encoding="utf-8") as f:
+        payload = json.load(f)
+    version = payload.get("version")
+    if version != STATISTICS_VERSION:
+        raise ValueError(
+            f"Unsupported statistics file version {version}, expected {STATISTICS_VERSION}"
+        )
+    output = {}
+    for key, entry in payload["datasources"].items():
+        output[key] = StatisticsEntry(
+            fingerprint=entry["fingerprint"],
+            collected_at=entry["collected_at"],
+            statistics=DatasourceStatistics(
+                row_count=entry["row_count"],
+                distinct_counts=entry["distinct_counts"],
+                unique_columns=entry["unique_columns"],
+                ranges=entry["ranges"],
+            ),
+        )
+    return output
+
+
+def write_statistics(path: str, entries: Dict[str, StatisticsEntry]):
+    payload = {
+        "version": STATISTICS_VERSION,
+        "datasources": {
+            key: {
+                "fingerprint": entry.fingerprint,
+                "collected_at": entry.collected_at,
+                "row_count": entry.statistics.row_count,
+                "distinct_counts": entry.statistics.distinct_counts,
+                "unique_columns": entry.statistics.unique_columns,
+                "ranges": entry.statistics.ranges,
+            }
+            for key, entry in entries.items()
+        },
+    }
+    # written aside and moved into place, so readers never see a partial file
+    temp = f"{path}.tmp"
+    with open(temp, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, sort_keys=True, default=str)
+    os.replace(temp, path)
+
+
+def is_current(
+    entry: Optional[StatisticsEntry],
+    datasource: Datasource,
+    now: float,
+    max_age: Optional[float] = None,
+) -> bool:
+    """Whether an entry still describes the datasource and is recent enough."""
+    if entry is None or entry.fingerprint != datasource_fingerprint(datasource):
+        return False
+    return max_age is None or now - entry.collected_at <= max_age
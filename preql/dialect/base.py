@@ -1,13 +1,15 @@
+from collections import defaultdict
 from typing import List, Union, Optional, Dict
 
 from jinja2 import Template
 
 from preql.core.enums import FunctionType, WindowType, PurposeLineage, JoinType
 from preql.core.hooks import BaseProcessingHook
-from preql.core.enums import Purpose, DataType
+from preql.core.enums import DECOMPOSABLE_AGGREGATES, Purpose, DataType
 from preql.core.models import (
     Concept,
     CTE,
+    Datasource,
     ProcessedQuery,
     CompiledCTE,
     Conditional,
@@ -16,8 +18,27 @@ from preql.core.models import (
     Function,
     OrderItem,
     WindowItem,
+    union_location,
 )
 from preql.core.models import Environment, Select
+from preql.core.parallel import plan_in_parallel
+from preql.core.processing.cache import PlanCache
+from preql.core.processing.context import PlanningBudget, PlanningContext
+from preql.core.processing.profile import StrategyProfile
+from preql.core.processing.reduction import (
+    SemiJoin,
+    order_ctes,
+    semi_join_reductions,
+)
+from preql.core.processing.elimination import unique_on
+from preql.core.processing.partitions import prune_partitions
+from preql.core.processing.predicates import (
+    Predicate,
+    conjuncts,
+    is_pushable,
+    predicate_input,
+    pushdown_targets,
+)
 from preql.core.query_processor import process_query
 from preql.dialect.common import render_join
 from preql.utility import unique
@@ -98,6 +119,10 @@ ORDER BY {% for order in order_by %}
 )
 
 
+# column types collected with min and max values
+RANGE_DATATYPES = (DataType.DATE, DataType.DATETIME, DataType.TIMESTAMP)
+
+
 def check_lineage(c: Concept, cte: CTE) -> bool:
     checks = []
     if not c.lineage:
@@ -114,6 +139,32 @@ def check_lineage(c: Concept, cte: CTE) -> bool:
     return all(checks)
 
 
+def is_stored_aggregate(c: Concept, cte: CTE) -> bool:
+    """Whether the CTE reads a decomposable aggregate from a datasource
+    column, such as a metric on a pre-aggregated table, or an output it
+    does not group by from a parent CTE that aggregated it."""
+    if not isinstance(c.lineage, Function):
+        return False
+    if c.lineage.operator not in DECOMPOSABLE_AGGREGATES:
+        return False
+    for parent in cte.parent_ctes:
+        if parent.name == cte.source_map.get(c.address):
+            return (
+                parent.group_to_grain
+                and c.address in [x.address for x in parent.output_columns]
+                and c.address in [x.address for x in cte.output_columns]
+                and c.address not in cte.grain.set
+            )
+    if len(cte.source.datasources) != 1:
+        return False
+    source = cte.source.datasources[0]
+    return (
+        isinstance(source, Datasource)
+        and cte.source_map.get(c.address) == source.identifier
+        and c.address in [x.address for x in source.concepts]
+    )
+
+
 def safe_quote(string: str, quote_char: str):
     # split dotted identifiers
     # TODO: evaluate if we need smarter parsing for strings that could actually include .
@@ -128,6 +179,24 @@ class BaseDialect:
     QUOTE_CHARACTER = "`"
     SQL_TEMPLATE = GENERIC_SQL_TEMPLATE
     DATATYPE_MAP = DATATYPE_MAP
+    # distinct count used when collecting statistics; approximate where supported
+    DISTINCT_ESTIMATE_TEMPLATE = "count(distinct {})"
+
+    def compile_statistics_query(self, datasource: Datasource) -> str:
+        """One pass over a datasource: the row count, then a distinct count
+        for each column, then min and max for each date column, in column
+        order."""
+        select_columns = ["count(*)"]
+        ranges = []
+        for column in datasource.columns:
+            reference = safe_quote(column.alias, self.QUOTE_CHARACTER)
+            select_columns.append(self.DISTINCT_ESTIMATE_TEMPLATE.format(reference))
+            if column.concept.datatype in RANGE_DATATYPES:
+                ranges += [f"min({reference})", f"max({reference})"]
+        return (
+            f"SELECT {', '.join(select_columns + ranges)} "
+            f"FROM {datasource.safe_location}"
+        )
 
     def render_order_item(self, order_item: OrderItem, ctes: List[CTE]) -> str:
         matched_ctes = [
@@ -177,6 +246,14 @@ class BaseDialect:
                     rval = f"{FUNCTION_MAP[c.lineage.operator](args)}"
                 else:
                     rval = f"{FUNCTION_GRAIN_MATCH_MAP[c.lineage.operator](args)}"
+        # a stored aggregate, combined again when grouping to a coarser grain
+        elif c.lineage and is_stored_aggregate(c, cte):
+            source = cte.source_map[c.address]
+            column = c.safe_address if source.startswith("cte") else cte.get_alias(c)
+            rval = f"{source}.{safe_quote(column, self.QUOTE_CHARACTER)}"
+            if cte.group_to_grain:
+                operator = DECOMPOSABLE_AGGREGATES[c.lineage.operator]
+                rval = self.FUNCTION_MAP[operator]([rval])
         # else if it's complex, just reference it from the source
         elif c.lineage:
             rval = f"{cte.source_map.get(c.address, INVALID_REFERENCE_STRING)}.{safe_quote(c.safe_address, self.QUOTE_CHARACTER)}"
@@ -215,10 +292,136 @@ class BaseDialect:
             return f"'{e}'"
         return str(e)
 
-    def generate_ctes(
-        self, query: ProcessedQuery, where_assignment: Dict[str, Conditional]
+    def push_down_predicates(
+        self, query: ProcessedQuery, where_assignment: Dict[str, List[Predicate]]
+    ):
+        """Also apply each filtering comparison in the CTEs that feed the
+        filtered ones, so rows are removed before they are joined and
+        aggregated.
+
+        Every row of the final select passes the filter, so a CTE joined to it
+        on keys that include the compared columns can apply it as well, and
+        the CTEs feeding that one in turn."""
+        assigned = list(where_assignment.items())
+        for name, predicates in assigned:
+            for predicate in predicates:
+                for part in conjuncts(predicate):
+                    if not is_pushable(part):
+                        continue
+                    addresses = [c.address for c in predicate_input(part)]
+                    applied = [name] + [
+                        join.right_cte.name
+                        for join in query.joins
+                        if all(
+                            a in [k.concept.address for k in join.joinkeys]
+                            for a in addresses
+                        )
+                        and (
+                            not join.right_cte.group_to_grain
+                            or all(a in join.right_cte.grain.set for a in addresses)
+                        )
+                    ]
+                    for target_name in applied[1:]:
+                        self.add_predicate(where_assignment, target_name, part)
+                    for target in pushdown_targets(part, applied, query.ctes):
+                        self.add_predicate(where_assignment, target.name, part)
+
+    @staticmethod
+    def add_predicate(
+        where_assignment: Dict[str, List[Predicate]], name: str, predicate: Predicate
     ):
+        existing = where_assignment.setdefault(name, [])
+        if not any(predicate is x for x in existing):
+            existing.append(predicate)
+
+    def render_predicates(self, predicates: List[Predicate], cte: CTE) -> str:
+        if len(predicates) == 1:
+            return self.render_expr(predicates[0], cte)
+        return " AND ".join(
+            f"({self.render_expr(p, cte)})"
+            if isinstance(p, Conditional)
+            else self.render_expr(p, cte)
+            for p in predicates
+        )
+
+    def render_semi_join(self, semi_join: SemiJoin, cte: CTE) -> str:
+        key = safe_quote(semi_join.key.safe_address, self.QUOTE_CHARACTER)
+        dimension = semi_join.dimension.name
+        return (
+            f"{self.render_concept_sql(semi_join.key, cte, alias=False)} IN "
+            f"(SELECT {dimension}.{key} FROM {dimension})"
+        )
+
+    def render_where(
+        self, cte: CTE, predicates: List[Predicate], semi_joins: List[SemiJoin]
+    ) -> Optional[str]:
+        if not semi_joins:
+            return self.render_predicates(predicates, cte) if predicates else None
+        rendered = [self.render_predicates(predicates, cte)] if predicates else []
+        rendered += [self.render_semi_join(s, cte) for s in semi_joins]
+        if len(rendered) == 1:
+            return rendered[0]
+        return " AND ".join(f"({r})" for r in rendered)
+
+    def limit_target(
+        self, query: ProcessedQuery, join_types: List[JoinType], output_where: bool
+    ) -> Optional[CTE]:
+        """The CTE the query limit, and its ordering, can also be applied in.
 
+        When every final join adds at most one row to each base row and
+        nothing filters the joined rows, the final rows are the base rows, so
+        the first rows of the base in the same order are the rows returned."""
+        base = query.base
+        if query.limit is None or output_where:
+            return None
+        if not all(
+            jointype == JoinType.LEFT_OUTER
+            and join.left_cte.name == base.name
+            and unique_on(join.right_cte, join)
+            for join, jointype in zip(query.joins, join_types)
+        ):
+            return None
+        # other readers of the base need all of its rows
+        for cte in query.ctes:
+            read = [p.name for p in cte.parent_ctes]
+            read += [j.left_cte.name for j in cte.joins]
+            read += [j.right_cte.name for j in cte.joins]
+            if base.name in read:
+                return None
+        output_ctes = [cte for cte in query.ctes if cte.grain.issubset(query.grain)]
+        for item in query.order_by.items if query.order_by else []:
+            matched = [
+                cte
+                for cte in output_ctes
+                if item.expr.address in [c.address for c in cte.output_columns]
+            ]
+            if not matched or matched[0].name != base.name:
+                return None
+        return base
+
+    def render_source(self, cte: CTE, predicates: List[Predicate]) -> str:
+        """What a CTE selects from; of a partitioned datasource, only the
+        partitions with rows that can pass the CTE filters."""
+        datasources = cte.source.datasources
+        if (
+            len(datasources) == 1
+            and isinstance(datasources[0], Datasource)
+            and datasources[0].partitions
+        ):
+            partitions = prune_partitions(datasources[0], predicates)
+            # the filters still apply, so any one partition returns no rows
+            partitions = partitions or datasources[0].partitions[:1]
+            return union_location([p.address for p in partitions])
+        return cte.base_name
+
+    def generate_ctes(
+        self,
+        query: ProcessedQuery,
+        where_assignment: Dict[str, List[Predicate]],
+        limited: Optional[CTE] = None,
+        reductions: Optional[Dict[str, List[SemiJoin]]] = None,
+    ):
+        reductions = reductions or {}
         return [
             CompiledCTE(
                 name=cte.name,
@@ -226,16 +429,24 @@ class BaseDialect:
                     select_columns=[
                         self.render_concept_sql(c, cte) for c in cte.output_columns
                     ],
-                    base=f"{cte.base_name} as {cte.base_alias}",
+                    base=f"{self.render_source(cte, where_assignment.get(cte.name, []))} as {cte.base_alias}",
                     grain=cte.grain,
-                    limit=None,
+                    limit=query.limit if cte is limited else None,
+                    order_by=[
+                        f"{self.render_concept_sql(i.expr, cte, alias=False)} {i.order.value}"
+                        for i in query.order_by.items
+                    ]
+                    if cte is limited and query.order_by
+                    else None,
                     joins=[
                         render_join(join, self.QUOTE_CHARACTER)
                         for join in (cte.joins or [])
                     ],
-                    where=self.render_expr(where_assignment[cte.name], cte)
-                    if cte.name in where_assignment
-                    else None,
+                    where=self.render_where(
+                        cte,
+                        where_assignment.get(cte.name, []),
+                        reductions.get(cte.name, []),
+                    ),
                     group_by=[
                         self.render_concept_sql(c, cte, alias=False)
                         for c in unique(
@@ -253,7 +464,7 @@ class BaseDialect:
                     else None,
                 ),
             )
-            for cte in query.ctes
+            for cte in order_ctes(query.ctes, reductions)
         ]
 
     def generate_queries(
@@ -261,11 +472,41 @@ class BaseDialect:
         environment: Environment,
         statements,
         hooks: Optional[List[BaseProcessingHook]] = None,
+        cache: Optional[PlanCache] = None,
+        budget: Optional[PlanningBudget] = None,
+        profile: Optional[StrategyProfile] = None,
+        workers: Optional[int] = None,
     ) -> List[ProcessedQuery]:
+        """Plan each select; with a budget, planning any one of them raises
+        PlanningBudgetExceeded once it runs past the budget. With a strategy
+        profile, the strategies that resolved earlier queries are tried first,
+        and the ones that resolve these are recorded to it.
+
+        With workers, several selects are planned in that many processes
+        (all CPUs for 0), each reading its own copy of the environment;
+        plans are returned in statement order either way."""
+        selects = [s for s in statements if isinstance(s, Select)]
+        if workers is not None and len(selects) > 1:
+            return plan_in_parallel(
+                environment,
+                selects,
+                hooks,
+                cache=cache,
+                budget=budget,
+                profile=profile,
+                workers=workers,
+            )
         output = []
         for statement in statements:
             if isinstance(statement, Select):
-                output.append(process_query(environment, statement, hooks))
+                context = None
+                if budget or profile:
+                    context = PlanningContext(budget=budget, profile=profile)
+                output.append(
+                    process_query(
+                        environment, statement, hooks, context=context, cache=cache
+                    )
+                )
                 # graph = generate_graph(environment, statement)
                 # output.append(graph_to_query(environment, graph, statement))
         return output
@@ -294,7 +535,7 @@ class BaseDialect:
             )
 
         # where assignment
-        where_assignment = {}
+        where_assignment: Dict[str, List[Predicate]] = {}
         output_where = False
         if query.where_clause:
             found = False
@@ -325,30 +566,64 @@ class BaseDialect:
                         # if set([x.name for x in query.where_clause.input]).issubset(
                         #     [z.name for z in cte.related_columns]
                         # ):
-                        where_assignment[cte.name] = query.where_clause.conditional
+                        where_assignment[cte.name] = [query.where_clause.conditional]
                         found = True
                         break
+            if not found:
+                # each part of a conjunction may still be covered by a source
+                placed: Dict[str, List[Predicate]] = defaultdict(list)
+                for part in conjuncts(query.where_clause.conditional):
+                    part_filter = set(
+                        [str(x.with_grain()) for x in predicate_input(part)]
+                    )
+                    for cte in output_ctes:
+                        cte_filter = set(
+                            [str(z.with_grain()) for z in cte.output_columns]
+                        )
+                        if part_filter.issubset(cte_filter):
+                            placed[cte.name].append(part)
+                            break
+                    else:
+                        break
+                else:
+                    where_assignment = dict(placed)
+                    found = True
 
             if not found:
                 raise NotImplementedError(
                     "Cannot generate complex query with filtering on grain that does not match any source."
                 )
+        filtered = set(where_assignment)
+        self.push_down_predicates(query, where_assignment)
+        # join types are decided per compilation; the query itself
+        # is left untouched so it can be rendered again
+        join_types = []
         for join in query.joins:
 
-            if join.right_cte.name in where_assignment:
+            if join.right_cte.name in filtered:
                 # force filtering if the CTE has a where clause
-                join.jointype = JoinType.INNER
+                join_types.append(JoinType.INNER)
                 # if the left source is partial, make it a full join
             elif (
                 join.left_cte.grain.issubset(query.grain)
                 and join.left_cte.grain != query.grain
             ):
-                join.jointype = JoinType.FULL
-        compiled_ctes = self.generate_ctes(query, where_assignment)
+                join_types.append(JoinType.FULL)
+            else:
+                join_types.append(join.jointype)
+        limited = self.limit_target(query, join_types, output_where)
+        # restrict facts to the keys of selectively filtered dimensions
+        reductions = semi_join_reductions(query, where_assignment)
+        compiled_ctes = self.generate_ctes(
+            query, where_assignment, limited, reductions
+        )
         return self.SQL_TEMPLATE.render(
             select_columns=select_columns,
             base=query.base.name,
-            joins=[render_join(join, self.QUOTE_CHARACTER) for join in query.joins],
+            joins=[
+                render_join(join, self.QUOTE_CHARACTER, jointype)
+                for join, jointype in zip(query.joins, join_types)
+            ],
             ctes=compiled_ctes,
             limit=query.limit,
             # move up to CTEs
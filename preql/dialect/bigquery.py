@@ -59,3 +59,4 @@ class BigqueryDialect(BaseDialect):
     FUNCTION_GRAIN_MATCH_MAP = FUNCTION_GRAIN_MATCH_MAP
     QUOTE_CHARACTER = "`"
     SQL_TEMPLATE = BQ_SQL_TEMPLATE
+    DISTINCT_ESTIMATE_TEMPLATE = "APPROX_COUNT_DISTINCT({})"
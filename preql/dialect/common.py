@@ -1,7 +1,14 @@
+from typing import Optional
+
+from preql.core.enums import JoinType
 from preql.core.models import Join
 
 
-def render_join(join: Join, quote_character: str = '"') -> str:
+def render_join(
+    join: Join, quote_character: str = '"', jointype: Optional[JoinType] = None
+) -> str:
+    if not join.joinkeys:
+        return f"CROSS JOIN {join.right_cte.name}"
     # {% for key in join.joinkeys %}{{ key.inner }} = {{ key.outer}}{% endfor %}
     joinkeys = " AND ".join(
         [
@@ -9,4 +16,5 @@ def render_join(join: Join, quote_character: str = '"') -> str:
             for key in join.joinkeys
         ]
     )
-    return f"{join.jointype.value.upper()} JOIN {join.right_cte.name} on {joinkeys}"
+    jointype = jointype or join.jointype
+    return f"{jointype.value.upper()} JOIN {join.right_cte.name} on {joinkeys}"
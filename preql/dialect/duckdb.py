@@ -31,8 +31,6 @@ DUCKDB_TEMPLATE = Template(
 WITH {% for cte in ctes %}
 {{cte.name}} as ({{cte.statement}}){% if not loop.last %},{% endif %}{% endfor %}{% endif %}
 SELECT
-{%- if limit is not none %}
-TOP {{ limit }}{% endif %}
 {%- for select in select_columns %}
     {{ select }}{% if not loop.last %},{% endif %}{% endfor %}
 FROM
@@ -51,6 +49,8 @@ GROUP BY {% for group in group_by %}
 ORDER BY {% for order in order_by %}
     {{ order }}{% if not loop.last %},{% endif %}
 {% endfor %}{% endif %}
+{%- if limit is not none %}
+LIMIT {{ limit }}{% endif %}
 """
 )
 
@@ -61,3 +61,4 @@ class DuckDBDialect(BaseDialect):
     FUNCTION_GRAIN_MATCH_MAP = FUNCTION_GRAIN_MATCH_MAP
     QUOTE_CHARACTER = '"'
     SQL_TEMPLATE = DUCKDB_TEMPLATE
+    DISTINCT_ESTIMATE_TEMPLATE = "approx_count_distinct({})"
@@ -86,6 +86,7 @@ class SqlServerDialect(BaseDialect):
     FUNCTION_GRAIN_MATCH_MAP = FUNCTION_GRAIN_MATCH_MAP
     QUOTE_CHARACTER = '"'
     SQL_TEMPLATE = TSQL_TEMPLATE
+    DISTINCT_ESTIMATE_TEMPLATE = "APPROX_COUNT_DISTINCT({})"
 
     def compile_statement(self, query: ProcessedQuery) -> str:
         base = super().compile_statement(query)
@@ -1,9 +1,28 @@
-from typing import Optional
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Event, Lock
+from typing import Any, Dict, Optional, Set
 
-from sqlalchemy.engine import Engine, Result
+from sqlalchemy.engine import Connection, Engine, Result
 
-from preql.core.models import Environment, ProcessedQuery
-from preql.dialect.base import BaseDialect
+from preql.core.models import (
+    Datasource,
+    DatasourceStatistics,
+    Environment,
+    ProcessedQuery,
+)
+from preql.core.processing.cache import PlanCache
+from preql.core.processing.context import PlanningBudget
+from preql.core.processing.profile import StrategyProfile
+from preql.core.statistics import (
+    StatisticsEntry,
+    datasource_fingerprint,
+    is_current,
+    read_statistics,
+    write_statistics,
+)
+from preql.dialect.base import RANGE_DATATYPES, BaseDialect
 from preql.dialect.enums import Dialects
 from preql.parser import parse_text
 from typing import List
@@ -16,10 +35,19 @@ class Executor(object):
         dialect: Dialects,
         engine: Engine,
         environment: Optional[Environment] = None,
+        plan_cache: Optional[PlanCache] = None,
+        planning_budget: Optional[PlanningBudget] = None,
+        strategy_profile: Optional[StrategyProfile] = None,
+        planning_workers: Optional[int] = None,
     ):
         self.dialect = dialect
         self.engine = engine
         self.environment = environment or Environment()
+        self.plan_cache = plan_cache
+        self.planning_budget = planning_budget
+        self.strategy_profile = strategy_profile
+        # processes to plan the selects of a text in; None plans serially
+        self.planning_workers = planning_workers
         self.generator: BaseDialect
         self.logger = logger
         if self.dialect == Dialects.BIGQUERY:
@@ -44,10 +72,132 @@ class Executor(object):
 
     def execute_text(self, command: str) -> List[Result]:
         _, parsed = parse_text(command, self.environment)
-        sql = self.generator.generate_queries(self.environment, parsed)
+        sql = self.generator.generate_queries(
+            self.environment,
+            parsed,
+            cache=self.plan_cache,
+            budget=self.planning_budget,
+            profile=self.strategy_profile,
+            workers=self.planning_workers,
+        )
         output = []
         for statement in sql:
             compiled_sql = self.generator.compile_statement(statement)
             logger.debug(compiled_sql)
             output.append(self.engine.execute(compiled_sql))
         return output
+
+    def collect_statistics_for(
+        self, datasource: Datasource, connection: Optional[Connection] = None
+    ) -> DatasourceStatistics:
+        sql = self.generator.compile_statistics_query(datasource)
+        logger.debug(sql)
+        row = list((connection or self.engine).execute(sql).fetchone())
+        rows = row[0] or 0
+        distinct_counts: Dict[str, int] = {}
+        unique_columns = []
+        ranges = {}
+        offset = len(datasource.columns) + 1
+        for idx, column in enumerate(datasource.columns):
+            # approximate counts can overshoot the row count
+            distinct = min(row[idx + 1] or 0, rows)
+            distinct_counts[column.alias] = distinct
+            if rows and distinct == rows:
+                unique_columns.append(column.alias)
+            if column.concept.datatype in RANGE_DATATYPES:
+                # kept as ISO strings, as stored in the statistics file
+                ranges[column.alias] = [
+                    None if v is None else str(v) for v in row[offset : offset + 2]
+                ]
+                offset += 2
+        return DatasourceStatistics(
+            row_count=rows,
+            distinct_counts=distinct_counts,
+            unique_columns=unique_columns,
+            ranges=ranges,
+        )
+
+    def collect_statistics(
+        self,
+        path: Optional[str] = None,
+        budget: Optional[float] = None,
+        workers: int = 4,
+        refresh: bool = False,
+        max_age: Optional[float] = None,
+    ) -> Dict[str, StatisticsEntry]:
+        """Collect row counts, distinct counts and date ranges for every
+        datasource and store them in the statistics file.
+
+        Entries already current for a datasource are kept unless refresh is
+        set. Tables are queried in parallel; those not finished within the
+        budget in seconds, or that fail, keep their previous entry and are
+        picked up by the next run. Queries still running when the budget is
+        spent are interrupted where the driver supports it, as duckdb does;
+        with other drivers they run to completion before this returns, so
+        no query is left using the engine."""
+        path = path or self.environment.statistics_path
+        if not path:
+            raise ValueError(
+                "No statistics path given and the environment has no statistics_path"
+            )
+        entries = read_statistics(path) if os.path.exists(path) else {}
+        now = time.time()
+        pending = {
+            key: datasource
+            for key, datasource in self.environment.datasources.items()
+            if refresh or not is_current(entries.get(key), datasource, now, max_age)
+        }
+        # DBAPI connections of the queries running, by datasource key
+        running: Dict[str, Any] = {}
+        interrupted: Set[str] = set()
+        stopped = Event()
+        lock = Lock()
+
+        def collect(key: str, datasource: Datasource) -> DatasourceStatistics:
+            with self.engine.connect() as connection:
+                with lock:
+                    if stopped.is_set():
+                        raise TimeoutError("Statistics budget exhausted")
+                    running[key] = connection.connection
+                try:
+                    return self.collect_statistics_for(datasource, connection)
+                finally:
+                    with lock:
+                        del running[key]
+                        # an interrupt can outlive the query it was meant for
+                        if key in interrupted:
+                            connection.invalidate()
+
+        pool = ThreadPoolExecutor(max_workers=workers)
+        futures = {
+            pool.submit(collect, key, datasource): key
+            for key, datasource in pending.items()
+        }
+        done, not_done = wait(futures, timeout=budget)
+        with lock:
+            stopped.set()
+            for key, connection in running.items():
+                if hasattr(connection, "interrupt"):
+                    interrupted.add(key)
+                    connection.interrupt()
+        pool.shutdown(wait=True, cancel_futures=True)
+        for future in done:
+            key = futures[future]
+            try:
+                statistics = future.result()
+            except Exception as e:
+                logger.warning(f"Could not collect statistics for {key}: {e}")
+                continue
+            entries[key] = StatisticsEntry(
+                fingerprint=datasource_fingerprint(pending[key]),
+                collected_at=now,
+                statistics=statistics,
+            )
+        if not_done:
+            logger.warning(
+                f"Statistics budget exhausted, skipped {len(not_done)} datasources"
+            )
+        write_statistics(path, entries)
+        if not self.environment.frozen:
+            self.environment.load_statistics(path)
+        return entries
@@ -1,5 +1,5 @@
 from os.path import join, dirname
-from typing import Tuple, List, Optional
+from typing import Dict, Tuple, List, Optional
 
 from lark import Lark, Transformer, v_args
 from lark.tree import Meta
@@ -10,7 +10,11 @@ from lark.exceptions import (
     UnexpectedInput,
     UnexpectedToken,
 )
-from preql.core.exceptions import UndefinedConceptException, InvalidSyntaxException
+from preql.core.exceptions import (
+    UndefinedConceptException,
+    InvalidSyntaxException,
+    FrozenEnvironmentException,
+)
 
 from preql.core.enums import (
     Purpose,
@@ -44,6 +48,9 @@ from preql.core.models import (
     Window,
     WindowItem,
     Query,
+    Partition,
+    NamespaceMemo,
+    union_location,
 )
 from preql.parsing.exceptions import ParseError
 
@@ -67,12 +74,17 @@ grammar = r"""
     concept :  concept_declaration | concept_derivation | concept_property_declaration
     
     // datasource concepts
-    datasource : "datasource" IDENTIFIER  "("  column_assignment_list ")"  grain_clause? (address | query)
+    datasource : "datasource" IDENTIFIER  "("  column_assignment_list ")"  grain_clause? (address | query | partition_clause)
     
     grain_clause: "grain" "(" column_list ")"
     
     address: "address" IDENTIFIER
     
+    // partition by order_date ('2023-01-01' to '2023-12-31' address sales_2023, ...)
+    partition_clause: "partition"i "by"i IDENTIFIER "(" (partition ",")* partition ","? ")"
+    
+    partition: literal "to"i literal address
+    
     query: "query" MULTILINE_STRING
     
     concept_assignment: IDENTIFIER | (MODIFIER "[" concept_assignment "]" )
@@ -212,11 +224,48 @@ def parse_concept_reference(
     return lookup, namespace, name
 
 
+class SelectConcepts(dict):
+    """Concepts selects define inline, kept aside for the parse when the
+    environment is frozen; lookups fall back to the environment."""
+
+    def __init__(self, environment: Environment):
+        super().__init__()
+        self.environment = environment
+
+    def __getitem__(self, key, line_no=None):
+        if dict.__contains__(self, key):
+            return dict.__getitem__(self, key)
+        return self.environment.concepts.__getitem__(key, line_no)
+
+    def get(self, key, default=None):
+        if dict.__contains__(self, key):
+            return dict.__getitem__(self, key)
+        return self.environment.concepts.get(key, default)
+
+
 class ParseToObjects(Transformer):
-    def __init__(self, visit_tokens, text, environment: Environment):
+    def __init__(
+        self,
+        visit_tokens,
+        text,
+        environment: Environment,
+        modules: Optional[Dict[str, Environment]] = None,
+    ):
         Transformer.__init__(self, visit_tokens)
         self.text = text
         self.environment = environment
+        self.select_concepts = SelectConcepts(environment)
+        # modules parsed so far by file path, shared with the parsers of
+        # imported modules and dropped with the parse
+        self.modules: Dict[str, Environment] = {} if modules is None else modules
+
+    @property
+    def concepts(self):
+        """Where selects look up concepts and register the ones they define;
+        a frozen environment keeps the model as defined."""
+        if self.environment.frozen:
+            return self.select_concepts
+        return self.environment.concepts
 
     def start(self, args):
         return args
@@ -389,6 +438,8 @@ class ParseToObjects(Transformer):
         columns: List[ColumnAssignment] = args[1]
         grain: Optional[Grain] = None
         address: Optional[Address] = None
+        partition_by: Optional[Concept] = None
+        partitions: List[Partition] = []
         for val in args[1:]:
             if isinstance(val, Address):
                 address = val
@@ -396,10 +447,21 @@ class ParseToObjects(Transformer):
                 grain = val
             elif isinstance(val, Query):
                 address = Address(location=f"({val.text})")
+            elif isinstance(val, tuple):
+                partition_by, partitions = val
+                address = Address(
+                    location=union_location([p.address for p in partitions])
+                )
         if not address:
             raise ValueError(
                 "Malformed datasource, missing address or query declaration"
             )
+        if partition_by and partition_by.address not in [
+            c.concept.address for c in columns
+        ]:
+            raise ValueError(
+                f"Datasource {name} is partitioned by {partition_by.address}, which is not one of its columns"
+            )
         datasource = Datasource(
             identifier=name,
             columns=columns,
@@ -408,6 +470,8 @@ class ParseToObjects(Transformer):
             grain=grain,  # type: ignore
             address=address,
             namespace=self.environment.namespace,
+            partition_by=partition_by,
+            partitions=partitions,
         )
         for column in columns:
             column.concept = column.concept.with_grain(datasource.grain)
@@ -425,7 +489,7 @@ class ParseToObjects(Transformer):
         output: str = args[1]
 
         lookup, namespace, output = parse_concept_reference(output, self.environment)
-        existing = self.environment.concepts.get(lookup)
+        existing = self.concepts.get(lookup)
 
         if existing:
             raise ParseError(
@@ -447,7 +511,7 @@ class ParseToObjects(Transformer):
             keys=keys,
         )
         # We don't assign it here because we'll do this later when we know the grain
-        self.environment.concepts[lookup] = concept
+        self.concepts[lookup] = concept
         return ConceptTransform(function=function, output=concept)
 
     @v_args(meta=True)
@@ -463,9 +527,7 @@ class ParseToObjects(Transformer):
         content = args[0]
         if isinstance(content, ConceptTransform):
             return SelectItem(content=content)
-        return SelectItem(
-            content=self.environment.concepts.__getitem__(content, meta.line)
-        )
+        return SelectItem(content=self.concepts.__getitem__(content, meta.line))
 
     def select_list(self, args):
         return [arg for arg in args if arg]
@@ -482,25 +544,39 @@ class ParseToObjects(Transformer):
     def order_by(self, args):
         return OrderBy(items=args[0])
 
-    def import_statement(self, args):
-        alias = args[-1]
-        path = args[0].split(".")
-
-        target = join(self.environment.working_path, *path) + ".preql"
+    def parse_module(self, target: str, alias: str) -> Environment:
+        """The module at the path, parsed once per parse however many times
+        it is imported."""
+        if target in self.modules:
+            return self.modules[target]
         with open(target, "r", encoding="utf-8") as f:
-
             text = f.read()
         nparser = ParseToObjects(
             visit_tokens=True,
             text=text,
             environment=Environment(working_path=dirname(target), namespace=alias),
+            modules=self.modules,
         )
         nparser.transform(PARSER.parse(text))
+        self.modules[target] = nparser.environment
+        return nparser.environment
+
+    def import_statement(self, args):
+        alias = args[-1]
+        path = args[0].split(".")
 
-        for key, concept in nparser.environment.concepts.items():
-            self.environment.concepts[f"{alias}.{key}"] = concept
-        for key, datasource in nparser.environment.datasources.items():
-            self.environment.datasources[f"{alias}.{key}"] = datasource
+        target = join(self.environment.working_path, *path) + ".preql"
+        module = self.parse_module(target, alias)
+        # one memo for the module, so nodes shared in it stay shared
+        memo = NamespaceMemo(module.namespace)
+        for key, concept in module.concepts.items():
+            self.environment.concepts[f"{alias}.{key}"] = concept.with_namespace(
+                alias, memo
+            )
+        for key, datasource in module.datasources.items():
+            self.environment.datasources[f"{alias}.{key}"] = datasource.with_namespace(
+                alias, memo
+            )
         return None
 
     @v_args(meta=True)
@@ -539,7 +615,7 @@ class ParseToObjects(Transformer):
                 item.content.output = new_concept
             else:
                 raise ValueError
-            self.environment.concepts[new_concept.name] = new_concept
+            self.concepts[new_concept.name] = new_concept
         if order_by:
             for item in order_by.items:
                 if (
@@ -553,6 +629,13 @@ class ParseToObjects(Transformer):
     def address(self, meta: Meta, args):
         return Address(location=args[0])
 
+    def partition(self, args) -> Partition:
+        start, end = [str(v) if isinstance(v, str) else v for v in args[:2]]
+        return Partition(address=args[2], start=start, end=end)
+
+    def partition_clause(self, args) -> Tuple[Concept, List[Partition]]:
+        return self.environment.concepts[args[0]], args[1:]
+
     @v_args(meta=True)
     def query(self, meta: Meta, args):
         return Query(text=args[0][3:-3])
@@ -600,13 +683,13 @@ class ParseToObjects(Transformer):
             sort_concepts = args[1]
         else:
             sort_concepts = []
-        concept = self.environment.concepts[args[0]]
+        concept = self.concepts[args[0]]
         # sort_concepts_mapped = [self.environment.concepts[x].with_grain(concept.grain) for x in sort_concepts]
         return WindowItem(content=concept, order_by=sort_concepts)
 
     # BEGIN FUNCTIONS
     def expr_reference(self, args) -> Concept:
-        return self.environment.concepts[args[0]]
+        return self.concepts[args[0]]
 
     def expr(self, args):
         if len(args) > 1:
@@ -847,7 +930,10 @@ def parse_text(
     try:
         output = [v for v in parser.transform(PARSER.parse(text)) if v]
     except VisitError as e:
-        if isinstance(e.orig_exc, (UndefinedConceptException, TypeError)):
+        if isinstance(
+            e.orig_exc,
+            (UndefinedConceptException, FrozenEnvironmentException, TypeError),
+        ):
             raise e.orig_exc
         else:
             raise e
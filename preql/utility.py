@@ -1,5 +1,5 @@
 import hashlib
-from typing import List, Any
+from typing import Dict, Hashable, List, Any
 
 INT_HASH_SIZE = 16
 
@@ -20,3 +20,38 @@ def unique(inputs: List, property: str) -> List[Any]:
         dedupe.add(key)
         final.append(input)
     return final
+
+
+class DisjointSet:
+    """Union-find over hashable items, tracking the number of disjoint sets."""
+
+    def __init__(self):
+        self.parents: Dict[Hashable, Hashable] = {}
+        self.sizes: Dict[Hashable, int] = {}
+        self.components = 0
+
+    def add(self, item: Hashable):
+        if item not in self.parents:
+            self.parents[item] = item
+            self.sizes[item] = 1
+            self.components += 1
+
+    def find(self, item: Hashable) -> Hashable:
+        self.add(item)
+        root = item
+        while self.parents[root] != root:
+            root = self.parents[root]
+        # compress the path walked
+        while self.parents[item] != root:
+            self.parents[item], item = root, self.parents[item]
+        return root
+
+    def union(self, left: Hashable, right: Hashable):
+        left, right = self.find(left), self.find(right)
+        if left == right:
+            return
+        if self.sizes[left] < self.sizes[right]:
+            left, right = right, left
+        self.parents[right] = left
+        self.sizes[left] += self.sizes[right]
+        self.components -= 1
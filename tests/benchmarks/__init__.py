@@ -0,0 +1,14 @@
+from os.path import dirname, join
+from timeit import repeat
+
+ROOT = join(dirname(dirname(__file__)), "stack_overflow")
+
+
+def best_rate(func, number: int = 10) -> float:
+    """Operations per second, from the best of a few runs."""
+    return number / min(repeat(func, number=number, repeat=3))
+
+
+def stackoverflow_text() -> str:
+    with open(join(ROOT, "stackoverflow.preql"), "r", encoding="utf-8") as f:
+        return f.read()
@@ -0,0 +1,16 @@
+def pytest_terminal_summary(terminalreporter):
+    """List the measurements benchmarks record with record_property."""
+    reports = [
+        report
+        for report in terminalreporter.stats.get("passed", [])
+        if report.when == "call" and "benchmark" in report.keywords
+    ]
+    if not reports:
+        return
+    terminalreporter.section("benchmarks")
+    for report in reports:
+        terminalreporter.write_line(report.nodeid)
+        for name, value in report.user_properties:
+            if isinstance(value, float):
+                value = f"{value:.1f}"
+            terminalreporter.write_line(f"    {name}: {value}")
@@ -0,0 +1,70 @@
+import pytest
+
+from preql.core.enums import DataType, GraphBackend, Purpose
+from preql.core.models import ColumnAssignment, Concept, Datasource, Environment, Grain
+from preql.core.processing.concept_strategies import get_datasource_by_concept_and_grain
+from preql.core.env_processor import get_graph
+from preql.core.graph_models import concept_to_node, datasource_to_node
+from tests.benchmarks import best_rate
+
+
+def wide_environment(datasource_count: int, backend: GraphBackend) -> Environment:
+    """Many datasources sharing a few keys, each with its own property
+    and a reference to the next key."""
+    env = Environment(graph_backend=backend)
+    keys = [
+        Concept(name=f"key_{idx}", datatype=DataType.INTEGER, purpose=Purpose.KEY)
+        for idx in range(5)
+    ]
+    for key in keys:
+        env.concepts[key.name] = key
+    for idx in range(datasource_count):
+        key = keys[idx % len(keys)]
+        prop = Concept(
+            name=f"property_{idx}",
+            datatype=DataType.STRING,
+            purpose=Purpose.PROPERTY,
+            keys=[key],
+            grain=Grain(components=[key]),
+        )
+        env.concepts[prop.name] = prop
+        env.datasources[f"table_{idx}"] = Datasource(
+            identifier=f"table_{idx}",
+            columns=[
+                ColumnAssignment(alias="id", concept=key),
+                ColumnAssignment(alias="parent_id", concept=keys[(idx + 1) % 5]),
+                ColumnAssignment(alias="value", concept=prop),
+            ],
+            address=f"table_{idx}",
+        )
+    return env
+
+
+@pytest.mark.benchmark
+def test_coverage_scaling(record_property):
+    for count in (10, 50, 200):
+        for backend in GraphBackend:
+            env = wide_environment(count, backend)
+            target = env.concepts[f"property_{count - 1}"]
+            grain = Grain(components=[env.concepts[f"key_{(count - 1) % 5}"]])
+            graph = get_graph(env)
+            sources = [datasource_to_node(d) for d in env.datasources.values()]
+            targets = [concept_to_node(target.with_default_grain())] + [
+                concept_to_node(c) for c in grain.components
+            ]
+
+            # the all_found check strategies run against every datasource
+            def check():
+                for source in sources:
+                    graph.covers(source, targets)
+
+            def plan():
+                get_datasource_by_concept_and_grain(target, grain, env, graph)
+
+            record_property(
+                f"{count} datasources, {backend.value} coverage checks/s",
+                best_rate(check),
+            )
+            record_property(
+                f"{count} datasources, {backend.value} lookups/s", best_rate(plan)
+            )
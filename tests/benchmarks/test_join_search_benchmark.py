@@ -0,0 +1,29 @@
+import pytest
+
+from preql.core.enums import GraphBackend
+from preql.core.env_processor import get_graph
+from preql.core.graph_models import concept_to_node, datasource_to_node
+from tests.benchmarks import best_rate
+from tests.benchmarks.test_coverage_benchmark import wide_environment
+from tests.test_graph_models import brute_force_source
+
+
+@pytest.mark.benchmark
+def test_join_search_scaling(record_property):
+    for count in (10, 50, 200):
+        env = wide_environment(count, GraphBackend.COMPACT)
+        graph = get_graph(env)
+        sources = [datasource_to_node(d) for d in env.datasources.values()]
+        targets = [
+            concept_to_node(env.concepts[name].with_default_grain())
+            for name in ("property_0", f"property_{count - 1}", "key_3")
+        ]
+        assert graph.cheapest_source(sources, targets) == brute_force_source(
+            graph, sources, targets
+        )
+        search = best_rate(lambda: graph.cheapest_source(sources, targets))
+        brute = best_rate(lambda: brute_force_source(graph, sources, targets))
+        record_property(f"{count} datasources, backward searches/s", search)
+        record_property(f"{count} datasources, path per datasource searches/s", brute)
+    # timings are noisy, so only the largest, widest gap is asserted
+    assert search > brute
@@ -0,0 +1,23 @@
+import pytest
+
+from preql.core.models import Environment
+from preql.parser import parse
+from tests.benchmarks import ROOT, best_rate, stackoverflow_text
+
+
+@pytest.mark.benchmark
+def test_namespace_model(record_property):
+    env, _ = parse(stackoverflow_text(), environment=Environment(working_path=ROOT))
+
+    def bind():
+        memo: dict = {}
+        for concept in env.concepts.values():
+            concept.with_namespace("alias", memo)
+        for datasource in env.datasources.values():
+            datasource.with_namespace("alias", memo)
+
+    record_property(
+        f"bindings/s of {len(env.concepts)} concepts and "
+        f"{len(env.datasources)} datasources",
+        best_rate(bind),
+    )
@@ -0,0 +1,57 @@
+import pytest
+
+from preql.core.enums import GraphBackend
+from preql.core.models import Environment
+from preql.core.processing.cache import PlanCache
+from preql.core.processing.context import PlanningContext
+from preql.core.query_processor import process_query
+from preql.parser import parse
+from tests.benchmarks import ROOT, best_rate, stackoverflow_text
+
+QUERY = """
+select
+    tag.name,
+    user.location,
+    question.count
+where
+    user.location = 'Germany'
+order by
+    question.count desc
+limit 10;"""
+
+
+@pytest.mark.benchmark
+def test_graph_backends(record_property):
+    for backend in GraphBackend:
+        env, parsed = parse(
+            stackoverflow_text() + QUERY,
+            environment=Environment(working_path=ROOT, graph_backend=backend),
+        )
+        record_property(
+            f"{backend.value} plans/s",
+            best_rate(lambda: process_query(env, parsed[-1])),
+        )
+
+
+@pytest.mark.benchmark
+def test_planning_context_hit_rate(record_property):
+    env, parsed = parse(
+        stackoverflow_text() + QUERY, environment=Environment(working_path=ROOT)
+    )
+    context = PlanningContext()
+    process_query(env, parsed[-1], context=context)
+    record_property("planning context", str(context))
+    assert context.hits > 0
+
+
+@pytest.mark.benchmark
+def test_plan_cache(record_property):
+    env, parsed = parse(
+        stackoverflow_text() + QUERY, environment=Environment(working_path=ROOT)
+    )
+    cache = PlanCache()
+    planned = best_rate(lambda: process_query(env, parsed[-1]))
+    cached = best_rate(lambda: process_query(env, parsed[-1], cache=cache))
+    record_property("planned plans/s", planned)
+    record_property("cached plans/s", cached)
+    assert cached > planned
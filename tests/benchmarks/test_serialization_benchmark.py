@@ -0,0 +1,40 @@
+import pickle
+
+import pytest
+
+from preql.core.models import Environment, Select
+from preql.core.query_processor import process_query
+from preql.core.serialization import dumps, loads
+from preql.parser import parse
+from tests.benchmarks import ROOT, best_rate, stackoverflow_text
+
+
+@pytest.mark.benchmark
+def test_serialization_against_pickle(record_property):
+    text = stackoverflow_text()
+    text += """
+select
+    tag.name,
+    question.count
+where
+    user.location = 'Germany'
+order by
+    question.count desc
+limit 10;"""
+    env, parsed = parse(text, environment=Environment(working_path=ROOT))
+    select: Select = parsed[-1]
+    processed = process_query(env, select)
+
+    for label, target in [("environment", env), ("processed query", processed)]:
+        compact = dumps(target)
+        plain = pickle.dumps(target, protocol=pickle.HIGHEST_PROTOCOL)
+        record_property(f"{label} compact bytes", len(compact))
+        record_property(f"{label} pickle bytes", len(plain))
+        for name, func in [
+            ("compact dumps", lambda: dumps(target)),
+            ("pickle dumps", lambda: pickle.dumps(target)),
+            ("compact loads", lambda: loads(compact)),
+            ("pickle loads", lambda: pickle.loads(plain)),
+        ]:
+            record_property(f"{label} {name}/s", best_rate(func))
+        assert len(compact) < len(plain)
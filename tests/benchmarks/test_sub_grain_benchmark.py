@@ -0,0 +1,81 @@
+import pytest
+
+from preql.core.enums import DataType, Purpose
+from preql.core.env_processor import get_graph
+from preql.core.models import ColumnAssignment, Concept, Datasource, Environment, Grain
+from preql.core.processing.concept_strategies import (
+    get_datasource_by_concept_and_grain,
+    get_sub_grains,
+)
+from tests.benchmarks import best_rate
+from tests.test_query_processing import every_sub_grain, first_sub_grain_join
+
+
+def wide_grain_environment(width: int):
+    """A fact table over many keys, each with its own dimension table, and
+    a flag only reachable through the last three keys of the grain."""
+    env = Environment()
+    keys = [
+        Concept(name=f"key_{idx}", datatype=DataType.INTEGER, purpose=Purpose.KEY)
+        for idx in range(width)
+    ]
+    for idx, key in enumerate(keys):
+        env.concepts[key.name] = key
+        env.datasources[f"dim_{idx}"] = Datasource(
+            identifier=f"dim_{idx}",
+            columns=[ColumnAssignment(alias="id", concept=key)],
+            address=f"dim_{idx}",
+        )
+    env.datasources["facts"] = Datasource(
+        identifier="facts",
+        columns=[
+            ColumnAssignment(alias=f"key_{idx}", concept=key)
+            for idx, key in enumerate(keys)
+        ],
+        address="facts",
+    )
+    tail = keys[-3:]
+    flag_id = Concept(name="flag_id", datatype=DataType.INTEGER, purpose=Purpose.KEY)
+    flag = Concept(
+        name="flag",
+        datatype=DataType.STRING,
+        purpose=Purpose.PROPERTY,
+        keys=tail,
+        grain=Grain(components=tail),
+    )
+    env.concepts[flag_id.name] = flag_id
+    env.concepts[flag.name] = flag
+    env.datasources["flags"] = Datasource(
+        identifier="flags",
+        columns=[ColumnAssignment(alias="id", concept=flag_id)]
+        + [ColumnAssignment(alias=key.name, concept=key) for key in tail]
+        + [ColumnAssignment(alias="flag", concept=flag)],
+        address="flags",
+        grain=Grain(components=[flag_id]),
+    )
+    return env, flag, Grain(components=keys)
+
+
+@pytest.mark.benchmark
+def test_wide_grain_select(record_property):
+    for width in (4, 6, 8):
+        env, flag, grain = wide_grain_environment(width)
+        g = get_graph(env)
+        resolved = get_datasource_by_concept_and_grain(flag, grain, env)
+        assert [d.identifier for d in resolved.datasources] == ["facts", "flags"]
+
+        def pruned():
+            return first_sub_grain_join(
+                flag, grain, env, g, get_sub_grains(flag, grain, env, g)
+            )
+
+        def exhaustive():
+            return first_sub_grain_join(flag, grain, env, g, every_sub_grain(grain))
+
+        assert pruned().identifier == exhaustive().identifier
+        fast = best_rate(pruned, 3)
+        slow = best_rate(exhaustive, 3)
+        record_property(f"{width} grain keys, pruned/s", fast)
+        record_property(f"{width} grain keys, every combination/s", slow)
+    # timings are noisy, so only the largest, widest gap is asserted
+    assert fast > slow
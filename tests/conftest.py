@@ -1,10 +1,61 @@
 from pytest import fixture
 
-from preql import Environment
+from preql import Environment, parse
 from preql.core.enums import DataType, Purpose, FunctionType
 from preql.core.env_processor import generate_graph
 from preql.core.models import Concept, Datasource, ColumnAssignment, Function, Grain
 
+ORDERS_MODEL = """
+key order_id int;
+key customer_id int;
+key product_id int;
+property order_id.amount float;
+property customer_id.region string;
+property customer_id.age int;
+property product_id.color string;
+metric revenue <- sum(amount);
+metric order_count <- count(order_id);
+metric average_order <- avg(amount);
+
+datasource orders (
+    order_id:order_id,
+    customer_id:customer_id,
+    product_id:product_id,
+    amount:amount,
+    )
+    grain (order_id)
+    address orders
+;
+
+datasource customers (
+    customer_id:customer_id,
+    region:region,
+    age:age,
+    )
+    grain (customer_id)
+    address customers
+;
+
+datasource products (
+    product_id:product_id,
+    color:color,
+    )
+    grain (product_id)
+    address products
+;
+"""
+
+
+@fixture(scope="session")
+def orders_model():
+    yield ORDERS_MODEL
+
+
+@fixture
+def orders_environment():
+    environment, _ = parse(ORDERS_MODEL, environment=Environment())
+    yield environment
+
 
 @fixture(scope="session")
 def test_environment():
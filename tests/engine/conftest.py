@@ -1,5 +1,5 @@
 from os.path import dirname, abspath
-from typing import Generator
+from typing import Callable, Generator, List
 
 from pytest import fixture
 from sqlalchemy.engine import create_engine
@@ -8,6 +8,20 @@ from preql import Executor, Dialects, parse, Environment
 
 ENV_PATH = abspath(__file__)
 
+# order 6 has a customer with no row, order 7 has no customer at all,
+# and customer 5 has no orders
+ORDERS_TABLES = [
+    "CREATE TABLE orders(order_id INTEGER, customer_id INTEGER, "
+    "product_id INTEGER, amount DOUBLE)",
+    "INSERT INTO orders VALUES (1, 1, 1, 10.0), (2, 1, 2, 5.0), (3, 2, 1, 7.0), "
+    "(4, 3, 2, 3.0), (5, 3, 1, 1.0), (6, 4, 1, 2.0), (7, NULL, 2, 4.0)",
+    "CREATE TABLE customers(customer_id INTEGER, region VARCHAR, age INTEGER)",
+    "INSERT INTO customers VALUES (1, 'east', 30), (2, 'west', 40), "
+    "(3, 'east', 50), (5, 'west', 60)",
+    "CREATE TABLE products(product_id INTEGER, color VARCHAR)",
+    "INSERT INTO products VALUES (1, 'red'), (2, 'blue')",
+]
+
 
 @fixture(scope="session")
 def environment():
@@ -58,3 +72,25 @@ def duckdb_engine(duckdb_model) -> Generator[Executor, None, None]:
 @fixture(scope="session")
 def expected_results():
     yield {"total_count": 3}
+
+
+@fixture
+def duckdb_executor() -> Callable[..., Executor]:
+    """Builds an executor over a fresh in-memory database, created by the
+    given statements, for the given model."""
+
+    def build(model: str, tables: List[str], **kwargs) -> Executor:
+        engine = create_engine("duckdb:///:memory:")
+        for statement in tables:
+            engine.execute(statement)
+        environment, _ = parse(model, environment=Environment())
+        return Executor(
+            dialect=Dialects.DUCK_DB, engine=engine, environment=environment, **kwargs
+        )
+
+    return build
+
+
+@fixture
+def orders_executor(orders_model, duckdb_executor) -> Executor:
+    return duckdb_executor(orders_model, ORDERS_TABLES)
@@ -0,0 +1,21 @@
+def test_eager_aggregation_results(orders_executor):
+    for text, expected in [
+        (
+            "select region, revenue, order_count order by region asc;",
+            [("east", 19.0, 4), ("west", 7.0, 1)],
+        ),
+        (
+            "select region, color, revenue, order_count "
+            "order by region asc, color asc;",
+            [
+                ("east", "blue", 8.0, 2),
+                ("east", "red", 11.0, 2),
+                ("west", "red", 7.0, 1),
+                # the null region does not join to its own measures
+                (None, "blue", None, None),
+                (None, "red", None, None),
+            ],
+        ),
+    ]:
+        results = orders_executor.execute_text(text)[0].fetchall()
+        assert [tuple(row) for row in results] == expected
@@ -0,0 +1,17 @@
+def test_limit_pushdown_results(orders_executor):
+    for text, expected in [
+        (
+            "select customer_id, region, revenue order by customer_id desc limit 2;",
+            [(5, "west", None), (3, "east", 4.0)],
+        ),
+        (
+            "select customer_id, region, revenue order by revenue desc limit 1;",
+            [(1, "east", 15.0)],
+        ),
+        (
+            "select order_id, amount order by amount asc limit 2;",
+            [(5, 1.0), (6, 2.0)],
+        ),
+    ]:
+        results = orders_executor.execute_text(text)[0].fetchall()
+        assert [tuple(row) for row in results] == expected
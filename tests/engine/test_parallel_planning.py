@@ -0,0 +1,17 @@
+from tests.engine.conftest import ORDERS_TABLES
+
+
+def test_executor_parallel_planning(orders_model, duckdb_executor):
+    executor = duckdb_executor(orders_model, ORDERS_TABLES, planning_workers=2)
+    results = executor.execute_text(
+        "select region, revenue order by region asc;"
+        "select customer_id, order_count order by customer_id asc;"
+    )
+    # a duckdb connection reads back only its latest result
+    assert len(results) == 2
+    assert [tuple(r) for r in results[1].fetchall()] == [
+        (1, 2),
+        (2, 1),
+        (3, 2),
+        (5, None),
+    ]
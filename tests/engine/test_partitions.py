@@ -0,0 +1,173 @@
+from typing import List
+
+from lark.exceptions import VisitError
+from pytest import raises
+from preql import Environment, parse
+from preql.core.models import Address
+from preql.core.processing.partitions import prune_partitions
+from preql.core.query_processor import process_query
+from preql.dialect.duckdb import DuckDBDialect
+
+MODEL = """
+key order_id int;
+property order_id.order_date date;
+property order_id.amount float;
+metric revenue <- sum(amount);
+
+datasource orders (
+    order_id:order_id,
+    order_date:order_date,
+    amount:amount,
+    )
+    grain (order_id)
+    partition by order_date (
+        '2022-01-01' to '2022-12-31' address orders_2022,
+        '2023-01-01' to '2023-12-31' address orders_2023,
+    )
+;
+"""
+
+
+def partition_tables(datatype: str, partitions) -> List[str]:
+    return [
+        statement
+        for table, rows in partitions
+        for statement in (
+            f"CREATE TABLE {table}(order_id INTEGER, order_date {datatype}, "
+            "amount DOUBLE)",
+            f"INSERT INTO {table} VALUES {rows}",
+        )
+    ]
+
+
+TABLES = partition_tables(
+    "DATE",
+    [
+        ("orders_2022", "(1, '2022-03-01', 10.0), (2, '2022-11-05', 5.0)"),
+        ("orders_2023", "(3, '2023-02-01', 7.0), (4, '2023-06-01', 3.0)"),
+    ],
+)
+
+
+def test_partition_parsing():
+    environment, _ = parse(MODEL, environment=Environment())
+    datasource = environment.datasources["orders"]
+    assert datasource.partition_by.address == "default.order_date"
+    assert [p.address for p in datasource.partitions] == [
+        Address(location="orders_2022"),
+        Address(location="orders_2023"),
+    ]
+    assert datasource.partitions[0].start == "2022-01-01"
+    assert datasource.safe_location == (
+        "(SELECT * FROM orders_2022 UNION ALL SELECT * FROM orders_2023)"
+    )
+    with raises(VisitError):
+        parse(
+            MODEL.replace("partition by order_date", "partition by revenue"),
+            environment=Environment(),
+        )
+
+
+def test_partition_pruning():
+    environment, statements = parse(
+        MODEL
+        + "select order_id where order_date >= '2023-02-01';"
+        + "select order_id where '2022-06-01' > order_date;"
+        + "select order_id where order_date in ('2022-01-05', '2023-01-05');"
+        + "select order_id where order_date = '2024-01-01';"
+        + "select order_id where order_id = 1;",
+        environment=Environment(),
+    )
+    datasource = environment.datasources["orders"]
+    found = [
+        [
+            p.address.location
+            for p in prune_partitions(datasource, [s.where_clause.conditional])
+        ]
+        for s in statements[-5:]
+    ]
+    assert found == [
+        ["orders_2023"],
+        ["orders_2022"],
+        ["orders_2022", "orders_2023"],
+        [],
+        ["orders_2022", "orders_2023"],
+    ]
+
+
+def test_partitioned_queries(duckdb_executor):
+    engine = duckdb_executor(MODEL, TABLES)
+    _, statements = parse(
+        "select order_id, order_date, amount where order_date >= '2023-02-01';",
+        environment=engine.environment,
+    )
+    sql = DuckDBDialect().compile_statement(
+        process_query(engine.environment, statements[-1])
+    )
+    assert "orders_2023 as orders" in sql
+    assert "orders_2022" not in sql
+    for text, expected in [
+        (
+            "select order_id, order_date, amount where order_date >= '2023-02-01' "
+            "order by order_id asc;",
+            [3, 4],
+        ),
+        (
+            "select order_id, order_date, amount where order_date = '2024-01-01';",
+            [],
+        ),
+        ("select order_id, amount order by order_id asc;", [1, 2, 3, 4]),
+    ]:
+        results = engine.execute_text(text)[0].fetchall()
+        assert [row[0] for row in results] == expected
+    assert engine.execute_text("select revenue;")[0].fetchall()[0][0] == 25.0
+
+
+def test_partition_bounds_are_typed(duckdb_executor):
+    model = MODEL.replace("order_date date", "order_date datetime")
+    environment, statements = parse(
+        model
+        + "select order_id where order_date = '2023-12-31 10:00';"
+        + "select order_id where order_date > '2023-12-31 10:00';"
+        + "select order_id where order_date < '2023-01-01 10:00';"
+        + "select order_id where order_date >= '2024-01-01 00:00';"
+        + "select order_id where order_date = 5;"
+        + "select order_id where order_date = 'soon';",
+        environment=Environment(),
+    )
+    datasource = environment.datasources["orders"]
+    found = [
+        [
+            p.address.location
+            for p in prune_partitions(datasource, [s.where_clause.conditional])
+        ]
+        for s in statements[-6:]
+    ]
+    assert found == [
+        # a date bound stands for every time on that day
+        ["orders_2023"],
+        ["orders_2023"],
+        ["orders_2022", "orders_2023"],
+        [],
+        # values that are not datetimes rule nothing out
+        ["orders_2022", "orders_2023"],
+        ["orders_2022", "orders_2023"],
+    ]
+
+    executor = duckdb_executor(
+        model,
+        partition_tables(
+            "TIMESTAMP",
+            [
+                ("orders_2022", "(1, '2022-03-01 08:00', 10.0)"),
+                (
+                    "orders_2023",
+                    "(2, '2023-12-31 09:00', 5.0), (3, '2023-12-31 15:00', 7.0)",
+                ),
+            ],
+        ),
+    )
+    results = executor.execute_text(
+        "select order_id, order_date where order_date > '2023-12-31 10:00';"
+    )
+    assert [row[0] for row in results[0].fetchall()] == [3]
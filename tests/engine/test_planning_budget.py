@@ -0,0 +1,18 @@
+from pytest import raises
+
+from preql.core.exceptions import PlanningBudgetExceeded
+from preql.core.processing.context import PlanningBudget
+from tests.engine.conftest import ORDERS_TABLES
+
+
+def test_executor_budget(orders_model, duckdb_executor):
+    executor = duckdb_executor(
+        orders_model,
+        ORDERS_TABLES,
+        planning_budget=PlanningBudget(timeout=60, max_attempts=1000),
+    )
+    results = executor.execute_text("select region, revenue order by region asc;")
+    assert [tuple(r) for r in results[0].fetchall()] == [("east", 19.0), ("west", 7.0)]
+    executor.planning_budget = PlanningBudget(max_attempts=1)
+    with raises(PlanningBudgetExceeded):
+        executor.execute_text("select region, revenue;")
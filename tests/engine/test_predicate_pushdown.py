@@ -0,0 +1,17 @@
+def test_pushed_filters_keep_results(orders_executor):
+    for text, expected in [
+        ("select region, revenue where region = 'east';", [("east", 19.0)]),
+        (
+            "select region, color, revenue, order_count "
+            "where region = 'east' and color = 'red';",
+            [("east", "red", 11.0, 2)],
+        ),
+        # no single source has both filtered columns
+        (
+            "select product_id, color, customer_id, region, revenue "
+            "where region = 'east' and color = 'red' order by customer_id asc;",
+            [(1, "red", 1, "east", 10.0), (1, "red", 3, "east", 1.0)],
+        ),
+    ]:
+        results = orders_executor.execute_text(text)[0].fetchall()
+        assert [tuple(row) for row in results] == expected
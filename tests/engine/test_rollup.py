@@ -0,0 +1,116 @@
+from preql import Environment, parse
+from preql.core.models import DatasourceStatistics
+from preql.core.query_processor import process_query
+
+CONCEPTS = """
+key sale_id int;
+property sale_id.territory string;
+property sale_id.sale_date date;
+property sale_id.amount float;
+metric total_sales <- sum(amount);
+metric sale_count <- count(sale_id);
+metric max_sale <- max(amount);
+metric avg_sale <- avg(amount);
+
+datasource sales (
+    sale_id:sale_id,
+    territory:territory,
+    sale_date:sale_date,
+    amount:amount,
+    )
+    grain (sale_id)
+    address sales
+;
+"""
+
+ROLLUPS = """
+datasource daily_sales (
+    territory:territory,
+    sale_date:sale_date,
+    total_sales:total_sales,
+    sale_count:sale_count,
+    max_sale:max_sale,
+    )
+    grain (territory, sale_date)
+    address daily_sales
+;
+
+datasource territory_sales (
+    territory:territory,
+    total_sales:total_sales,
+    )
+    grain (territory)
+    address territory_sales
+;
+"""
+
+TABLES = [
+    "CREATE TABLE sales(sale_id INTEGER, territory VARCHAR, sale_date DATE, "
+    "amount DOUBLE)",
+    "INSERT INTO sales VALUES (1, 'north', '2023-01-01', 10.0), "
+    "(2, 'north', '2023-01-01', 5.0), (3, 'north', '2023-01-02', 7.0), "
+    "(4, 'south', '2023-01-01', 3.0)",
+    "CREATE TABLE daily_sales AS SELECT territory, sale_date, "
+    "sum(amount) AS total_sales, count(sale_id) AS sale_count, "
+    "max(amount) AS max_sale FROM sales GROUP BY territory, sale_date",
+    "CREATE TABLE territory_sales AS SELECT territory, "
+    "sum(amount) AS total_sales FROM sales GROUP BY territory",
+]
+
+
+def sources(environment: Environment, text: str, concept: str):
+    _, statements = parse(text, environment=environment)
+    processed = process_query(environment, statements[-1])
+    return [
+        [d.identifier for d in cte.source.datasources]
+        for cte in processed.ctes
+        if concept in [c.address for c in cte.output_columns]
+    ][0]
+
+
+def test_rollup_results_match_raw(duckdb_executor):
+    raw = duckdb_executor(CONCEPTS, TABLES)
+    rolled = duckdb_executor(CONCEPTS + ROLLUPS, TABLES)
+    for text in [
+        "select territory, total_sales, sale_count, max_sale order by territory asc;",
+        "select sale_date, total_sales, sale_count order by sale_date asc;",
+        "select total_sales, sale_count, avg_sale;",
+    ]:
+        expected = [tuple(row) for row in raw.execute_text(text)[0].fetchall()]
+        found = [tuple(row) for row in rolled.execute_text(text)[0].fetchall()]
+        assert found == expected
+
+
+def test_rollup_routing():
+    environment, _ = parse(CONCEPTS + ROLLUPS, environment=Environment())
+    # both rollups can serve a territory grain; without statistics the
+    # coarser one wins
+    assert sources(
+        environment, "select territory, total_sales;", "default.total_sales"
+    ) == ["territory_sales"]
+    # only the daily rollup has the date
+    assert sources(
+        environment, "select sale_date, total_sales;", "default.total_sales"
+    ) == ["daily_sales"]
+    # an average cannot be combined from stored averages
+    assert sources(environment, "select territory, avg_sale;", "default.avg_sale") == [
+        "sales"
+    ]
+
+
+def test_rollup_routing_by_statistics():
+    environment, _ = parse(CONCEPTS + ROLLUPS, environment=Environment())
+    environment.datasources["daily_sales"].statistics = DatasourceStatistics(
+        row_count=10
+    )
+    environment.datasources["territory_sales"].statistics = DatasourceStatistics(
+        row_count=1000
+    )
+    assert sources(
+        environment, "select territory, total_sales;", "default.total_sales"
+    ) == ["daily_sales"]
+    # a raw table no larger than the smallest rollup is read directly
+    environment.datasources["sales"].statistics = DatasourceStatistics(row_count=5)
+    assert sources(
+        environment, "select territory, total_sales;", "default.total_sales"
+    ) == ["sales"]
@@ -0,0 +1,9 @@
+def test_reduced_results(orders_executor):
+    # order 7 has no customer to be kept by the reduction
+    results = orders_executor.execute_text(
+        "select region, color, revenue where region = 'east' order by color asc;"
+    )
+    assert [tuple(r) for r in results[0].fetchall()] == [
+        ("east", "blue", 8.0),
+        ("east", "red", 11.0),
+    ]
@@ -0,0 +1,51 @@
+from preql import Dialects, Environment, Executor, parse
+from preql.core.models import DatasourceStatistics
+from tests.engine.conftest import ORDERS_TABLES
+from tests.test_statistics import MODEL, add_statistics
+
+
+def test_base_choice_keeps_results(orders_model, duckdb_executor):
+    executor = duckdb_executor(orders_model, ORDERS_TABLES)
+    text = "select customer_id, region, order_count order by customer_id asc;"
+    expected = [tuple(r) for r in executor.execute_text(text)[0].fetchall()]
+    assert expected == [
+        (1, "east", 2),
+        (2, "west", 1),
+        (3, "east", 2),
+        (5, "west", None),
+    ]
+    # the orders side is estimated far larger than the customers
+    executor.environment.datasources["orders"].statistics = DatasourceStatistics(
+        row_count=1_000_000, distinct_counts={"customer_id": 1000}
+    )
+    executor.environment.datasources["customers"].statistics = DatasourceStatistics(
+        row_count=10
+    )
+    found = [tuple(r) for r in executor.execute_text(text)[0].fetchall()]
+    assert found == expected
+
+
+def test_join_root_choice_keeps_results(duckdb_executor):
+    executor = duckdb_executor(
+        MODEL,
+        [
+            "CREATE TABLE facts(a_id INTEGER, b_id INTEGER)",
+            "INSERT INTO facts VALUES (1, 10), (2, 20)",
+            "CREATE TABLE a(a_id INTEGER, c_id INTEGER)",
+            "INSERT INTO a VALUES (1, 5), (2, 5)",
+            "CREATE TABLE c(c_id INTEGER, b_id INTEGER)",
+            "INSERT INTO c VALUES (5, 20)",
+            "CREATE TABLE b(b_id INTEGER, name VARCHAR)",
+            "INSERT INTO b VALUES (10, 'x'), (20, 'y')",
+        ],
+    )
+    text = "select b_name, count(a_id)->a_count order by b_name asc;"
+    expected = [tuple(r) for r in executor.execute_text(text)[0].fetchall()]
+    assert expected == [("x", 1), ("y", 1)]
+    environment, _ = parse(MODEL, environment=Environment())
+    add_statistics(environment)
+    executor = Executor(
+        dialect=Dialects.DUCK_DB, engine=executor.engine, environment=environment
+    )
+    found = [tuple(r) for r in executor.execute_text(text)[0].fetchall()]
+    assert found == expected
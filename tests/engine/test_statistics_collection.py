@@ -0,0 +1,121 @@
+import json
+import time
+
+from pytest import fixture, raises
+from sqlalchemy.engine import create_engine
+
+from preql import Dialects, Environment, Executor, parse
+from preql.core.statistics import read_statistics
+
+MODEL = """
+key order_id int;
+key customer_id int;
+property order_id.order_date date;
+property order_id.amount float;
+
+datasource orders (
+    order_id:order_id,
+    customer_id:customer_id,
+    order_date:order_date,
+    amount:amount,
+    )
+    grain (order_id)
+    address orders
+;
+
+datasource customers (
+    customer_id:customer_id,
+    )
+    grain (customer_id)
+    address customers
+;
+"""
+
+
+@fixture
+def executor(tmp_path):
+    # a file database, so every pooled connection sees the same tables
+    engine = create_engine(f"duckdb:///{tmp_path / 'stats.duckdb'}")
+    engine.execute(
+        "CREATE TABLE orders(order_id INTEGER, customer_id INTEGER, "
+        "order_date DATE, amount DOUBLE)"
+    )
+    engine.execute(
+        "INSERT INTO orders VALUES (1, 1, '2023-01-01', 10.0), "
+        "(2, 1, '2023-01-05', 12.0), (3, 2, '2023-02-01', 10.0)"
+    )
+    engine.execute("CREATE TABLE customers(customer_id INTEGER)")
+    engine.execute("INSERT INTO customers VALUES (1), (2)")
+    environment, _ = parse(MODEL, environment=Environment())
+    yield Executor(dialect=Dialects.DUCK_DB, engine=engine, environment=environment)
+    engine.dispose()
+
+
+def test_collect_statistics(executor, tmp_path):
+    path = str(tmp_path / "statistics.json")
+    entries = executor.collect_statistics(path=path)
+
+    orders = entries["orders"].statistics
+    assert orders.row_count == 3
+    assert orders.distinct_counts["customer_id"] == 2
+    assert "order_id" in orders.unique_columns
+    assert "customer_id" not in orders.unique_columns
+    assert orders.ranges["order_date"] == ["2023-01-01", "2023-02-01"]
+    assert entries["customers"].statistics.row_count == 2
+    # applied to the environment, and read back from the file at startup
+    assert executor.environment.datasources["orders"].statistics == orders
+    environment, _ = parse(MODEL, environment=Environment(statistics_path=path))
+    assert environment.datasources["orders"].statistics == read_statistics(path)[
+        "orders"
+    ].statistics
+
+
+def test_collect_statistics_is_incremental(executor, tmp_path):
+    path = str(tmp_path / "statistics.json")
+    first = executor.collect_statistics(path=path)
+    executor.engine.execute("INSERT INTO customers VALUES (3)")
+    second = executor.collect_statistics(path=path)
+    assert second["customers"].collected_at == first["customers"].collected_at
+    assert second["customers"].statistics.row_count == 2
+
+    refreshed = executor.collect_statistics(path=path, refresh=True)
+    assert refreshed["customers"].statistics.row_count == 3
+
+
+def test_collect_statistics_budget(executor, tmp_path):
+    # far too many rows to count distinct values of within the budget
+    executor.engine.execute(
+        "CREATE VIEW slow AS SELECT range AS order_id, 1 AS customer_id, "
+        "DATE '2023-01-01' AS order_date, 1.0 AS amount FROM range(20000000000)"
+    )
+    parse(
+        """datasource slow (
+    order_id:order_id,
+    customer_id:customer_id,
+    order_date:order_date,
+    amount:amount,
+    )
+    grain (order_id)
+    address slow
+;""",
+        environment=executor.environment,
+    )
+    path = str(tmp_path / "statistics.json")
+    started = time.monotonic()
+    entries = executor.collect_statistics(path=path, budget=1.0)
+    # the running query is interrupted, not left to finish
+    assert time.monotonic() - started < 10
+    assert "slow" not in entries
+    assert entries["customers"].statistics.row_count == 2
+    assert executor.engine.execute("SELECT count(*) FROM orders").fetchone()[0] == 3
+
+
+def test_statistics_file_version(tmp_path):
+    path = tmp_path / "statistics.json"
+    path.write_text(json.dumps({"version": 0, "datasources": {}}))
+    with raises(ValueError):
+        read_statistics(str(path))
+    with raises(ValueError):
+        Executor(
+            dialect=Dialects.DUCK_DB, engine=create_engine("duckdb:///:memory:")
+        ).collect_statistics()
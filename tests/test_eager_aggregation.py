@@ -0,0 +1,27 @@
+from preql import Environment, parse
+from preql.core.query_processor import process_query
+
+
+def grouped_sources(environment: Environment, text: str):
+    """The grain of each grouping CTE that reads from another CTE."""
+    _, statements = parse(text, environment=environment)
+    processed = process_query(environment, statements[-1])
+    return [
+        str(cte.grain)
+        for cte in processed.ctes
+        if cte.group_to_grain and cte.parent_ctes
+    ]
+
+
+def test_eager_aggregation_applies(orders_environment):
+    # the orders are summed to their customers before the join to regions
+    assert "Grain<default.customer_id>" in grouped_sources(
+        orders_environment, "select region, revenue;"
+    )
+    assert "Grain<default.customer_id,default.product_id>" in grouped_sources(
+        orders_environment, "select region, color, revenue, order_count;"
+    )
+    # an average cannot be combined from partial averages
+    assert "Grain<default.customer_id>" not in grouped_sources(
+        orders_environment, "select region, average_order;"
+    )
@@ -0,0 +1,251 @@
+from os.path import dirname, join
+
+from pytest import raises
+
+from preql.core.enums import DataType, Purpose, GraphBackend
+from preql.core.env_processor import get_graph
+from preql.core.exceptions import (
+    FrozenEnvironmentException,
+    UndefinedConceptException,
+)
+from preql.core.models import (
+    ColumnAssignment,
+    Concept,
+    Datasource,
+    DatasourceStatistics,
+    Environment,
+    Grain,
+)
+from preql.core.query_processor import process_query
+from preql.core.serialization import dumps, loads
+from preql.dialect.bigquery import BigqueryDialect
+from preql.parser import parse
+from preql.parsing.parse_engine import ParseToObjects
+
+QUERY = """
+select
+    tag.name,
+    question.count
+order by
+    question.count desc
+limit 10;"""
+
+
+def stackoverflow_text() -> str:
+    path = join(dirname(__file__), "stack_overflow")
+    with open(join(path, "stackoverflow.preql"), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def stackoverflow_environment() -> Environment:
+    path = join(dirname(__file__), "stack_overflow")
+    env, _ = parse(stackoverflow_text(), environment=Environment(working_path=path))
+    return env
+
+
+def test_frozen_planning_matches():
+    env = stackoverflow_environment()
+    _, parsed = parse(QUERY, environment=env)
+    generator = BigqueryDialect()
+    expected = generator.compile_statement(process_query(env, parsed[-1]))
+
+    frozen = stackoverflow_environment().freeze()
+    assert frozen.frozen
+    _, parsed = parse(QUERY, environment=frozen)
+    assert generator.compile_statement(process_query(frozen, parsed[-1])) == expected
+
+
+def test_frozen_select_transforms():
+    text = """
+select
+    tag.name,
+    count(question.id)->question_total
+order by
+    question_total desc
+limit 10;"""
+    env = stackoverflow_environment()
+    _, parsed = parse(text, environment=env)
+    generator = BigqueryDialect()
+    expected = generator.compile_statement(process_query(env, parsed[-1]))
+
+    frozen = stackoverflow_environment().freeze()
+    concepts = dict(frozen.concepts)
+    for _ in range(2):
+        # select-local concepts do not change the model, so can be reused
+        _, parsed = parse(text, environment=frozen)
+        found = generator.compile_statement(process_query(frozen, parsed[-1]))
+        assert found == expected
+    assert "question_total" not in frozen.concepts
+    assert dict(frozen.concepts) == concepts
+
+
+def test_frozen_environment_rejects_changes(test_environment):
+    env = loads(dumps(test_environment))
+    assert env.freeze() is env
+    version = env.version
+    concept = env.concepts["order_id"]
+    with raises(FrozenEnvironmentException):
+        env.concepts["new"] = concept
+    with raises(FrozenEnvironmentException):
+        del env.concepts["order_id"]
+    with raises(FrozenEnvironmentException):
+        env.datasources.pop("revenue")
+    with raises(FrozenEnvironmentException):
+        env.namespace = "other"
+    with raises(FrozenEnvironmentException):
+        parse("key new_id int;", environment=env)
+    # as do the concepts and datasources it holds
+    datasource = env.datasources["revenue"]
+    with raises(FrozenEnvironmentException):
+        datasource.statistics = DatasourceStatistics(row_count=10)
+    with raises(FrozenEnvironmentException):
+        concept.grain = Grain()
+    with raises(FrozenEnvironmentException):
+        datasource.columns[0].concept.name = "renamed"
+    # copies can be changed
+    copied = concept.copy()
+    copied.name = "renamed"
+    assert concept.name == "order_id"
+    # the lists inside them are not copied, so are not guarded
+    datasource.partitions.append(None)
+    assert env.version == version
+    datasource.partitions.pop()
+
+
+def test_frozen_environment_round_trip(test_environment):
+    env = loads(dumps(test_environment)).freeze()
+    restored = loads(dumps(env))
+    assert restored.frozen
+    assert set(restored.index.concept_datasources.keys()) == set(
+        env.index.concept_datasources.keys()
+    )
+
+
+def test_freeze_validates_references():
+    env = Environment()
+    order_id = Concept(name="order_id", datatype=DataType.INTEGER, purpose=Purpose.KEY)
+    order_value = Concept(
+        name="order_value",
+        datatype=DataType.FLOAT,
+        purpose=Purpose.PROPERTY,
+        keys=[order_id],
+        grain=Grain(components=[order_id]),
+    )
+    env.concepts["order_value"] = order_value
+    env.datasources["orders"] = Datasource(
+        identifier="orders",
+        columns=[ColumnAssignment(alias="value", concept=order_value)],
+        address="orders",
+    )
+    with raises(UndefinedConceptException):
+        env.freeze()
+    assert not env.frozen
+
+
+def test_namespace_rewrite_shares_nodes():
+    env, _ = parse("""
+key order_id int;
+property order_id.order_text string;
+property order_text_like <- like(order_text, 'a%');
+property order_text_length <- len(order_text);
+""")
+    like = env.concepts["order_text_like"]
+    length = env.concepts["order_text_length"]
+    assert like.with_namespace(like.namespace) is like
+
+    memo: dict = {}
+    namespaced_like = like.with_namespace("orders", memo)
+    namespaced_length = length.with_namespace("orders", memo)
+    assert namespaced_like.address == "orders.order_text_like"
+    assert namespaced_like.lineage.arg_count == 2
+    # nodes seen before in the same rewrite are reused
+    source = like.lineage.arguments[0]
+    assert source.with_namespace("orders", memo) is namespaced_like.lineage.arguments[0]
+    assert namespaced_length.lineage.arguments[0].address == "orders.order_text"
+    assert namespaced_like.lineage.arguments[0].address == "orders.order_text"
+    order_id = env.concepts["order_id"].with_namespace("orders")
+    assert order_id.grain.set == {"orders.order_id"}
+    # the source tree is left untouched
+    assert like.address == "default.order_text_like"
+    assert like.lineage.arguments[0].address == "default.order_text"
+
+
+def test_import_binds_parsed_module(tmp_path):
+    (tmp_path / "user.preql").write_text("key id int;\nproperty id.name string;\n")
+    (tmp_path / "badge.preql").write_text("""import user as user;
+key id int;
+property id.name string;
+datasource badges (
+    id:id,
+    name:name,
+    user_id:user.id,
+    )
+    grain (id)
+    address badges
+;
+""")
+
+    def load(alias: str) -> Environment:
+        env, _ = parse(
+            f"import badge as {alias};",
+            environment=Environment(working_path=str(tmp_path)),
+        )
+        return env
+
+    parser = ParseToObjects(
+        visit_tokens=True,
+        text="",
+        environment=Environment(working_path=str(tmp_path)),
+    )
+    parser.import_statement(["badge", "first"])
+    module = parser.modules[str(tmp_path / "badge.preql")]
+    assert len(parser.modules) == 2
+    parser.import_statement(["badge", "second"])
+    # the module is parsed once and bound under each alias
+    assert parser.modules[str(tmp_path / "badge.preql")] is module
+    rebound = parser.environment
+    first, second = load("first"), load("second")
+    assert dict(rebound.concepts) == {**first.concepts, **second.concepts}
+    assert dict(rebound.datasources) == {**first.datasources, **second.datasources}
+    # nothing is shared with other parses
+    assert first.concepts["first.name"] is not load("first").concepts["first.name"]
+    badges = rebound.datasources["second.badges"]
+    assert badges.namespace == "second"
+    assert [c.concept.address for c in badges.columns] == [
+        "second.id",
+        "second.name",
+        "user.id",
+    ]
+    # concepts the module imported keep their own namespace
+    assert rebound.concepts["second.user.id"].namespace == "user"
+    # the parsed module is left untouched
+    assert module.datasources["badges"].namespace == "first"
+    assert module.concepts["name"].address == "first.name"
+
+    # modules are not kept between parses
+    (tmp_path / "user.preql").write_text("key id int;\nproperty id.email string;\n")
+    assert "third.user.email" in load("third").concepts
+
+
+def test_graph_cached_by_version():
+    env = stackoverflow_environment()
+    env.graph_backend = GraphBackend.NETWORKX
+    _, parsed = parse(QUERY, environment=env)
+    version = env.version
+    graph = get_graph(env)
+    process_query(env, parsed[-1])
+    assert get_graph(env) is graph
+
+    # re-registering the same definitions leaves the version alone
+    _, parsed = parse(QUERY, environment=env)
+    assert env.version == version
+
+    # changes are applied to the cached graph
+    parse("key new_id int;", environment=env)
+    assert env.version > version
+    assert get_graph(env) is graph
+    assert "c~default.new_id@Grain<default.new_id>" in graph.nodes
+
+    env.datasources = dict(env.datasources)
+    assert env.graph_cache is None
+    assert get_graph(env) is not graph
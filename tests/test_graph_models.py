@@ -0,0 +1,133 @@
+import random
+from os.path import dirname, join
+
+import networkx as nx
+import pytest
+
+from preql.core.enums import GraphBackend
+from preql.core.env_processor import generate_graph, get_graph
+from preql.core.graph_models import CompactGraph, ReferenceGraph
+from preql.core.models import Environment
+from preql.parser import parse
+
+
+def stackoverflow_environment() -> Environment:
+    path = join(dirname(__file__), "stack_overflow")
+    with open(join(path, "stackoverflow.preql"), "r", encoding="utf-8") as f:
+        text = f.read()
+    env, _ = parse(text, environment=Environment(working_path=path))
+    return env
+
+
+def assert_equivalent(graph: ReferenceGraph, expected: ReferenceGraph):
+    assert set(graph.nodes) == set(expected.nodes)
+    assert set(graph.edges) == set(expected.edges)
+    for node, attributes in expected.nodes.items():
+        assert graph.nodes[node] == attributes
+        # shortest path ties are broken by adjacency order
+        assert list(graph.successors(node)) == list(expected.successors(node))
+        assert list(graph.predecessors(node)) == list(expected.predecessors(node))
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_incremental_graph_matches_rebuild(seed):
+    source = stackoverflow_environment()
+    concepts = list(source.concepts.items())
+    datasources = list(source.datasources.items())
+    rng = random.Random(seed)
+
+    env = Environment(graph_backend=GraphBackend.NETWORKX)
+    for key, concept in rng.sample(concepts, len(concepts) // 2):
+        env.concepts[key] = concept
+    for key, datasource in rng.sample(datasources, len(datasources) // 2):
+        env.datasources[key] = datasource
+    graph = get_graph(env)
+    assert_equivalent(graph, generate_graph(env))
+
+    for _ in range(40):
+        action = rng.random()
+        if action < 0.3:
+            key, concept = rng.choice(concepts)
+            env.concepts[key] = concept
+        elif action < 0.45:
+            # replace an entry in place with a different definition
+            key = rng.choice(list(env.concepts.keys()))
+            env.concepts[key] = rng.choice(concepts)[1]
+        elif action < 0.6 and env.concepts:
+            env.concepts.pop(rng.choice(list(env.concepts.keys())))
+        elif action < 0.8:
+            key, datasource = rng.choice(datasources)
+            env.datasources[key] = datasource
+        elif env.datasources:
+            del env.datasources[rng.choice(list(env.datasources.keys()))]
+        assert get_graph(env) is graph
+        assert_equivalent(graph, generate_graph(env))
+
+
+def test_compact_graph_paths_match_networkx():
+    reference = generate_graph(stackoverflow_environment())
+    compact = CompactGraph(reference)
+    sources = [n for n in reference.nodes if n.startswith("ds~")]
+    for source in sources:
+        for target in reference.nodes:
+            try:
+                expected = reference.shortest_path(source, target)
+            except nx.NetworkXNoPath:
+                with pytest.raises(nx.NetworkXNoPath):
+                    compact.shortest_path(source, target)
+                continue
+            assert compact.shortest_path(source, target) == expected
+            assert compact.count_datasources(expected) == (
+                reference.count_datasources(expected)
+            )
+        assert list(compact.predecessors(source)) == list(
+            reference.predecessors(source)
+        )
+    with pytest.raises(nx.NodeNotFound):
+        compact.shortest_path(sources[0], "c~missing")
+
+
+@pytest.mark.parametrize("model", ["stackoverflow", "fixture"])
+def test_compact_coverage_matches_paths(model, test_environment):
+    env = stackoverflow_environment() if model == "stackoverflow" else test_environment
+    reference = generate_graph(env)
+    compact = CompactGraph(reference)
+    concepts = [n for n in reference.nodes if n.startswith("c~")]
+    for source in [n for n in reference.nodes if n.startswith("ds~")]:
+        for target in concepts:
+            assert compact.covers(source, [target]) == reference.covers(
+                source, [target]
+            )
+        # answered from the bitsets once every pair is known
+        assert compact.covers(source, concepts) == reference.covers(source, concepts)
+
+
+def brute_force_source(graph, sources, targets):
+    """The original search: every path from every source, stable sort."""
+    candidates = []
+    for idx, source in enumerate(sources):
+        paths = {}
+        for target in targets:
+            try:
+                paths[target] = graph.shortest_path(source, target)
+            except (nx.NetworkXNoPath, nx.NodeNotFound):
+                break
+        else:
+            candidates.append((sum(len(p) for p in paths.values()), idx))
+    return min(candidates)[1] if candidates else None
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_cheapest_source_matches_brute_force(seed):
+    env = stackoverflow_environment()
+    reference = generate_graph(env)
+    compact = CompactGraph(reference)
+    sources = [n for n in reference.nodes if n.startswith("ds~")]
+    concepts = [n for n in reference.nodes if n.startswith("c~")]
+    rng = random.Random(seed)
+    for _ in range(50):
+        targets = rng.sample(concepts, rng.randint(1, 4))
+        order = rng.sample(sources, len(sources))
+        expected = brute_force_source(compact, order, targets)
+        assert reference.cheapest_source(order, targets) == expected
+        assert compact.cheapest_source(order, targets) == expected
@@ -0,0 +1,54 @@
+from dataclasses import replace
+
+from preql import Environment, parse
+from preql.core.models import Grain
+from preql.core.processing.elimination import eliminate_joins, unique_on
+from preql.core.query_processor import process_query
+
+
+def test_join_elimination(orders_model):
+    environment, statements = parse(
+        orders_model
+        + "select customer_id, region, revenue; select customer_id, region;"
+        + "select customer_id, region, revenue order by revenue desc;",
+        environment=Environment(),
+    )
+    with_revenue, without_revenue, ordered = statements[-3:]
+    processed = process_query(environment, with_revenue)
+    assert len(processed.joins) == 1
+    join = processed.joins[0]
+    assert unique_on(join.right_cte, join)
+    ctes = list(processed.ctes)
+    # a join nothing is read from is dropped, with the CTE behind it
+    assert eliminate_joins(without_revenue, processed.base, processed.joins, ctes) == []
+    assert join.right_cte.name not in [cte.name for cte in ctes]
+    assert processed.base.name in [cte.name for cte in ctes]
+    # joins the output or ordering read from are kept
+    for statement in (with_revenue, ordered):
+        ctes = list(processed.ctes)
+        assert eliminate_joins(statement, processed.base, processed.joins, ctes) == [
+            join
+        ]
+        assert len(ctes) == len(processed.ctes)
+
+
+def test_abstract_grain_is_not_unique(orders_model):
+    environment, statements = parse(
+        orders_model
+        + "select customer_id, region, revenue; select customer_id, revenue;",
+        environment=Environment(),
+    )
+    with_region, without_region = statements[-2:]
+    processed = process_query(environment, with_region)
+    join = processed.joins[0]
+    # rows at an abstract grain can repeat any join key
+    ungrouped = replace(join.right_cte, grain=Grain(), group_to_grain=False)
+    abstract = replace(join, right_cte=ungrouped)
+    assert not unique_on(ungrouped, abstract)
+    ctes = [ungrouped if c.name == ungrouped.name else c for c in processed.ctes]
+    assert eliminate_joins(without_region, processed.base, [abstract], ctes) == [
+        abstract
+    ]
+    # an aggregate to the abstract grain is a single row
+    grouped = replace(ungrouped, group_to_grain=True)
+    assert unique_on(grouped, replace(join, right_cte=grouped))
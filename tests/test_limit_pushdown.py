@@ -0,0 +1,32 @@
+from preql import Environment, parse
+from preql.core.query_processor import process_query
+from preql.dialect.bigquery import BigqueryDialect
+from preql.dialect.duckdb import DuckDBDialect
+from preql.dialect.sql_server import SqlServerDialect
+
+
+def compile_text(environment: Environment, text: str, dialect=None) -> str:
+    _, statements = parse(text, environment=environment)
+    dialect = dialect or DuckDBDialect()
+    return dialect.compile_statement(process_query(environment, statements[-1]))
+
+
+def test_limit_pushed_to_base(orders_environment):
+    text = "select customer_id, region, revenue order by customer_id asc limit 2;"
+    duckdb = compile_text(orders_environment, text)
+    assert duckdb.count("LIMIT 2") == 2
+    assert 'customers."customer_id" asc\n\nLIMIT 2)' in duckdb
+    assert (
+        compile_text(orders_environment, text, BigqueryDialect()).count("LIMIT 2") == 2
+    )
+    assert (
+        compile_text(orders_environment, text, SqlServerDialect()).count("TOP 2") == 2
+    )
+    # the ordering comes from a joined CTE, so every base row is needed
+    assert (
+        compile_text(
+            orders_environment,
+            "select customer_id, region, revenue order by revenue desc limit 2;",
+        ).count("LIMIT 2")
+        == 1
+    )
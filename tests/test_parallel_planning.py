@@ -0,0 +1,59 @@
+from pytest import raises
+from preql import Environment, parse
+from preql.core.exceptions import PlanningBudgetExceeded
+from preql.core.processing.cache import PlanCache
+from preql.core.processing.context import PlanningBudget
+from preql.core.processing.profile import StrategyProfile
+from preql.dialect.duckdb import DuckDBDialect
+
+QUERIES = """
+select region, revenue;
+select customer_id, order_count;
+select region, order_count, revenue where region = 'east';
+select order_id, amount;
+select region, revenue;
+"""
+
+
+def test_parallel_plans_match_serial(orders_model):
+    environment, statements = parse(orders_model + QUERIES, environment=Environment())
+    environment.freeze()
+    dialect = DuckDBDialect()
+    serial = dialect.generate_queries(environment, statements)
+    parallel = dialect.generate_queries(environment, statements, workers=2)
+    assert len(parallel) == 5
+    assert [dialect.compile_statement(q) for q in parallel] == [
+        dialect.compile_statement(q) for q in serial
+    ]
+
+
+def test_parallel_cache_and_profile(orders_model):
+    environment, statements = parse(orders_model + QUERIES, environment=Environment())
+    dialect = DuckDBDialect()
+    cache = PlanCache()
+    profile = StrategyProfile()
+    first = dialect.generate_queries(
+        environment, statements, cache=cache, profile=profile, workers=2
+    )
+    # the repeated select is planned once, and handed out as its own copy
+    assert len(cache) == 4
+    assert first[0] is not first[4]
+    assert dialect.compile_statement(first[0]) == dialect.compile_statement(first[4])
+    assert len(profile) > 0
+    second = dialect.generate_queries(environment, statements, cache=cache, workers=2)
+    assert cache.hits == 4
+    assert [dialect.compile_statement(q) for q in second] == [
+        dialect.compile_statement(q) for q in first
+    ]
+
+
+def test_parallel_budget(orders_model):
+    environment, statements = parse(orders_model + QUERIES, environment=Environment())
+    with raises(PlanningBudgetExceeded) as info:
+        DuckDBDialect().generate_queries(
+            environment,
+            statements,
+            budget=PlanningBudget(max_attempts=1),
+            workers=2,
+        )
+    assert len(info.value.attempts) == 2
@@ -0,0 +1,46 @@
+from pytest import raises
+from preql import Environment, parse
+from preql.core.exceptions import PlanningBudgetExceeded
+from preql.core.processing.context import PlanningBudget, PlanningContext
+from preql.core.query_processor import process_query
+
+QUERY = "select region, revenue;"
+
+
+def test_attempts_are_recorded(orders_model):
+    environment, statements = parse(orders_model + QUERY, environment=Environment())
+    context = PlanningContext()
+    process_query(environment, statements[-1], context=context)
+    assert context.attempts > 0
+    # without a budget, attempts are only counted
+    assert context.trail == []
+
+    budgeted = PlanningContext(budget=PlanningBudget(max_attempts=1000))
+    process_query(environment, statements[-1], context=budgeted)
+    assert budgeted.attempts == len(budgeted.trail) == context.attempts
+    assert any(name == "grouped select" for name, _, _ in budgeted.trail)
+
+
+def test_attempt_budget(orders_model):
+    environment, statements = parse(orders_model + QUERY, environment=Environment())
+    with raises(PlanningBudgetExceeded) as info:
+        process_query(
+            environment,
+            statements[-1],
+            context=PlanningContext(budget=PlanningBudget(max_attempts=3)),
+        )
+    error = info.value
+    assert len(error.attempts) == 4
+    assert "exceeded 3 strategy attempts" in str(error)
+    # strategies swallow value errors; a spent budget must not be
+    assert not isinstance(error, ValueError)
+
+
+def test_timeout_budget(orders_model):
+    environment, statements = parse(orders_model + QUERY, environment=Environment())
+    context = PlanningContext(budget=PlanningBudget(timeout=0.0))
+    # as if planning had started long ago
+    context.started = 0.0
+    with raises(PlanningBudgetExceeded) as info:
+        process_query(environment, statements[-1], context=context)
+    assert "planning timeout" in info.value.reason
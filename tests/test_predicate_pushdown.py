@@ -0,0 +1,35 @@
+from preql import Environment, parse
+from preql.core.enums import LogicalOperator
+from preql.core.models import Comparison, Conditional
+from preql.core.processing.predicates import conjuncts, is_pushable
+from preql.core.query_processor import process_query
+from preql.dialect.duckdb import DuckDBDialect
+
+
+def compile_text(environment: Environment, text: str) -> str:
+    _, statements = parse(text, environment=environment)
+    return DuckDBDialect().compile_statement(process_query(environment, statements[-1]))
+
+
+def test_conjuncts(orders_model):
+    _, statements = parse(
+        orders_model + "select region, revenue where region = 'east' and color = 'red' "
+        "and product_id = 1;",
+        environment=Environment(),
+    )
+    conditional = statements[-1].where_clause.conditional
+    assert isinstance(conditional, Conditional)
+    assert conditional.operator == LogicalOperator.AND
+    parts = conjuncts(conditional)
+    assert len(parts) == 3
+    assert all(isinstance(part, Comparison) for part in parts)
+    assert all(is_pushable(part) for part in parts)
+
+
+def test_filters_pushed_to_sources(orders_environment):
+    sql = compile_text(
+        orders_environment,
+        "select region, color, revenue where region = 'east' and color = 'red';",
+    )
+    assert "customers.\"region\" = 'east'" in sql
+    assert "products.\"color\" = 'red'" in sql
@@ -1,10 +1,21 @@
+import random
+from itertools import combinations
+
+import pytest
+
+from preql.core.env_processor import get_graph
 from preql.core.models import Select, Grain, QueryDatasource, CTE
+from preql.core.processing.concept_strategies import (
+    get_datasource_by_joins,
+    get_sub_grains,
+)
 from preql.core.query_processor import (
     get_datasource_by_concept_and_grain,
     datasource_to_ctes,
     get_query_datasources,
     process_query,
 )
+from preql.utility import unique
 
 
 def test_select_output(test_environment, test_environment_graph):
@@ -163,3 +174,214 @@ def test_full_query(test_environment, test_environment_graph):
         "category_name",
         "total_revenue",
     }
+
+
+def test_planning_context_reuses_resolutions(test_environment):
+    from preql.core.processing.context import PlanningContext
+    from preql.dialect.bigquery import BigqueryDialect
+
+    select = Select(
+        selection=[
+            test_environment.concepts["category_id"],
+            test_environment.concepts["category_name"],
+            test_environment.concepts["total_revenue"],
+        ]
+    )
+    context = PlanningContext()
+    processed = process_query(
+        statement=select, environment=test_environment, context=context
+    )
+    assert context.hits > 0
+    assert 0 < context.hit_rate < 1
+    assert context.lookups == context.hits + context.misses
+
+    generator = BigqueryDialect()
+    expected = generator.compile_statement(
+        process_query(statement=select, environment=test_environment)
+    )
+    assert generator.compile_statement(processed) == expected
+
+
+def test_plan_cache():
+    from dataclasses import replace
+
+    from preql.core.enums import JoinType
+    from preql.core.processing.cache import PlanCache
+    from preql.dialect.bigquery import BigqueryDialect
+    from preql.parser import parse
+    from tests.test_environment import stackoverflow_environment
+
+    env = stackoverflow_environment()
+    query = """
+select
+    tag.name,
+    user.location,
+    question.count
+order by
+    question.count desc
+limit {limit};"""
+    _, parsed = parse(query.format(limit=10), environment=env)
+    cache = PlanCache(size=1)
+    processed = process_query(env, parsed[-1], cache=cache)
+    generator = BigqueryDialect()
+    sql = generator.compile_statement(processed)
+
+    _, parsed = parse(query.format(limit=10), environment=env)
+    hit = process_query(env, parsed[-1], cache=cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert hit is not processed
+    assert generator.compile_statement(hit) == sql
+
+    # changes to a plan handed out never reach the cache
+    for cte in hit.ctes:
+        cte.parent_ctes.clear()
+        cte.source_map.clear()
+    hit.joins[0].jointype = JoinType.FULL
+    hit.ctes.pop()
+    again = process_query(env, parsed[-1], cache=cache)
+    assert generator.compile_statement(again) == sql
+    assert generator.compile_statement(processed) == sql
+
+    # rendering at a wider grain turns the join into a full join,
+    # without changing the cached plan
+    join_types = [join.jointype for join in processed.joins]
+    wider = replace(
+        processed,
+        grain=Grain(components=processed.grain.components + [env.concepts["user.id"]]),
+    )
+    assert "FULL JOIN" in generator.compile_statement(wider)
+    assert [join.jointype for join in processed.joins] == join_types
+    assert generator.compile_statement(processed) == sql
+
+    # a different statement evicts the oldest plan
+    _, parsed = parse(query.format(limit=5), environment=env)
+    process_query(env, parsed[-1], cache=cache)
+    assert (len(cache), cache.evictions, cache.misses) == (1, 1, 2)
+
+    # as does any change to the environment
+    parse("key new_id int;", environment=env)
+    process_query(env, parsed[-1], cache=cache)
+    assert cache.misses == 3
+
+
+def first_sub_grain_join(concept, grain, environment, g, grains):
+    for ngrain in grains:
+        try:
+            return get_datasource_by_joins(
+                concept.with_grain(ngrain), grain, environment, g
+            )
+        except ValueError:
+            continue
+    return None
+
+
+def every_sub_grain(grain: Grain):
+    return [
+        Grain(components=list(combo))
+        for x in range(1, len(grain.components))
+        for combo in combinations(grain.components, x)
+    ]
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_sub_grains_match_every_combination(seed):
+    from preql.core.enums import Purpose
+    from tests.test_environment import stackoverflow_environment
+
+    env = stackoverflow_environment()
+    g = get_graph(env)
+    rng = random.Random(seed)
+    concepts = list(env.concepts.values())
+    grain_concepts = [
+        c for c in concepts if c.purpose in (Purpose.KEY, Purpose.PROPERTY)
+    ]
+    for _ in range(15):
+        concept = rng.choice(concepts)
+        # the grain of the concept itself is one of the possible sub-grains
+        components = unique(
+            concept.with_default_grain().grain.components
+            + rng.sample(grain_concepts, rng.randint(1, 3)),
+            "address",
+        )
+        rng.shuffle(components)
+        grain = Grain(components=components)
+        expected = first_sub_grain_join(concept, grain, env, g, every_sub_grain(grain))
+        found = first_sub_grain_join(
+            concept, grain, env, g, get_sub_grains(concept, grain, env, g)
+        )
+        if expected is None:
+            assert found is None
+        else:
+            assert found.identifier == expected.identifier
+            assert found.output_concepts == expected.output_concepts
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_disconnected_components_match_networkx(seed):
+    import networkx as nx
+
+    from preql.core.enums import DataType, Purpose
+    from preql.core.models import Concept
+    from preql.core.query_processor import get_disconnected_components
+
+    rng = random.Random(seed)
+    concepts = [
+        Concept(name=f"c{idx}", datatype=DataType.INTEGER, purpose=Purpose.KEY)
+        for idx in range(12)
+    ]
+    concept_map = {
+        f"ds{idx}": rng.sample(concepts, rng.randint(0, 3)) for idx in range(10)
+    }
+    graph = nx.Graph()
+    for datasource, members in concept_map.items():
+        graph.add_node(datasource)
+        for concept in members:
+            graph.add_edge(datasource, concept.address)
+    expected = nx.number_connected_components(graph)
+    assert get_disconnected_components(concept_map) == expected
+
+
+def test_equivalent_ctes_are_unified(test_environment, test_environment_graph):
+    from dataclasses import replace
+
+    from preql.core.models import merge_ctes, unify_ctes
+
+    select = Select(
+        selection=[
+            test_environment.concepts["category_id"],
+            test_environment.concepts["total_revenue"],
+        ]
+    )
+    _, datasources = get_query_datasources(
+        environment=test_environment, graph=test_environment_graph, statement=select
+    )
+    joined = datasources["products_revenue_at_default_category_id"]
+    ctes = merge_ctes(datasource_to_ctes(joined))
+    top = ctes[-1]
+    category = [c for c in top.output_columns if c.name == "category_id"]
+    # the same rows under another name, with fewer columns, and a CTE reading it
+    twin = replace(top, name=f"{top.name}_twin", output_columns=category)
+    reader = replace(
+        top,
+        name="cte_reader",
+        parent_ctes=[twin],
+        joins=[],
+        source_map={c.address: twin.name for c in category},
+        output_columns=category,
+    )
+    unified = unify_ctes(ctes + [twin, reader])
+    assert [cte.name for cte in unified] == [cte.name for cte in ctes] + ["cte_reader"]
+    assert set(c.name for c in top.output_columns) == {"total_revenue", "category_id"}
+    assert reader.parent_ctes == [top]
+    assert set(reader.source_map.values()) == {top.name}
+
+    # a column read from elsewhere is a different result
+    other = replace(
+        top,
+        name=f"{top.name}_other",
+        source_map={**top.source_map, "default.category_id": "cte_elsewhere"},
+    )
+    assert len(unify_ctes(ctes + [other])) == len(ctes) + 1
+    # and so is a different grain
+    coarser = replace(top, name=f"{top.name}_coarser", grain=Grain())
+    assert len(unify_ctes(ctes + [coarser])) == len(ctes) + 1
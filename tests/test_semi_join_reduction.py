@@ -0,0 +1,51 @@
+from preql import parse
+from preql.core.models import DatasourceStatistics
+from preql.core.query_processor import process_query
+from preql.dialect.duckdb import DuckDBDialect
+
+SEMI_JOIN = 'orders."customer_id" IN (SELECT'
+
+
+def compile_sql(environment, text) -> str:
+    _, statements = parse(text, environment=environment)
+    return DuckDBDialect().compile_statement(process_query(environment, statements[-1]))
+
+
+def test_fact_restricted_to_filtered_keys(orders_environment):
+    sql = compile_sql(
+        orders_environment, "select region, color, revenue where region = 'east';"
+    )
+    assert SEMI_JOIN in sql
+    # the dimension is defined before the facts that read it
+    assert sql.index("customers as customers") < sql.index(SEMI_JOIN)
+    # without statistics, only equality filters are taken to be selective
+    sql = compile_sql(orders_environment, "select age, color, revenue where age > 30;")
+    assert SEMI_JOIN not in sql
+
+
+def test_reduction_chosen_by_statistics(orders_environment):
+    customers = orders_environment.datasources["customers"]
+    customers.statistics = DatasourceStatistics(
+        row_count=1000, distinct_counts={"region": 2}, ranges={"age": [18, 90]}
+    )
+    sql = compile_sql(
+        orders_environment, "select region, color, revenue where region = 'east';"
+    )
+    assert SEMI_JOIN in sql
+    customers.statistics = DatasourceStatistics(
+        row_count=1000, distinct_counts={"region": 1}, ranges={"age": [18, 90]}
+    )
+    sql = compile_sql(
+        orders_environment, "select region, color, revenue where region = 'east';"
+    )
+    assert SEMI_JOIN not in sql
+    sql = compile_sql(orders_environment, "select age, color, revenue where age > 80;")
+    assert SEMI_JOIN in sql
+    sql = compile_sql(orders_environment, "select age, color, revenue where age > 30;")
+    assert SEMI_JOIN not in sql
+    # keeping more keys than there are facts is no reduction
+    orders_environment.datasources["orders"].statistics = DatasourceStatistics(
+        row_count=10
+    )
+    sql = compile_sql(orders_environment, "select age, color, revenue where age > 80;")
+    assert SEMI_JOIN not in sql
@@ -0,0 +1,98 @@
+from os.path import dirname, join
+
+from pytest import raises
+
+from preql.core.models import Environment, Select, ProcessedQuery
+from preql.core.query_processor import process_query
+from preql.core.serialization import dumps, loads, FORMAT_VERSION
+from preql.dialect.bigquery import BigqueryDialect
+from preql.parser import parse
+
+
+def test_environment_round_trip(test_environment):
+    restored = loads(dumps(test_environment))
+    assert isinstance(restored, Environment)
+    assert set(restored.concepts.keys()) == set(test_environment.concepts.keys())
+    assert set(restored.datasources.keys()) == set(
+        test_environment.datasources.keys()
+    )
+    for key, concept in test_environment.concepts.items():
+        assert restored.concepts[key] == concept
+        assert restored.concepts[key].lineage == concept.lineage
+    for key, datasource in test_environment.datasources.items():
+        assert restored.datasources[key].grain == datasource.grain
+        assert [c.alias for c in restored.datasources[key].columns] == [
+            c.alias for c in datasource.columns
+        ]
+
+
+def test_interned_concepts_are_shared(test_environment):
+    concept = test_environment.concepts["category_name"]
+    first = concept.with_grain(concept.grain)
+    second = concept.with_grain(concept.grain)
+    assert first is not second
+    left, right = loads(dumps([first, second]))
+    assert left is right
+
+
+def test_processed_query_round_trip(test_environment):
+    select = Select(
+        selection=[
+            test_environment.concepts["category_id"],
+            test_environment.concepts["category_name"],
+            test_environment.concepts["total_revenue"],
+        ]
+    )
+    processed = process_query(statement=select, environment=test_environment)
+    restored = loads(dumps(processed))
+    assert isinstance(restored, ProcessedQuery)
+    generator = BigqueryDialect()
+    assert generator.compile_statement(restored) == generator.compile_statement(
+        processed
+    )
+
+
+def test_self_referencing_source_map():
+    # window functions and aggregates of aggregates produce query datasources
+    # whose source map includes the datasource itself
+    from tests.complex.conftest import DECLARATIONS
+
+    env, parsed = parse(DECLARATIONS)
+    generator = BigqueryDialect()
+    for statement in parsed:
+        if not isinstance(statement, Select):
+            continue
+        processed = process_query(statement=statement, environment=env)
+        restored = loads(dumps(processed))
+        assert generator.compile_statement(
+            restored
+        ) == generator.compile_statement(processed)
+
+
+def test_planning_on_restored_environment():
+    path = join(dirname(__file__), "stack_overflow")
+    with open(join(path, "stackoverflow.preql"), "r", encoding="utf-8") as f:
+        text = f.read()
+    text += """
+select
+    tag.name,
+    question.count
+order by
+    question.count desc
+limit 10;"""
+    env, parsed = parse(text, environment=Environment(working_path=path))
+    restored_env = loads(dumps(env))
+    restored_select = loads(dumps(parsed[-1]))
+    generator = BigqueryDialect()
+    assert generator.compile_statement(
+        process_query(restored_env, restored_select)
+    ) == generator.compile_statement(process_query(env, parsed[-1]))
+
+
+def test_version_check(test_environment):
+    payload = bytearray(dumps(test_environment))
+    payload[4] = FORMAT_VERSION + 1
+    with raises(ValueError):
+        loads(bytes(payload))
+    with raises(ValueError):
+        loads(b"not a payload")
@@ -0,0 +1,144 @@
+from preql.core.env_processor import get_graph
+from preql.core.models import DatasourceStatistics, Environment, Grain
+from preql.core.processing.concept_strategies import get_datasource_by_joins
+from preql.core.processing.cost import distinct_count, join_cost
+from preql.parser import parse
+
+MODEL = """
+key a_id int;
+key b_id int;
+key c_id int;
+property b_id.b_name string;
+
+datasource facts (
+    a_id: a_id,
+    b_id: b_id,
+    )
+    grain (a_id, b_id)
+    address facts;
+
+datasource a (
+    a_id: a_id,
+    c_id: c_id,
+    )
+    grain (a_id)
+    address a;
+
+datasource c (
+    c_id: c_id,
+    b_id: b_id,
+    )
+    grain (c_id)
+    address c;
+
+datasource b (
+    b_id: b_id,
+    name: b_name,
+    )
+    grain (b_id)
+    address b;
+"""
+
+
+def add_statistics(env):
+    env.datasources["facts"].statistics = DatasourceStatistics(
+        row_count=2_000_000_000, distinct_counts={"a_id": 1000, "b_id": 100}
+    )
+    env.datasources["a"].statistics = DatasourceStatistics(row_count=1000)
+    env.datasources["c"].statistics = DatasourceStatistics(
+        row_count=500, distinct_counts={"b_id": 100}
+    )
+    env.datasources["b"].statistics = DatasourceStatistics(row_count=100)
+
+
+def join_sources(env):
+    grain = Grain(components=[env.concepts["a_id"]])
+    datasource = get_datasource_by_joins(
+        env.concepts["b_name"], grain, env, get_graph(env)
+    )
+    return [d.identifier for d in datasource.datasources]
+
+
+def test_join_root_by_path_length_without_statistics():
+    env, _ = parse(MODEL)
+    assert join_sources(env) == ["b", "facts"]
+
+
+def test_join_root_by_estimated_cost():
+    env, _ = parse(MODEL)
+    add_statistics(env)
+    # the dimension path is cheaper, but relates a_id to b_id through c_id
+    assert join_sources(env) == ["b", "facts"]
+
+    env, _ = parse(MODEL + """
+datasource links (
+    a_id: a_id,
+    b_id: b_id,
+    )
+    grain (a_id, b_id)
+    address links;
+""")
+    add_statistics(env)
+    env.datasources["links"].statistics = DatasourceStatistics(
+        row_count=1000, distinct_counts={"a_id": 1000, "b_id": 100}
+    )
+    # of roots joining on the same keys, the cheapest wins
+    assert join_sources(env) == ["b", "links"]
+
+
+def test_cardinality_estimates():
+    env, _ = parse(MODEL)
+    add_statistics(env)
+    facts = env.datasources["facts"]
+    b = env.datasources["b"]
+    # keys making up the grain are unique
+    assert distinct_count(b, [env.concepts["b_id"]]) == 100
+    assert distinct_count(facts, [env.concepts["b_id"]]) == 100
+    assert distinct_count(env.datasources["a"], [env.concepts["c_id"]]) == 1000
+    assert join_cost(b, []) == 100
+
+    # missing statistics on any datasource leave the estimate unknown
+    env.datasources["b"].statistics = None
+    assert distinct_count(b, [env.concepts["b_id"]]) is None
+    assert join_cost(b, []) is None
+
+
+def test_statistics_do_not_change_identity():
+    env, _ = parse(MODEL)
+    before = env.datasources["a"]
+    after, _ = parse(MODEL)
+    add_statistics(after)
+    assert after.datasources["a"] == before
+    namespaced = after.datasources["a"].with_namespace("other")
+    assert namespaced.statistics is after.datasources["a"].statistics
+
+
+def test_loaded_statistics_per_environment():
+    env = Environment()
+    env.datasources.statistics["orders"] = "loaded"
+    assert Environment().datasources.statistics == {}
+
+
+def test_base_cte_keeps_the_query_rows():
+    from preql.core.models import QueryDatasource
+    from preql.core.processing.cost import choose_base_cte
+    from preql.core.query_processor import datasource_to_ctes
+
+    env, _ = parse(MODEL)
+    ctes = []
+    for name in ("b", "facts"):
+        datasource = env.datasources[name]
+        ctes += datasource_to_ctes(
+            QueryDatasource(
+                input_concepts=datasource.concepts,
+                output_concepts=datasource.concepts,
+                source_map={c.address: {datasource} for c in datasource.concepts},
+                datasources=[datasource],
+                grain=datasource.grain,
+                joins=[],
+            )
+        )
+    assert choose_base_cte(ctes) is ctes[0]
+    # the candidates hold different rows, so statistics cannot pick the base
+    add_statistics(env)
+    assert choose_base_cte(ctes) is ctes[0]
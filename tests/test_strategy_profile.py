@@ -0,0 +1,96 @@
+from pytest import raises
+
+from preql import Environment, parse
+from preql.core.models import DatasourceStatistics
+from preql.core.processing.context import PlanningContext
+from preql.core.processing.profile import StrategyProfile
+from preql.core.query_processor import process_query
+from preql.dialect.duckdb import DuckDBDialect
+
+QUERIES = [
+    "select region, revenue;",
+    "select region, color, revenue, order_count;",
+    "select customer_id, region, order_count;",
+    "select region, color, revenue where region = 'east';",
+]
+
+
+def plan(environment, text, profile=None):
+    _, statements = parse(text, environment=environment)
+    context = PlanningContext(profile=profile)
+    processed = process_query(environment, statements[-1], context=context)
+    return DuckDBDialect().compile_statement(processed), context
+
+
+def test_profiled_plans_are_identical(orders_model):
+    environment, _ = parse(orders_model, environment=Environment())
+    profile = StrategyProfile()
+    for text in QUERIES:
+        expected, unprofiled = plan(environment, text)
+        learning, _ = plan(environment, text, profile)
+        learned, profiled = plan(environment, text, profile)
+        assert expected == learning == learned
+        assert profiled.attempts <= unprofiled.attempts
+    assert len(profile) > 0
+    assert profile.hits > 0
+
+
+def test_profile_skips_failing_strategies(orders_model):
+    environment, _ = parse(orders_model, environment=Environment())
+    profile = StrategyProfile()
+    _, unprofiled = plan(environment, QUERIES[1])
+    plan(environment, QUERIES[1], profile)
+    _, profiled = plan(environment, QUERIES[1], profile)
+    assert profiled.attempts < unprofiled.attempts
+
+
+def test_profile_scope_follows_environment(orders_model):
+    environment, _ = parse(orders_model, environment=Environment())
+    profile = StrategyProfile()
+    scope = profile.scope(environment)
+    assert profile.scope(environment) == scope
+    environment.datasources["orders"].statistics = DatasourceStatistics(row_count=1000)
+    assert profile.scope(environment) != scope
+    other, _ = parse(
+        orders_model + "property order_id.note string;", environment=Environment()
+    )
+    assert profile.scope(other) != profile.scope(environment)
+
+
+def test_profile_keys_on_lineage(orders_model):
+    # selects on a frozen environment define concepts with the same address
+    environment, _ = parse(orders_model, environment=Environment())
+    environment.freeze()
+    profile = StrategyProfile()
+    first = "select customer_id, len(color) -> label;"
+    second = "select customer_id, len(region) -> label;"
+    expected, _ = plan(environment, second)
+    plan(environment, first, profile)
+    found, _ = plan(environment, second, profile)
+    assert found == expected
+    for text in QUERIES:
+        expected, _ = plan(environment, text)
+        found, _ = plan(environment, text, profile)
+        assert found == expected
+
+
+def test_profile_round_trip(orders_model, tmp_path):
+    environment, _ = parse(orders_model, environment=Environment())
+    profile = StrategyProfile()
+    for text in QUERIES:
+        plan(environment, text, profile)
+    path = str(tmp_path / "profile.json")
+    profile.save(path)
+    loaded = StrategyProfile.load(path)
+    assert loaded.winners == profile.winners
+    # a fresh environment from the same model is recorded under the same scope
+    environment, _ = parse(orders_model, environment=Environment())
+    for text in QUERIES:
+        expected, _ = plan(environment, text)
+        found, _ = plan(environment, text, loaded)
+        assert found == expected
+    assert loaded.misses == 0
+    with open(path, "w") as f:
+        f.write('{"version": 0, "winners": {}}')
+    with raises(ValueError):
+        StrategyProfile.load(path)